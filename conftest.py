@@ -0,0 +1,16 @@
+"""
+pytest 配置
+
+把项目根目录的上一级加入 sys.path，使 planner 包可以直接导入
+（在收集测试模块之前执行，各测试文件不再需要自行处理路径）。
+"""
+
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# 按顺序传递中间结果、以打印为主的脚本，直接运行而不作为测试收集
+collect_ignore = ["test_framework.py", "test_imports.py", "verify_setup.py"]
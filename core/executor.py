@@ -4,13 +4,27 @@ Pipeline 执行器和评估器
 提供 pipeline 执行和精度评估的接口。
 """
 
-from typing import Callable, Any, Dict, List
+from typing import Awaitable, Callable, Any, Dict, List, Optional, Tuple, Union
 from abc import ABC, abstractmethod
-from planner.core.pipeline import Pipeline, Operation
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from planner.core.pipeline import Pipeline, Operation, op_type_id
 from planner.core.node import ExecutionMetrics
+import asyncio
+import copy
+import random
+import threading
 import time
 
 
+# 调用 LLM 的操作类型
+_LLM_OP_TYPES = frozenset(("map", "filter"))
+_LLM_OP_TYPE_IDS = frozenset(op_type_id(t) for t in _LLM_OP_TYPES)
+_TRANSFORM_OP_TYPE_ID = op_type_id("transform")
+
+# MockExecutor 每次预取的随机扰动组数
+_JITTER_BUFFER_SIZE = 1 << 12
+
+
 class PipelineExecutor(ABC):
     """
     Pipeline 执行器基类。
@@ -41,6 +55,51 @@ class PipelineExecutor(ABC):
             执行指标
         """
         pass
+    
+    def reseed(self, seed: Optional[int] = None):
+        """
+        重新播种执行器内部的随机数生成器（默认无操作）。
+        
+        Args:
+            seed: 随机种子（None 表示使用系统熵）
+        """
+    
+    def fork_for_thread(self) -> "PipelineExecutor":
+        """
+        创建供工作线程使用的副本（默认 deepcopy）。
+        
+        执行器在 execute 和 get_metrics 之间保存了最近一次执行的状态，
+        不能在线程间共享。持有客户端、缓存等可共享资源的子类可以覆盖此方法，
+        只复制每次执行的状态。
+        
+        Returns:
+            执行器副本
+        """
+        return copy.deepcopy(self)
+    
+    def execute_many(
+        self,
+        pipelines: List[Pipeline],
+        input_data: Any = None
+    ) -> List[Union[Tuple[Any, ExecutionMetrics], Exception]]:
+        """
+        批量执行多个 pipeline（默认逐个执行，子类可据此合并请求或复用中间结果）。
+        
+        Args:
+            pipelines: Pipeline 配置列表
+            input_data: 输入数据（所有 pipeline 共用）
+        
+        Returns:
+            与 pipelines 一一对应的 (输出数据, 执行指标)；执行失败的位置为异常对象
+        """
+        results: List[Union[Tuple[Any, ExecutionMetrics], Exception]] = []
+        for pipeline in pipelines:
+            try:
+                output = self.execute(pipeline, input_data)
+                results.append((output, self.get_metrics()))
+            except Exception as e:
+                results.append(e)
+        return results
 
 
 class MockExecutor(PipelineExecutor):
@@ -50,8 +109,13 @@ class MockExecutor(PipelineExecutor):
     根据 pipeline 配置模拟执行并生成指标。
     """
     
-    def __init__(self):
-        """初始化模拟执行器"""
+    def __init__(self, seed: Optional[int] = None):
+        """
+        初始化模拟执行器。
+        
+        Args:
+            seed: 扰动随机数的种子（None 表示使用系统熵）
+        """
         self.last_metrics: Optional[ExecutionMetrics] = None
         
         # 模型成本配置（每 1000 tokens 的价格）
@@ -71,60 +135,139 @@ class MockExecutor(PipelineExecutor):
             "gpt-3.5-turbo": 0.80,
             "rule_based": 0.70,
         }
+        
+        # 默认值（未配置的算子）
+        self.default_cost = 0.001
+        self.default_accuracy = 0.75
+        
+        # 按 pipeline 结构生成的评分函数：(操作类型, 提示词长度) -> score(operations)
+        self._specialized: Dict[Tuple, Callable[[List[Operation]], Tuple[int, float, float]]] = {}
+        
+        # 预取的随机数缓冲区（精度扰动和时间扰动交替存放），首次执行时填充。
+        # 使用私有的生成器，不消耗 MCTS 动作选择和模拟所用的全局随机数序列
+        self._rng = random.Random(seed)
+        self._jitter_buf: List[float] = []
+        self._buf_idx = 0
     
-    def execute(self, pipeline: Pipeline, input_data: Any = None) -> Any:
+    def __getstate__(self) -> Dict[str, Any]:
         """
-        模拟执行 pipeline。
+        序列化状态。
+        
+        生成的评分函数不可 pickle，在工作进程中重新生成；
+        随机数缓冲区也不传递，生成器重新用系统熵播种，避免各进程使用相同的扰动序列
+        （需要可复现时在工作进程中调用 reseed）。
+        """
+        state = self.__dict__.copy()
+        state["_specialized"] = {}
+        state["_rng"] = random.Random()
+        state["_jitter_buf"] = []
+        state["_buf_idx"] = 0
+        return state
+    
+    def reseed(self, seed: Optional[int] = None):
+        """
+        重新播种扰动随机数，并丢弃已预取的缓冲区。
+        
+        Args:
+            seed: 随机种子（None 表示使用系统熵）
+        """
+        self._rng.seed(seed)
+        self._jitter_buf = []
+        self._buf_idx = 0
+    
+    def _refill_jitter(self):
+        """从私有随机数生成器批量预取一段随机数"""
+        rand = self._rng.random
+        self._jitter_buf = [rand() for _ in range(2 * _JITTER_BUFFER_SIZE)]
+        self._buf_idx = 0
+    
+    def _operator_profile(self, operator: str):
+        """返回算子的 (每 token 成本, 基准精度)"""
+        return (
+            self.model_costs.get(operator, self.default_cost) / 1000.0,
+            self.model_accuracy.get(operator, self.default_accuracy)
+        )
+    
+    def specialize(self, pipeline: Pipeline) -> Callable[[List[Operation]], Tuple[int, float, float]]:
+        """
+        为 pipeline 的结构生成专用的评分函数。
+        
+        MCTS 搜索过程中所有候选 pipeline 的结构（操作类型、提示词长度）相同，
+        只有 selected_operator 不同。这里把结构展开成直线代码：总 tokens 折叠为常量，
+        非 LLM 操作的分支被消除，只保留按所选算子查成本和精度的部分。
+        生成的函数按结构缓存，execute 自动使用。
         
         Args:
             pipeline: Pipeline 配置
-            input_data: 输入数据（未使用）
         
         Returns:
-            模拟输出
+            score(operations) -> (总 tokens, 总成本, 平均精度（未加随机扰动）)
         """
-        start_time = time.time()
+        soa = pipeline.soa
         
         total_tokens = 0
-        total_cost = 0.0
-        accuracy_scores = []
-        
-        # 模拟每个操作
-        for operation in pipeline.operations:
-            operator = operation.selected_operator
-            
-            # 根据操作类型模拟 token 使用
-            if operation.op_type in ["map", "filter"]:
-                # LLM 操作
-                base_tokens = 500
-                tokens = base_tokens + len(operation.prompt or "") * 2
-                
-                cost_per_1k = self.model_costs.get(operator, 0.001)
-                op_cost = (tokens / 1000.0) * cost_per_1k
-                
+        lines = ["def _score(operations):"]
+        cost_terms = []
+        accuracy_terms = []
+        
+        for i, (type_id, prompt_len) in enumerate(zip(soa["type"], soa["plen"])):
+            if type_id in _LLM_OP_TYPE_IDS:
+                # LLM 操作：token 数 = 基础 500 + 提示词长度 * 2
+                tokens = 500 + prompt_len * 2
                 total_tokens += tokens
-                total_cost += op_cost
-                
-                # 模拟精度
-                base_accuracy = self.model_accuracy.get(operator, 0.75)
-                accuracy_scores.append(base_accuracy)
-                
-            elif operation.op_type == "transform":
+                lines.append(f"    c{i}, a{i} = profile(operations[{i}].selected_operator)")
+                cost_terms.append(f"{tokens} * c{i}")
+                accuracy_terms.append(f"a{i}")
+            elif type_id == _TRANSFORM_OP_TYPE_ID:
                 # 非 LLM 操作，tokens 很少
                 total_tokens += 50
         
-        # 计算总精度（平均）
-        if accuracy_scores:
-            avg_accuracy = sum(accuracy_scores) / len(accuracy_scores)
+        cost_expr = " + ".join(cost_terms) or "0.0"
+        if accuracy_terms:
+            accuracy_expr = f"({' + '.join(accuracy_terms)}) / {len(accuracy_terms)}"
         else:
-            avg_accuracy = 0.8
+            accuracy_expr = "0.8"
+        lines.append(f"    return {total_tokens}, {cost_expr}, {accuracy_expr}")
+        
+        # profile 是绑定方法，修改 model_costs / model_accuracy 后生成的函数仍然有效
+        namespace = {"profile": self._operator_profile}
+        exec("\n".join(lines), namespace)
+        score = namespace["_score"]
+        
+        self._specialized[(soa["type"], soa["plen"])] = score
+        return score
+    
+    def execute(self, pipeline: Pipeline, input_data: Any = None) -> Any:
+        """
+        模拟执行 pipeline。
+        
+        Args:
+            pipeline: Pipeline 配置
+            input_data: 输入数据（未使用）
+        
+        Returns:
+            模拟输出
+        """
+        start_time = time.time()
+        
+        soa = pipeline.soa
+        score = self._specialized.get((soa["type"], soa["plen"]))
+        if score is None:
+            score = self.specialize(pipeline)
+        total_tokens, total_cost, avg_accuracy = score(pipeline.operations)
         
-        # 添加一些随机性
-        import random
-        avg_accuracy += random.uniform(-0.05, 0.05)
+        # 添加一些随机性（与 random.uniform(-0.05, 0.05) / uniform(0.1, 0.5) 等价）
+        i = self._buf_idx
+        if i >= len(self._jitter_buf):
+            self._refill_jitter()
+            i = 0
+        self._buf_idx = i + 2
+        buf = self._jitter_buf
+        
+        avg_accuracy += -0.05 + 0.1 * buf[i]
         avg_accuracy = max(0.0, min(1.0, avg_accuracy))
         
-        execution_time = time.time() - start_time + random.uniform(0.1, 0.5)
+        execution_time = time.time() - start_time + 0.1 + 0.4 * buf[i + 1]
         
         # 记录指标
         self.last_metrics = ExecutionMetrics(
@@ -205,8 +348,188 @@ def create_executor_func(
         # 如果提供了评估器，计算真实精度
         if evaluator and ground_truth is not None:
             true_accuracy = evaluator.evaluate(ground_truth, output)
-            metrics.accuracy = true_accuracy
+            metrics = metrics._replace(accuracy=true_accuracy)
         
         return metrics
     
     return executor_func
+
+
+# 工作进程内的执行器函数（由 _init_worker 在每个进程中创建）
+_worker_executor_func: Optional[Callable[[Pipeline], ExecutionMetrics]] = None
+
+
+def _init_worker(
+    executor: PipelineExecutor,
+    evaluator: Optional[Evaluator],
+    input_data: Any,
+    ground_truth: Any
+):
+    """工作进程初始化：重建执行器函数，并重新播种随机数（fork 会复制父进程状态）"""
+    global _worker_executor_func
+    random.seed()
+    executor.reseed()
+    _worker_executor_func = create_executor_func(
+        executor=executor,
+        evaluator=evaluator,
+        input_data=input_data,
+        ground_truth=ground_truth
+    )
+
+
+def _execute_in_worker(pipeline: Pipeline) -> Union[ExecutionMetrics, Exception]:
+    """在工作进程中执行 pipeline，异常作为返回值传回主进程"""
+    try:
+        return _worker_executor_func(pipeline)
+    except Exception as e:
+        return e
+
+
+# 工作线程内的执行器函数（由 _init_thread_worker 在每个线程中创建）
+_thread_state = threading.local()
+
+
+def _init_thread_worker(
+    executor: PipelineExecutor,
+    evaluator: Optional[Evaluator],
+    input_data: Any,
+    ground_truth: Any
+):
+    """
+    工作线程初始化：每个线程使用执行器的副本（见 PipelineExecutor.fork_for_thread；
+    RealExecutor 的副本与原执行器共享 vLLM 客户端和 LLM 缓存）。
+    """
+    _thread_state.executor_func = create_executor_func(
+        executor=executor.fork_for_thread(),
+        evaluator=evaluator,
+        input_data=input_data,
+        ground_truth=ground_truth
+    )
+
+
+def _execute_in_thread(pipeline: Pipeline) -> Union[ExecutionMetrics, Exception]:
+    """在工作线程中执行 pipeline，异常作为返回值返回"""
+    try:
+        return _thread_state.executor_func(pipeline)
+    except Exception as e:
+        return e
+
+
+def create_worker_pool(
+    executor: PipelineExecutor,
+    evaluator: Optional[Evaluator] = None,
+    input_data: Any = None,
+    ground_truth: Any = None,
+    num_workers: int = 4,
+    backend: str = "process"
+) -> Executor:
+    """
+    创建并行评估用的进程池或线程池。
+    
+    进程池：执行器和评估器会被 pickle 到每个工作进程中，
+    因此评估函数需要是模块级函数。适合 CPU 密集的执行器。
+    
+    线程池：每个线程持有执行器的副本（fork_for_thread）。调用 LLM 的执行器主要时间
+    花在网络等待上（等待期间释放 GIL），线程即可并发，且无需启动进程。
+    
+    Args:
+        executor: Pipeline 执行器
+        evaluator: 精度评估器（可选）
+        input_data: 输入数据
+        ground_truth: 真实标签（用于评估）
+        num_workers: 工作进程（线程）数
+        backend: "process"（进程池）或 "thread"（线程池）
+    
+    Returns:
+        进程池或线程池
+    """
+    initargs = (executor, evaluator, input_data, ground_truth)
+    if backend == "thread":
+        return ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix="pipeline-eval",
+            initializer=_init_thread_worker,
+            initargs=initargs
+        )
+    if backend != "process":
+        raise ValueError(f"未知的并行方式: {backend}")
+    return ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=initargs
+    )
+
+
+def create_batch_executor_func(
+    pool: Executor
+) -> Callable[[List[Pipeline]], List[Union[ExecutionMetrics, Exception]]]:
+    """
+    创建批量执行器函数（用于并行 MCTS 搜索）。
+    
+    Args:
+        pool: 由 create_worker_pool 创建的进程池或线程池
+    
+    Returns:
+        批量执行器函数，接收 pipeline 列表，按顺序返回指标；
+        执行失败的位置返回对应的异常对象
+    """
+    execute = _execute_in_thread if isinstance(pool, ThreadPoolExecutor) else _execute_in_worker
+    
+    def executor_func_batch(
+        pipelines: List[Pipeline]
+    ) -> List[Union[ExecutionMetrics, Exception]]:
+        """并行执行一批 pipeline 并返回指标"""
+        return list(pool.map(execute, pipelines))
+    
+    return executor_func_batch
+
+
+def _as_exception(result: Any) -> Any:
+    """
+    将 gather 返回的非 Exception 的 BaseException（如 CancelledError）包装为 RuntimeError，
+    调用方只需用 isinstance(result, Exception) 区分失败的结果。
+    """
+    if isinstance(result, BaseException) and not isinstance(result, Exception):
+        error = RuntimeError(f"执行被中断: {result!r}")
+        error.__cause__ = result
+        return error
+    return result
+
+
+def wrap_async_executor_func(
+    async_executor_func: Callable[[Pipeline], Awaitable[ExecutionMetrics]]
+) -> Tuple[
+    Callable[[Pipeline], ExecutionMetrics],
+    Callable[[List[Pipeline]], List[Union[ExecutionMetrics, Exception]]]
+]:
+    """
+    将异步执行器函数包装为同步的单个 / 批量执行器函数。
+    
+    批量函数在同一个事件循环上用 asyncio.gather 并发执行一批 pipeline，
+    适合以等待 HTTP 响应为主的 LLM pipeline。每次调用通过 asyncio.run 使用新的
+    事件循环并在返回前关闭，异步 HTTP 会话等绑定事件循环的资源不能跨调用保持。
+    
+    Args:
+        async_executor_func: 异步执行器函数，接收 Pipeline，返回 ExecutionMetrics
+    
+    Returns:
+        (单个执行器函数, 批量执行器函数)；批量函数中执行失败的位置返回对应的异常对象
+    """
+    async def gather(pipelines: List[Pipeline]) -> List[Union[ExecutionMetrics, Exception]]:
+        results = await asyncio.gather(
+            *[async_executor_func(pipeline) for pipeline in pipelines],
+            return_exceptions=True
+        )
+        return [_as_exception(result) for result in results]
+    
+    def executor_func_batch(
+        pipelines: List[Pipeline]
+    ) -> List[Union[ExecutionMetrics, Exception]]:
+        """并发执行一批 pipeline 并返回指标"""
+        return asyncio.run(gather(pipelines))
+    
+    def executor_func(pipeline: Pipeline) -> ExecutionMetrics:
+        """执行单个 pipeline（执行失败时抛出异常）"""
+        return asyncio.run(async_executor_func(pipeline))
+    
+    return executor_func, executor_func_batch
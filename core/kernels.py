@@ -0,0 +1,218 @@
+"""
+数值计算内核
+
+MCTS 选择和 Pareto 支配判断中的纯数值循环。安装了 numba 时编译为本地代码，
+否则使用等价的纯 Python 实现（只安装了 numpy 时，UCB argmax 和 Pareto 掩码
+使用向量化实现）。
+
+count_char_classes 只有 numba 版本（未安装时为 None），调用方应退回到正则实现。
+"""
+
+from typing import List, Sequence, Tuple
+import math
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    import numba
+    HAS_NUMBA = HAS_NUMPY
+except ImportError:
+    HAS_NUMBA = False
+
+# 向量化 Pareto 掩码每块比较的点数，(块大小, N, 3) 的比较矩阵随 N 线性增长
+_PARETO_BLOCK = 256
+
+# ucb_argmax 是否为批量实现（编译或向量化），调用方据此决定是否构造数组
+HAS_UCB_KERNEL = HAS_NUMBA or HAS_NUMPY
+
+
+def _ucb_argmax(visits, rewards, parent_visits, c):
+    """
+    返回 UCB 分数最高的下标（未访问的下标优先，平局取第一个）。
+
+    Args:
+        visits: 各子节点访问次数
+        rewards: 各子节点累积奖励
+        parent_visits: 父节点访问次数
+        c: 探索权重
+
+    Returns:
+        下标（无子节点时返回 -1）
+    """
+    n = len(visits)
+    if n == 0:
+        return -1
+
+    explore = parent_visits > 0
+    log_parent = math.log1p(parent_visits) if explore else 0.0
+
+    best = 0
+    best_score = -math.inf
+    for i in range(n):
+        v = visits[i]
+        if v == 0:
+            return i
+        score = rewards[i] / v
+        if explore:
+            score += c * math.sqrt(log_parent / v)
+        if score > best_score:
+            best_score = score
+            best = i
+    return best
+
+
+def _ucb_argmax_numpy(visits, rewards, parent_visits, c):
+    """UCB argmax 的 NumPy 向量化实现（结果与 _ucb_argmax 相同）"""
+    v = np.asarray(visits, dtype=np.float64)
+    if v.size == 0:
+        return -1
+
+    unvisited = np.flatnonzero(v == 0)
+    if unvisited.size:
+        return int(unvisited[0])
+
+    scores = np.asarray(rewards, dtype=np.float64) / v
+    if parent_visits > 0:
+        scores += c * np.sqrt(math.log1p(parent_visits) / v)
+    # argmax 在平局时返回第一个下标
+    return int(np.argmax(scores))
+
+
+def _pareto_mask(accuracy, tokens, execution_time):
+    """
+    计算 Pareto 非支配掩码（精度最大化，tokens 和时间最小化）。
+
+    Args:
+        accuracy: 各点精度
+        tokens: 各点 token 数
+        execution_time: 各点执行时间
+
+    Returns:
+        掩码，第 i 项为 True 当且仅当没有其他点支配 i
+    """
+    n = len(accuracy)
+    mask = [True] * n
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            if (accuracy[j] >= accuracy[i] and
+                    tokens[j] <= tokens[i] and
+                    execution_time[j] <= execution_time[i] and
+                    (accuracy[j] > accuracy[i] or
+                     tokens[j] < tokens[i] or
+                     execution_time[j] < execution_time[i])):
+                mask[i] = False
+                break
+    return mask
+
+
+def _pareto_mask_numpy(accuracy, tokens, execution_time):
+    """Pareto 非支配掩码的 NumPy 向量化实现（结果与 _pareto_mask 相同）"""
+    # 统一为最小化目标：(-accuracy, tokens, execution_time)
+    objectives = np.column_stack((
+        -np.asarray(accuracy, dtype=np.float64),
+        np.asarray(tokens, dtype=np.float64),
+        np.asarray(execution_time, dtype=np.float64)
+    ))
+    n = objectives.shape[0]
+    mask = np.ones(n, dtype=np.bool_)
+    others = objectives[np.newaxis, :, :]
+    for start in range(0, n, _PARETO_BLOCK):
+        block = objectives[start:start + _PARETO_BLOCK, np.newaxis, :]
+        # dominated[i, j]：点 j 支配点 i（i == j 时严格更优一项不成立，自然为 False）
+        dominated = np.all(others <= block, axis=2) & np.any(others < block, axis=2)
+        mask[start:start + _PARETO_BLOCK] = ~dominated.any(axis=1)
+    return mask.tolist()
+
+
+if HAS_NUMBA:
+    # 不开启 fastmath：其 ninf/nnan 假设与 -inf 初值冲突，contract/reassoc 会改变舍入，
+    # 平局时可能与纯 Python 和 NumPy 实现选出不同的下标
+    _ucb_argmax_jit = numba.njit(cache=True)(_ucb_argmax)
+
+    @numba.njit(cache=True)
+    def _pareto_mask_jit(accuracy, tokens, execution_time):
+        n = accuracy.shape[0]
+        mask = np.ones(n, dtype=np.bool_)
+        for i in range(n):
+            for j in range(n):
+                if i == j:
+                    continue
+                if (accuracy[j] >= accuracy[i] and
+                        tokens[j] <= tokens[i] and
+                        execution_time[j] <= execution_time[i] and
+                        (accuracy[j] > accuracy[i] or
+                         tokens[j] < tokens[i] or
+                         execution_time[j] < execution_time[i])):
+                    mask[i] = False
+                    break
+        return mask
+
+    def ucb_argmax(visits: Sequence[int], rewards: Sequence[float],
+                   parent_visits: int, c: float) -> int:
+        """UCB argmax（numba 编译版本）"""
+        return int(_ucb_argmax_jit(
+            np.asarray(visits, dtype=np.int64),
+            np.asarray(rewards, dtype=np.float64),
+            parent_visits,
+            c
+        ))
+
+    def pareto_mask(accuracy: Sequence[float], tokens: Sequence[int],
+                    execution_time: Sequence[float]) -> List[bool]:
+        """Pareto 非支配掩码（numba 编译版本）"""
+        return _pareto_mask_jit(
+            np.asarray(accuracy, dtype=np.float64),
+            np.asarray(tokens, dtype=np.float64),
+            np.asarray(execution_time, dtype=np.float64)
+        ).tolist()
+
+    @numba.njit(cache=True)
+    def _count_char_classes_jit(buf, starts, out_chinese, out_english):
+        for d in range(starts.shape[0] - 1):
+            chinese = 0
+            english = 0
+            for i in range(starts[d], starts[d + 1]):
+                cp = buf[i]
+                if 0x4e00 <= cp <= 0x9fff:
+                    chinese += 1
+                elif (65 <= cp <= 90) or (97 <= cp <= 122):
+                    english += 1
+            out_chinese[d] = chinese
+            out_english[d] = english
+    
+    def count_char_classes(texts: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """
+        统计每段文本中的中文字符数和英文字母数（numba 编译版本）。
+        
+        所有文本拼接为一个 UTF-32 码点数组，一次内核调用处理整批。
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            (各文本中文字符数, 各文本英文字母数)
+        """
+        n = len(texts)
+        starts = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=n), out=starts[1:])
+        buf = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        
+        out_chinese = np.zeros(n, dtype=np.int64)
+        out_english = np.zeros(n, dtype=np.int64)
+        _count_char_classes_jit(buf, starts, out_chinese, out_english)
+        return out_chinese.tolist(), out_english.tolist()
+    
+    # 预热 JIT，避免第一次 MCTS 迭代承担编译开销
+    ucb_argmax([], [], 0, 1.0)
+    pareto_mask([], [], [])
+    count_char_classes(["a"])
+else:
+    ucb_argmax = _ucb_argmax_numpy if HAS_NUMPY else _ucb_argmax
+    pareto_mask = _pareto_mask_numpy if HAS_NUMPY else _pareto_mask
+    count_char_classes = None
@@ -0,0 +1,165 @@
+"""
+LLM 响应缓存
+
+MCTS 会反复执行前缀相同的 pipeline，相同的 (模型, 提示词, 温度, 输入记录)
+会产生相同的 LLM 调用。对确定性（低温度）调用进行缓存，避免重复请求 vLLM。
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+import hashlib
+import json
+import os
+import shelve
+import threading
+
+
+class LLMCache:
+    """
+    LLM 响应缓存（进程内 LRU + 可选的磁盘 shelve 后端）。
+
+    缓存内容为 {"completion": str, "tokens": int}，命中时算子据此还原
+    生成文本和 token 统计。读写操作加锁，可在流水线执行的多个阶段线程间共享。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 4096,
+        path: Optional[str] = None,
+        max_temperature: float = 0.0
+    ):
+        """
+        初始化缓存。
+
+        Args:
+            max_size: 内存 LRU 的最大条目数
+            path: 磁盘缓存路径（shelve），None 表示仅使用内存
+            max_temperature: 允许缓存的最高温度，高于此温度的调用不缓存
+        """
+        self.max_size = max_size
+        self.path = path
+        self.max_temperature = max_temperature
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._disk = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._disk = shelve.open(path)
+        self._lock = threading.Lock()
+
+        # 命中统计
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        record: Any = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[Sequence[str]] = None
+    ) -> Optional[str]:
+        """
+        计算缓存键。
+
+        Args:
+            model: 模型名称
+            prompt: 提示词
+            temperature: 温度参数
+            record: 输入记录
+            max_tokens: 最大生成 token 数
+            top_p: top_p 采样参数
+            stop: 停止序列
+
+        Returns:
+            SHA-256 十六进制键；温度过高（非确定性调用）时返回 None
+        """
+        if temperature > self.max_temperature:
+            return None
+
+        key_data = {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "stop": list(stop) if stop else None,
+            "input": record
+        }
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True, ensure_ascii=False, default=str).encode()
+        ).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存。
+
+        Args:
+            key: 缓存键（None 直接视为未命中）
+
+        Returns:
+            缓存的 {"completion", "tokens"}，未命中返回 None
+        """
+        if key is None:
+            return None
+
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return payload
+
+            if self._disk is not None and key in self._disk:
+                payload = self._disk[key]
+                self._remember(key, payload)
+                self.hits += 1
+                return payload
+
+            self.misses += 1
+            return None
+
+    def set(self, key: Optional[str], payload: Dict[str, Any]):
+        """
+        写入缓存。
+
+        Args:
+            key: 缓存键（None 时忽略）
+            payload: {"completion": str, "tokens": int}
+        """
+        if key is None:
+            return
+
+        with self._lock:
+            self._remember(key, payload)
+            if self._disk is not None:
+                self._disk[key] = payload
+
+    def _remember(self, key: str, payload: Dict[str, Any]):
+        """写入内存 LRU，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """关闭磁盘后端"""
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def __repr__(self) -> str:
+        return f"LLMCache(size={len(self)}, hits={self.hits}, misses={self.misses})"
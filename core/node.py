@@ -5,16 +5,20 @@
 借鉴 DocETL 的 Node 设计。
 """
 
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional, Dict, Any
+import math
 import time
 from planner.core.pipeline import Pipeline
+from planner.core.kernels import HAS_UCB_KERNEL, ucb_argmax
 
 
-@dataclass
-class ExecutionMetrics:
+# 子节点数达到此值时使用批量 UCB 内核（numba 或 numpy；子节点很少时构造数组的开销大于收益）
+_KERNEL_MIN_CHILDREN = 32
+
+
+class ExecutionMetrics(NamedTuple):
     """
-    Pipeline 执行的指标数据。
+    Pipeline 执行的指标数据（不可变，修改字段使用 _replace）。
     
     Attributes:
         accuracy: 精度（0-1之间，越高越好）
@@ -46,8 +50,32 @@ class Node:
     - visits: 访问次数（用于 UCB 计算）
     - parent: 父节点
     - children: 子节点列表
+    
+    使用 __slots__ 去掉每个实例的 __dict__，降低大规模搜索树的内存占用。
+    
+    children 保持为 Node 列表，不在父节点上维护按子节点排列的 visits/reward
+    数组：统计量由 backpropagate 沿路径逐层更新，平行数组需要在每一层同步；
+    子节点较多时 best_child 一次收集数组交给 UCB 内核。
     """
     
+    __slots__ = (
+        "pipeline",
+        "parent",
+        "children",
+        "action_description",
+        "visits",
+        "incomplete_visits",
+        "total_reward",
+        "metrics",
+        "is_evaluated",
+        "evaluation_failed",
+        "created_at",
+        "evaluated_at",
+        "depth",
+        "_path",
+        "_pipeline_hash",
+    )
+    
     def __init__(
         self,
         pipeline: Pipeline,
@@ -62,13 +90,19 @@ class Node:
             parent: 父节点
             action_description: 从父节点到此节点的动作描述
         """
-        self.pipeline = pipeline
+        self.pipeline: Optional[Pipeline] = pipeline
+        self._pipeline_hash: Optional[str] = None  # release_pipeline 后保留的哈希
         self.parent = parent
         self.children: List[Node] = []
         self.action_description = action_description
         
+        # 深度在创建时确定，路径在首次访问时缓存
+        self.depth = 0 if parent is None else parent.depth + 1
+        self._path: Optional[List["Node"]] = None
+        
         # MCTS 统计信息
         self.visits = 0
+        self.incomplete_visits = 0  # 已派发、尚未返回结果的并行评估数（WU-UCT）
         self.total_reward = 0.0  # 累积奖励
         
         # 执行指标
@@ -82,12 +116,27 @@ class Node:
         
     def get_id(self) -> str:
         """获取节点唯一标识"""
+        if self.pipeline is None:
+            return self._pipeline_hash
         return self.pipeline.get_hash()
     
+    def release_pipeline(self):
+        """
+        释放节点持有的 pipeline，只保留其哈希（get_id 仍然可用）。
+        
+        用于已扩展的内部节点：Selection 不会再返回它们，之后只需要统计信息。
+        action_description 中保留了 pipeline 的文本描述。
+        """
+        if self.pipeline is not None:
+            self._pipeline_hash = self.pipeline.get_hash()
+            self.pipeline = None
+    
     def add_child(self, child: "Node"):
         """添加子节点"""
         self.children.append(child)
         child.parent = self
+        child.depth = self.depth + 1
+        child._path = None
     
     def is_leaf(self) -> bool:
         """判断是否为叶子节点"""
@@ -102,14 +151,19 @@ class Node:
         - 有子节点，或者尝试扩展但无法生成子节点
         """
         # 如果节点已经有子节点，认为已扩展
-        # 如果访问次数 > 0 但没有子节点，说明无法扩展
-        return len(self.children) > 0 or self.visits > 0
+        # 如果访问次数 > 0 但没有子节点，说明无法扩展（正在评估的节点同样不再扩展）
+        return len(self.children) > 0 or self.visits + self.incomplete_visits > 0
     
     def get_ucb_score(self, exploration_weight: float = 1.414) -> float:
         """
         计算 UCB (Upper Confidence Bound) 分数。
         
-        UCB = average_reward + exploration_weight * sqrt(ln(parent_visits) / visits)
+        UCB = average_reward + exploration_weight * sqrt(ln(1 + parent_visits) / visits)
+        
+        使用 log1p：父节点只有一次访问时探索项不为 0，小访问数时数值也更精确。
+        
+        并行评估时 visits 取 visits + incomplete_visits（WU-UCT），
+        正在评估的路径分数降低，并行的 Selection 会分散到其他路径。
         
         Args:
             exploration_weight: 探索权重（c 参数）
@@ -117,21 +171,72 @@ class Node:
         Returns:
             UCB 分数
         """
-        if self.visits == 0:
+        visits = self.visits + self.incomplete_visits
+        if visits == 0:
             return float('inf')  # 未访问的节点优先
         
-        if self.parent is None or self.parent.visits == 0:
-            return self.total_reward / self.visits
+        parent_visits = 0
+        if self.parent is not None:
+            parent_visits = self.parent.visits + self.parent.incomplete_visits
+        if parent_visits == 0:
+            return self.total_reward / visits
         
-        import math
-        
-        exploitation = self.total_reward / self.visits
+        exploitation = self.total_reward / visits
         exploration = exploration_weight * math.sqrt(
-            math.log(self.parent.visits) / self.visits
+            math.log1p(parent_visits) / visits
         )
         
         return exploitation + exploration
     
+    def best_child(self, exploration_weight: float = 1.414) -> Optional["Node"]:
+        """
+        返回 UCB 分数最高的子节点。
+        
+        与对每个子节点调用 get_ucb_score 等价（访问次数同样计入 incomplete_visits），
+        但 ln(1 + visits) 只计算一次，并在遇到未访问的子节点时立即返回。
+        
+        Args:
+            exploration_weight: 探索权重（c 参数）
+        
+        Returns:
+            UCB 分数最高的子节点（无子节点时返回 None）
+        """
+        children = self.children
+        if not children:
+            return None
+        
+        if HAS_UCB_KERNEL and len(children) >= _KERNEL_MIN_CHILDREN:
+            index = ucb_argmax(
+                [c.visits + c.incomplete_visits for c in children],
+                [c.total_reward for c in children],
+                self.visits + self.incomplete_visits,
+                exploration_weight
+            )
+            return children[index]
+        
+        parent_visits = self.visits + self.incomplete_visits
+        explore = parent_visits > 0
+        log_parent_visits = math.log1p(parent_visits) if explore else 0.0
+        sqrt = math.sqrt
+        
+        best = children[0]
+        best_score = -math.inf
+        
+        for child in children:
+            visits = child.visits + child.incomplete_visits
+            if visits == 0:
+                return child  # 未访问的节点优先
+            
+            score = child.total_reward / visits
+            if explore:
+                score += exploration_weight * sqrt(log_parent_visits / visits)
+            
+            if score > best_score:
+                best_score = score
+                best = child
+        
+        return best
+    
     def update_metrics(self, metrics: ExecutionMetrics):
         """
         更新节点的执行指标。
@@ -154,42 +259,79 @@ class Node:
             cost=0.0
         )
     
-    def backpropagate(self, reward: float):
+    def backpropagate(
+        self,
+        reward: float,
+        virtual_loss: float = 0.0,
+        in_flight: bool = False
+    ):
         """
         回溯更新节点统计信息。
         
         Args:
             reward: 奖励值（基于多目标优化计算）
+            virtual_loss: 派发时通过 apply_virtual_loss 预扣的奖励
+            in_flight: 是否由 apply_virtual_loss 标记过（是则同时撤销未完成访问）
         """
         current = self
         while current is not None:
+            if in_flight:
+                current.incomplete_visits -= 1
             current.visits += 1
-            current.total_reward += reward
+            current.total_reward += reward + virtual_loss
             current = current.parent
     
-    def get_path_from_root(self) -> List["Node"]:
-        """获取从根节点到当前节点的路径"""
-        path = []
+    def apply_virtual_loss(self, virtual_loss: float = 0.0):
+        """
+        标记一次正在进行的评估（并行评估派发时调用）。
+        
+        沿路径计入一次未完成访问（incomplete_visits，WU-UCT），可选地再预扣
+        一个悲观奖励，使并行的 Selection 倾向于选择其他路径。
+        评估完成后通过 backpropagate 或 revert_virtual_loss 撤销。
+        
+        Args:
+            virtual_loss: 额外预扣的奖励（0 表示只计未完成访问）
+        """
         current = self
         while current is not None:
-            path.append(current)
+            current.incomplete_visits += 1
+            current.total_reward -= virtual_loss
             current = current.parent
-        return list(reversed(path))
     
-    def get_depth(self) -> int:
-        """获取节点深度（根节点深度为 0）"""
-        depth = 0
-        current = self.parent
+    def revert_virtual_loss(self, virtual_loss: float = 0.0):
+        """
+        撤销 apply_virtual_loss 的标记。
+        
+        Args:
+            virtual_loss: 派发时预扣的奖励
+        """
+        current = self
         while current is not None:
-            depth += 1
+            current.incomplete_visits -= 1
+            current.total_reward += virtual_loss
             current = current.parent
-        return depth
+    
+    def get_path_from_root(self) -> List["Node"]:
+        """获取从根节点到当前节点的路径（首次计算后缓存）"""
+        if self._path is None:
+            path = []
+            current = self
+            while current is not None:
+                path.append(current)
+                current = current.parent
+            path.reverse()
+            self._path = path
+        return list(self._path)
+    
+    def get_depth(self) -> int:
+        """获取节点深度（根节点深度为 0）"""
+        return self.depth
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
         return {
             "id": self.get_id(),
-            "pipeline": self.pipeline.to_dict(),
+            "pipeline": self.pipeline.to_dict() if self.pipeline is not None else None,
             "action": self.action_description,
             "metrics": {
                 "accuracy": self.metrics.accuracy if self.metrics else None,
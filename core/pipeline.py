@@ -5,12 +5,38 @@ Pipeline 和 Operation 定义
 """
 
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from functools import partial
+from typing import List, Optional, Dict, Any, Tuple
 import hashlib
-import json
+import sys
 
+try:
+    import xxhash
+    _new_hasher = xxhash.xxh3_64
+except ImportError:
+    # 未安装 xxhash 时退回到标准库的 64 位 blake2b
+    _new_hasher = partial(hashlib.blake2b, digest_size=8)
 
-@dataclass
+
+# 参与操作哈希计算的字段，修改这些字段时需要使缓存的哈希失效
+_HASHED_FIELDS = frozenset(("name", "op_type", "prompt", "selected_operator", "params"))
+
+# 取值来自小规模固定集合的字段，赋值时 intern，使比较和字典查找走指针快速路径
+_INTERNED_FIELDS = frozenset(("name", "op_type", "selected_operator"))
+
+# 操作类型 -> 整数 id（未知类型按出现顺序分配）
+_OP_TYPE_IDS: Dict[str, int] = {"map": 0, "filter": 1, "reduce": 2, "transform": 3}
+
+
+def op_type_id(op_type: str) -> int:
+    """获取操作类型的整数 id"""
+    type_id = _OP_TYPE_IDS.get(op_type)
+    if type_id is None:
+        type_id = _OP_TYPE_IDS.setdefault(op_type, len(_OP_TYPE_IDS))
+    return type_id
+
+
+@dataclass(slots=True)
 class Operation:
     """
     Pipeline 中的单个操作。
@@ -19,31 +45,47 @@ class Operation:
         name: 操作名称（如 "map", "filter", "chunk"）
         op_type: 操作类型（"map", "reduce", "filter", "transform"）
         prompt: LLM 操作的提示词（可选）
-        candidates: 候选算子列表（如 ["gpt-4o", "gpt-4o-mini", "claude"]）
+        candidates: 候选算子元组（如 ("gpt-4o", "gpt-4o-mini", "claude")），构造后不可变
         selected_operator: 当前选择的算子
         params: 操作的额外参数
+        selectivity: filter 的估计选择率（保留比例，0~1），用于重排启发式；
+            只是估计值，不参与哈希
     """
     name: str
     op_type: str
-    candidates: List[str]
+    candidates: Tuple[str, ...]
     prompt: Optional[str] = None
     selected_operator: Optional[str] = None
     params: Dict[str, Any] = field(default_factory=dict)
+    selectivity: Optional[float] = None
+    _digest: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __setattr__(self, name: str, value: Any):
+        """修改参与哈希的字段时清除缓存的哈希"""
+        if name in _INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+        if name in _HASHED_FIELDS:
+            object.__setattr__(self, "_digest", None)
     
     def __post_init__(self):
         """初始化后，如果没有选择算子，默认选择第一个候选"""
+        # 传入列表时转换为 intern 后的元组；元组视为已规范化（如 clone 传入的），直接共享
+        if type(self.candidates) is not tuple:
+            self.candidates = tuple(sys.intern(c) if type(c) is str else c for c in self.candidates)
         if self.selected_operator is None and self.candidates:
             self.selected_operator = self.candidates[0]
     
     def clone(self) -> "Operation":
-        """克隆操作"""
+        """克隆操作（candidates 元组在克隆之间共享，params 为空时不复制）"""
         return Operation(
             name=self.name,
             op_type=self.op_type,
-            candidates=self.candidates.copy(),
+            candidates=self.candidates,
             prompt=self.prompt,
             selected_operator=self.selected_operator,
-            params=self.params.copy()
+            params=self.params.copy() if self.params else {},
+            selectivity=self.selectivity
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -54,22 +96,54 @@ class Operation:
             "prompt": self.prompt,
             "selected_operator": self.selected_operator,
             "params": self.params,
-            "candidates": self.candidates
+            "candidates": list(self.candidates),
+            "selectivity": self.selectivity
         }
     
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Operation":
+        """从 to_dict 的结果重建操作"""
+        return cls(
+            name=data["name"],
+            op_type=data["op_type"],
+            candidates=list(data["candidates"]),
+            prompt=data.get("prompt"),
+            selected_operator=data.get("selected_operator"),
+            params=dict(data.get("params") or {}),
+            selectivity=data.get("selectivity")
+        )
+    
+    def get_digest(self) -> bytes:
+        """
+        获取操作的 8 字节摘要（带缓存）。
+        
+        直接对规范化的字节序列做 xxh3_64，避免 JSON 序列化开销。
+        注意：原地修改 params 字典不会使缓存失效，需要重新赋值 params。
+        """
+        if self._digest is None:
+            h = _new_hasher()
+            h.update(self.name.encode())
+            h.update(b"\0")
+            h.update(self.op_type.encode())
+            h.update(b"\0")
+            h.update((self.prompt or "").encode())
+            h.update(b"\0")
+            h.update((self.selected_operator or "").encode())
+            h.update(b"\0")
+            for key in sorted(self.params):
+                h.update(key.encode())
+                h.update(b"=")
+                h.update(repr(self.params[key]).encode())
+                h.update(b";")
+            object.__setattr__(self, "_digest", h.digest())
+        return self._digest
+    
     def get_hash(self) -> str:
         """获取操作的哈希值（用于去重）"""
-        key_data = {
-            "name": self.name,
-            "op_type": self.op_type,
-            "prompt": self.prompt,
-            "selected_operator": self.selected_operator,
-            "params": self.params
-        }
-        return hashlib.md5(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+        return self.get_digest().hex()
 
 
-@dataclass
+@dataclass(slots=True)
 class Pipeline:
     """
     线性 Pipeline 定义。
@@ -82,14 +156,112 @@ class Pipeline:
     operations: List[Operation]
     name: str = "pipeline"
     metadata: Dict[str, Any] = field(default_factory=dict)
+    _soa: Optional[Dict[str, Tuple[int, ...]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
     
     def clone(self) -> "Pipeline":
         """克隆 pipeline"""
-        return Pipeline(
+        cloned = Pipeline(
             operations=[op.clone() for op in self.operations],
             name=self.name,
-            metadata=self.metadata.copy()
+            metadata=self.metadata.copy() if self.metadata else {}
+        )
+        # 结构数组由不可变元组组成，克隆之间可以共享
+        cloned._soa = self._soa
+        return cloned
+    
+    def with_operator_replaced(self, index: int, operator: str) -> "Pipeline":
+        """
+        返回第 index 个操作改用 operator 的新 pipeline（结构共享）。
+        
+        只复制被修改的操作，其余 Operation 对象与原 pipeline 共享，
+        因此不要原地修改返回结果的操作；需要修改时先调用 clone。
+        
+        Args:
+            index: 操作下标
+            operator: 新选择的算子
+        
+        Returns:
+            新 pipeline
+        """
+        return self.with_operators_selected({index: operator})
+    
+    def with_operators_selected(self, selections: Dict[int, str]) -> "Pipeline":
+        """
+        返回按 selections 切换算子后的新 pipeline（结构共享）。
+        
+        只复制算子发生变化的操作，其余 Operation 对象与原 pipeline 共享，
+        约束与 with_operator_replaced 相同。
+        
+        Args:
+            selections: {操作下标: 新选择的算子}
+        
+        Returns:
+            新 pipeline
+        """
+        operations = list(self.operations)
+        for index, operator in selections.items():
+            if operations[index].selected_operator != operator:
+                new_op = operations[index].clone()
+                new_op.selected_operator = operator
+                operations[index] = new_op
+        
+        new_pipeline = Pipeline(
+            operations=operations,
+            name=self.name,
+            metadata=self.metadata.copy() if self.metadata else {}
         )
+        # 切换算子不改变结构，结构数组视图可以共享
+        new_pipeline._soa = self._soa
+        return new_pipeline
+    
+    def with_operations_swapped(self, idx1: int, idx2: int) -> "Pipeline":
+        """
+        返回交换两个操作位置后的新 pipeline（结构共享）。
+        
+        只复制操作列表，Operation 对象与原 pipeline 共享（约束与
+        with_operator_replaced 相同）；返回结果上可以继续调用 swap_operations。
+        
+        Args:
+            idx1: 第一个操作下标
+            idx2: 第二个操作下标
+        
+        Returns:
+            新 pipeline
+        """
+        new_pipeline = Pipeline(
+            operations=list(self.operations),
+            name=self.name,
+            metadata=self.metadata.copy() if self.metadata else {}
+        )
+        new_pipeline.swap_operations(idx1, idx2)
+        return new_pipeline
+    
+    @property
+    def soa(self) -> Dict[str, Tuple[int, ...]]:
+        """
+        按列存储的操作结构视图（带缓存）。
+        
+        - type: 每个操作的类型 id（见 op_type_id）
+        - plen: 每个操作的提示词长度
+        - swap: 可交换的相邻操作下标（由 ReorderOperationsAction 首次使用时写入）
+        
+        只包含搜索过程中不变的结构信息；selected_operator 会被动作修改，
+        仍从 operations 读取。通过 replace_operation / swap_operations
+        修改时自动失效，直接修改 operations 列表后需调用 invalidate_soa。
+        """
+        if self._soa is None:
+            ops = self.operations
+            self._soa = {
+                "type": tuple(op_type_id(op.op_type) for op in ops),
+                "plen": tuple(len(op.prompt or "") for op in ops),
+            }
+        return self._soa
+    
+    def invalidate_soa(self):
+        """使结构数组视图失效（原地修改操作字段或 operations 列表后调用）"""
+        self._soa = None
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -99,10 +271,27 @@ class Pipeline:
             "metadata": self.metadata
         }
     
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Pipeline":
+        """从 to_dict 的结果重建 pipeline"""
+        return cls(
+            operations=[Operation.from_dict(op) for op in data["operations"]],
+            name=data.get("name", "pipeline"),
+            metadata=dict(data.get("metadata") or {})
+        )
+    
     def get_hash(self) -> str:
-        """获取 pipeline 的哈希值"""
-        ops_hash = "".join([op.get_hash() for op in self.operations])
-        return hashlib.md5(ops_hash.encode()).hexdigest()
+        """
+        获取 pipeline 的哈希值。
+        
+        不在 pipeline 上缓存：每次由各操作的摘要组合而成（操作摘要已缓存，
+        修改参与哈希的字段时由 Operation.__setattr__ 清除），原地修改操作
+        之后得到的哈希也不会过期。
+        """
+        h = _new_hasher()
+        for op in self.operations:
+            h.update(op.get_digest())
+        return h.hexdigest()
     
     def get_operation_by_name(self, name: str) -> Optional[Operation]:
         """根据名称获取操作"""
@@ -115,6 +304,7 @@ class Pipeline:
         """替换指定位置的操作"""
         if 0 <= index < len(self.operations):
             self.operations[index] = new_operation
+            self._soa = None
     
     def swap_operations(self, idx1: int, idx2: int):
         """交换两个操作的位置（用于操作重排优化）"""
@@ -123,6 +313,7 @@ class Pipeline:
                 self.operations[idx2],
                 self.operations[idx1]
             )
+            self._soa = None
     
     def __len__(self) -> int:
         return len(self.operations)
@@ -142,7 +333,8 @@ def create_llm_operation(
     name: str,
     prompt: str,
     candidates: List[str] = None,
-    op_type: str = "map"
+    op_type: str = "map",
+    selectivity: Optional[float] = None
 ) -> Operation:
     """
     创建 LLM 操作的便捷函数。
@@ -152,6 +344,7 @@ def create_llm_operation(
         prompt: LLM 提示词
         candidates: 候选模型列表
         op_type: 操作类型
+        selectivity: filter 的估计选择率（可选）
     
     Returns:
         Operation 对象
@@ -163,7 +356,8 @@ def create_llm_operation(
         name=name,
         op_type=op_type,
         prompt=prompt,
-        candidates=candidates
+        candidates=candidates,
+        selectivity=selectivity
     )
 
 
@@ -4,16 +4,25 @@
 支持预编程算子和 LLM 算子的实际执行。
 """
 
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from collections import Counter, OrderedDict
+from functools import partial
+import hashlib
+import logging
+import queue
+import threading
 import time
 from planner.core.pipeline import Pipeline, Operation
 from planner.core.executor import PipelineExecutor, ExecutionMetrics
+from planner.core.llm_cache import LLMCache
 from planner.operators.programmatic import (
     ReadJsonOperator,
     KeywordFilterOperator,
     CountTokensOperator,
     RegexExtractOperator,
-    DeduplicateOperator
+    DeduplicateOperator,
+    TokenizeOperator,
+    load_tokenizer
 )
 from planner.operators.llm_operators import (
     VLLMClient,
@@ -21,6 +30,47 @@ from planner.operators.llm_operators import (
     LLMFilterOperator,
     LLMExtractOperator
 )
+from planner.operators.batched_vllm import BatchingVLLMClient
+
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze(value: Any) -> Any:
+    """将参数值转换为可哈希的形式（dict -> 排序后的元组，list -> 元组）"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+# 逐条记录处理的算子（execute([rec]) 与整批处理语义一致），可用于流水线并行
+_RECORDWISE_OPERATORS = frozenset((
+    "keyword_filter",
+    "count_tokens",
+    "tokenize",
+    "regex_extract",
+    "llm_summarize",
+    "llm_filter",
+    "llm_extract",
+))
+
+# 通过 token_sink / cache_sink 回调报告 token 用量的算子
+_LLM_OPERATORS = frozenset(("llm_summarize", "llm_filter", "llm_extract"))
+
+# 为文档写入结果字段的算子（支持 in_place）。默认输出新的文档副本，
+# 因此经过其中之一后，下游算子拿到的文档由本次执行独占，可以就地写入
+_FIELD_WRITING_OPERATORS = frozenset((
+    "count_tokens",
+    "tokenize",
+    "regex_extract",
+    "llm_summarize",
+    "llm_filter",
+    "llm_extract",
+))
 
 
 class RealExecutor(PipelineExecutor):
@@ -34,7 +84,15 @@ class RealExecutor(PipelineExecutor):
         self,
         vllm_base_url: str = "http://localhost:8000",
         vllm_model: str = "default",
-        data_path: str = "planner/data/medical_documents.json"
+        data_path: str = "planner/data/medical_documents.json",
+        llm_cache: Optional[LLMCache] = None,
+        llm_cache_path: Optional[str] = None,
+        llm_cache_max_temperature: float = 0.0,
+        prefix_cache_size: int = 128,
+        batch_window_ms: float = 10.0,
+        max_batch: int = 64,
+        tokenizer_path: Optional[str] = None,
+        verbose: bool = True
     ):
         """
         初始化真实执行器。
@@ -43,13 +101,118 @@ class RealExecutor(PipelineExecutor):
             vllm_base_url: vLLM 服务地址
             vllm_model: vLLM 模型名称
             data_path: 数据文件路径
+            llm_cache: LLM 响应缓存（默认按 llm_cache_path 和 llm_cache_max_temperature 创建）
+            llm_cache_path: 默认 LLM 缓存的磁盘路径（跨进程运行复用，None 表示仅内存）
+            llm_cache_max_temperature: 默认 LLM 缓存允许缓存的最高温度。默认 0.0 只缓存
+                确定性调用；调高后温度不超过该值的调用在命中时重放第一次的采样结果，
+                不再重新采样（重复试验相同配置时结果相同、不再消耗 token）
+            prefix_cache_size: 前缀结果缓存的最大条目数（0 表示禁用）
+            batch_window_ms: LLM 请求合并窗口（毫秒，0 表示不合并）
+            max_batch: 单次 vLLM 请求的最大提示词数
+            tokenizer_path: 模型 tokenizer 路径（可选，配置后启用 tokenize 算子，
+                LLM 算子对预分词的文档直接发送 token id）
+            verbose: 是否打印执行过程（否则仅记录到 trace 和 logging.DEBUG）
         """
-        self.vllm_client = VLLMClient(base_url=vllm_base_url, model=vllm_model)
+        self.vllm_base_url = vllm_base_url
+        self.vllm_model = vllm_model
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = max_batch
+        self.vllm_client = self._create_vllm_client()
         self.data_path = data_path
+        self.tokenizer = load_tokenizer(tokenizer_path) if tokenizer_path else None
+        if llm_cache is None:
+            llm_cache = LLMCache(path=llm_cache_path, max_temperature=llm_cache_max_temperature)
+        self.llm_cache = llm_cache
+        
+        # 前缀结果缓存：prefix_hash -> (中间数据, 截至该前缀的累计 tokens, 累计耗时)
+        # MCTS 的兄弟节点通常只修改靠后的操作，前缀的执行结果可以复用；
+        # 命中时 tokens 和耗时都按第一次执行计入，指标与评估顺序无关。
+        # 只缓存到第一个不可缓存（温度高于 llm_cache.max_temperature）的 LLM 阶段之前
+        self.prefix_cache_size = prefix_cache_size
+        self.prefix_cache: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
         self.last_metrics: ExecutionMetrics = None
         
+        # 最近一次执行的结构化记录，需要时再格式化（见 format_trace）
+        self.verbose = verbose
+        self.trace: List[Dict[str, Any]] = []
+        
+        # 最近一次执行的 token 统计：操作名 -> tokens，以及其中命中 LLM 缓存的部分
+        self.op_tokens: Counter = Counter()
+        self.cached_tokens = 0
+        self._token_lock = threading.Lock()
+        
         # 算子注册表
         self.operator_registry = self._build_operator_registry()
+        self.operator_factories = self._build_operator_factories()
+        
+        # 算子实例池：(算子名, params, prompt) -> 算子实例
+        # MCTS 反复执行相同配置的操作，构造（如正则编译）只需进行一次
+        self._operator_pool: Dict[Tuple, Any] = {}
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        序列化状态（用于多进程并行评估）。
+        
+        vLLM 客户端、LLM 缓存和前缀缓存不跨进程传递，在工作进程中重建。
+        """
+        state = self.__dict__.copy()
+        state["vllm_client"] = None
+        state["llm_cache"] = None
+        state["operator_factories"] = None
+        state["_operator_pool"] = {}
+        state["_token_lock"] = None
+        state["prefix_cache"] = OrderedDict()
+        state["_llm_cache_config"] = (
+            self.llm_cache.max_size,
+            self.llm_cache.max_temperature
+        )
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        """反序列化状态，重建 vLLM 客户端和进程内 LLM 缓存"""
+        max_size, max_temperature = state.pop("_llm_cache_config")
+        self.__dict__.update(state)
+        self.vllm_client = self._create_vllm_client()
+        # 磁盘缓存不支持多进程并发写入，工作进程只使用内存缓存
+        self.llm_cache = LLMCache(max_size=max_size, max_temperature=max_temperature)
+        self.operator_factories = self._build_operator_factories()
+        self._token_lock = threading.Lock()
+    
+    def fork_for_thread(self) -> "RealExecutor":
+        """
+        创建供工作线程使用的副本。
+        
+        副本与本执行器共享 vLLM 客户端（批量客户端可以合并各线程的请求）、
+        LLM 缓存和 tokenizer，只独立持有每次执行的状态（trace、token 统计、
+        最近一次的指标）、算子实例池和前缀缓存（复制当前内容）。
+        副本不持有需要释放的资源，无需 close；共享的客户端由本执行器的 close 释放。
+        
+        Returns:
+            执行器副本
+        """
+        # 不经过 __getstate__ / __setstate__，避免重建客户端和缓存
+        fork = object.__new__(type(self))
+        fork.__dict__.update(self.__dict__)
+        fork.prefix_cache = OrderedDict(self.prefix_cache)
+        fork.last_metrics = None
+        fork.trace = []
+        fork.op_tokens = Counter()
+        fork.cached_tokens = 0
+        fork._token_lock = threading.Lock()
+        fork.operator_factories = fork._build_operator_factories()
+        fork._operator_pool = {}
+        return fork
+    
+    def _create_vllm_client(self):
+        """创建 vLLM 客户端（启用合并窗口时使用批量客户端）"""
+        client = VLLMClient(base_url=self.vllm_base_url, model=self.vllm_model)
+        if self.batch_window_ms > 0:
+            return BatchingVLLMClient(
+                client,
+                batch_window_ms=self.batch_window_ms,
+                max_batch=self.max_batch
+            )
+        return client
     
     def _build_operator_registry(self) -> Dict[str, type]:
         """构建算子注册表"""
@@ -60,6 +223,7 @@ class RealExecutor(PipelineExecutor):
             "count_tokens": CountTokensOperator,
             "regex_extract": RegexExtractOperator,
             "deduplicate": DeduplicateOperator,
+            "tokenize": TokenizeOperator,
             
             # LLM 算子
             "llm_summarize": LLMSummarizeOperator,
@@ -67,6 +231,64 @@ class RealExecutor(PipelineExecutor):
             "llm_extract": LLMExtractOperator,
         }
     
+    def _build_operator_factories(self) -> Dict[str, Callable[[Operation], Any]]:
+        """
+        构建算子工厂表：算子名 -> 根据 Operation 创建算子实例的函数。
+        
+        需要参数的算子在这里读取各自的配置，其余算子直接调用无参构造函数。
+        """
+        factories: Dict[str, Callable[[Operation], Any]] = {
+            name: (lambda operation, cls=cls: cls())
+            for name, cls in self.operator_registry.items()
+        }
+        
+        factories.update({
+            "read_json": lambda operation: ReadJsonOperator(self.data_path),
+            
+            "keyword_filter": lambda operation: KeywordFilterOperator(
+                keywords=operation.params.get("keywords", ["药", "患者", "诊断"])
+            ),
+            
+            "tokenize": self._create_tokenize_operator,
+            
+            # LLM 算子
+            "llm_summarize": lambda operation: LLMSummarizeOperator(
+                vllm_client=self.vllm_client,
+                max_tokens=operation.params.get("max_tokens", 200),
+                temperature=operation.params.get("temperature", 0.3),
+                cache=self.llm_cache,
+                concurrency=operation.params.get("concurrency", 1),
+                tokenizer=self.tokenizer
+            ),
+            
+            "llm_filter": lambda operation: LLMFilterOperator(
+                vllm_client=self.vllm_client,
+                filter_criteria=operation.prompt or "是否为医疗相关文档",
+                cache=self.llm_cache,
+                strong_positive=operation.params.get("strong_positive"),
+                strong_negative=operation.params.get("strong_negative"),
+                concurrency=operation.params.get("concurrency", 1),
+                tokenizer=self.tokenizer
+            ),
+            
+            "llm_extract": lambda operation: LLMExtractOperator(
+                vllm_client=self.vllm_client,
+                extract_target=operation.params.get("target", "药物名称"),
+                output_field="medications",
+                cache=self.llm_cache,
+                concurrency=operation.params.get("concurrency", 1),
+                tokenizer=self.tokenizer
+            ),
+        })
+        
+        return factories
+    
+    def _create_tokenize_operator(self, operation: Operation) -> TokenizeOperator:
+        """创建预分词算子（需要在构造执行器时指定 tokenizer_path）"""
+        if self.tokenizer is None:
+            raise ValueError("tokenize 算子需要指定 tokenizer_path")
+        return TokenizeOperator(self.tokenizer)
+    
     def _instantiate_operator(self, operation: Operation) -> Any:
         """
         根据 Operation 实例化算子。
@@ -77,50 +299,72 @@ class RealExecutor(PipelineExecutor):
         Returns:
             算子实例
         """
-        operator_name = operation.selected_operator
+        factory = self.operator_factories.get(operation.selected_operator)
+        if factory is None:
+            raise ValueError(f"未知的算子: {operation.selected_operator}")
+        return factory(operation)
+    
+    def _get_operator(self, operation: Operation) -> Any:
+        """
+        从算子实例池获取算子，未命中时实例化并放入池中。
         
-        # 特殊处理：read_json
-        if operator_name == "read_json":
-            return ReadJsonOperator(self.data_path)
+        复用的实例在返回前调用 reset()（如果有）清零 token 统计。
         
-        # 特殊处理：keyword_filter
-        if operator_name == "keyword_filter":
-            keywords = operation.params.get("keywords", ["药", "患者", "诊断"])
-            return KeywordFilterOperator(keywords=keywords)
+        Args:
+            operation: Operation 配置
         
-        # 特殊处理：LLM 算子
-        if operator_name == "llm_summarize":
-            return LLMSummarizeOperator(
-                vllm_client=self.vllm_client,
-                max_tokens=operation.params.get("max_tokens", 200),
-                temperature=operation.params.get("temperature", 0.3)
-            )
+        Returns:
+            算子实例
+        """
+        key = (operation.selected_operator, _freeze(operation.params), operation.prompt)
+        operator = self._operator_pool.get(key)
+        if operator is None:
+            operator = self._instantiate_operator(operation)
+            self._operator_pool[key] = operator
+        elif hasattr(operator, "reset"):
+            operator.reset()
+        return operator
+    
+    def _acc(self, name: str, tokens: int):
+        """累加操作的 token 用量（LLM 算子的 token_sink 回调）"""
+        with self._token_lock:
+            self.op_tokens[name] += tokens
+    
+    def _acc_cached(self, tokens: int):
+        """累加命中 LLM 缓存的 token 用量（LLM 算子的 cache_sink 回调）"""
+        with self._token_lock:
+            self.cached_tokens += tokens
+    
+    def _run_operator(
+        self,
+        operator: Any,
+        operation: Operation,
+        data: Any,
+        in_place: bool = False
+    ) -> Any:
+        """
+        执行算子，LLM 算子的 token 用量通过回调计入 op_tokens。
         
-        if operator_name == "llm_filter":
-            criteria = operation.prompt or "是否为医疗相关文档"
-            return LLMFilterOperator(
-                vllm_client=self.vllm_client,
-                filter_criteria=criteria,
-                max_tokens=50,
-                temperature=0.1
-            )
+        Args:
+            operator: 算子实例
+            operation: 对应的 Operation
+            data: 输入数据
+            in_place: 输入文档由本次执行独占，写字段的算子可以不复制文档
         
-        if operator_name == "llm_extract":
-            target = operation.params.get("target", "药物名称")
-            return LLMExtractOperator(
-                vllm_client=self.vllm_client,
-                extract_target=target,
-                output_field="medications",
-                max_tokens=300,
-                temperature=0.2
+        Returns:
+            输出数据
+        """
+        kwargs = {}
+        if in_place and operation.selected_operator in _FIELD_WRITING_OPERATORS:
+            kwargs["in_place"] = True
+        if operation.selected_operator in _LLM_OPERATORS:
+            return operator.execute(
+                data,
+                token_sink=partial(self._acc, operation.name),
+                cache_sink=self._acc_cached,
+                **kwargs
             )
-        
-        # 其他算子
-        operator_class = self.operator_registry.get(operator_name)
-        if operator_class:
-            return operator_class()
-        
-        raise ValueError(f"未知的算子: {operator_name}")
+        return operator.execute(data, **kwargs)
     
     def execute(self, pipeline: Pipeline, input_data: Any = None) -> Any:
         """
@@ -138,44 +382,91 @@ class RealExecutor(PipelineExecutor):
         # 执行流程
         data = input_data
         total_tokens = 0
+        # 各操作的累计耗时（命中前缀缓存时取缓存中的值），以及命中时补回的耗时
+        elapsed = 0.0
+        restored_time = 0.0
+        
+        self.trace = []
+        self.op_tokens = Counter()
+        self.cached_tokens = 0
+        self._record("start", pipeline=pipeline.name)
+        
+        # 外部传入数据时前缀结果依赖于输入，不使用前缀缓存
+        use_prefix_cache = input_data is None and self.prefix_cache_size > 0
+        prefix_hasher = hashlib.md5()
         
-        print(f"\n{'='*70}")
-        print(f"开始执行 Pipeline: {pipeline.name}")
-        print(f"{'='*70}\n")
+        # 当前数据中的文档是否由本次执行独占（前缀缓存会保留各阶段的输出，
+        # 读取算子的结果也会跨次共享，此时下游必须复制后再写字段）
+        owned = False
         
+        num_ops = len(pipeline.operations)
         for i, operation in enumerate(pipeline.operations):
             op_start = time.time()
             
-            print(f"[{i+1}/{len(pipeline.operations)}] 执行操作: {operation.name} ({operation.selected_operator})")
+            # 温度高于 LLM 缓存上限的 LLM 阶段每次重新采样：从该阶段起不再读写前缀缓存，
+            # 否则一次采样结果会重放给共享该前缀的所有 pipeline（与 LLM 缓存的规则一致）
+            operator = None
+            if use_prefix_cache and operation.selected_operator in _LLM_OPERATORS:
+                operator = self._get_operator(operation)
+                if operator.temperature > self.llm_cache.max_temperature:
+                    use_prefix_cache = False
             
-            # 实例化算子
-            operator = self._instantiate_operator(operation)
+            # 前缀哈希（前 i+1 个操作摘要的增量 md5）
+            prefix_key = None
+            if use_prefix_cache:
+                prefix_hasher.update(operation.get_digest())
+                prefix_key = prefix_hasher.hexdigest()
+                
+                cached = self.prefix_cache.get(prefix_key)
+                if cached is not None:
+                    self.prefix_cache.move_to_end(prefix_key)
+                    data, total_tokens, cached_elapsed = cached
+                    restored_time += cached_elapsed - elapsed
+                    elapsed = cached_elapsed
+                    self._record(
+                        "op", index=i, total=num_ops, op=operation.name,
+                        operator=operation.selected_operator, cached=True,
+                        time=0.0, tokens=None, output=len(data)
+                    )
+                    continue
+            
+            # 获取算子（复用池中相同配置的实例）
+            if operator is None:
+                operator = self._get_operator(operation)
             
             # 执行算子
-            data = operator.execute(data)
+            tokens_before = self.op_tokens[operation.name]
+            data = self._run_operator(operator, operation, data, in_place=owned)
+            if not use_prefix_cache and operation.selected_operator in _FIELD_WRITING_OPERATORS:
+                owned = True
             
             op_time = time.time() - op_start
+            elapsed += op_time
             
             # 统计 tokens（如果是 LLM 算子）
-            if hasattr(operator, 'total_tokens'):
-                op_tokens = operator.total_tokens
+            op_tokens = None
+            if operation.selected_operator in _LLM_OPERATORS:
+                op_tokens = self.op_tokens[operation.name] - tokens_before
                 total_tokens += op_tokens
-                print(f"   ✓ 完成，耗时 {op_time:.2f}s，使用 {op_tokens} tokens，输出 {len(data)} 条")
-            else:
-                print(f"   ✓ 完成，耗时 {op_time:.2f}s，输出 {len(data)} 条")
+            self._record(
+                "op", index=i, total=num_ops, op=operation.name,
+                operator=operation.selected_operator, cached=False,
+                time=op_time, tokens=op_tokens, output=len(data)
+            )
+            
+            if prefix_key is not None:
+                self._store_prefix(prefix_key, data, total_tokens, elapsed)
         
-        execution_time = time.time() - start_time
+        # 实际耗时加上命中前缀缓存省去的耗时（与 tokens 一样按未缓存的执行计）
+        execution_time = time.time() - start_time + restored_time
         
         # 计算成本（简化：假设每 1000 tokens = $0.001）
         cost = (total_tokens / 1000.0) * 0.001
         
-        print(f"\n{'='*70}")
-        print(f"Pipeline 执行完成")
-        print(f"   总耗时: {execution_time:.2f}s")
-        print(f"   总 tokens: {total_tokens}")
-        print(f"   总成本: ${cost:.6f}")
-        print(f"   最终输出: {len(data)} 条数据")
-        print(f"{'='*70}\n")
+        self._record(
+            "end", pipeline=pipeline.name, time=execution_time,
+            tokens=total_tokens, cost=cost, output=len(data)
+        )
         
         # 记录指标
         self.last_metrics = ExecutionMetrics(
@@ -187,6 +478,258 @@ class RealExecutor(PipelineExecutor):
         
         return data
     
+    def execute_many(
+        self,
+        pipelines: List[Pipeline],
+        input_data: Any = None
+    ) -> List[Any]:
+        """
+        批量执行多个 pipeline。
+        
+        按操作摘要序列排序后依次执行，前缀相同的 pipeline 相邻运行，
+        前缀缓存中的中间结果在被淘汰前即可复用。
+        
+        Args:
+            pipelines: Pipeline 配置列表
+            input_data: 输入数据（所有 pipeline 共用）
+        
+        Returns:
+            与 pipelines 一一对应的 (输出数据, 执行指标)；执行失败的位置为异常对象
+        """
+        order = sorted(
+            range(len(pipelines)),
+            key=lambda i: [op.get_digest() for op in pipelines[i].operations]
+        )
+        results: List[Any] = [None] * len(pipelines)
+        for i in order:
+            try:
+                output = self.execute(pipelines[i], input_data)
+                results[i] = (output, self.last_metrics)
+            except Exception as e:
+                results[i] = e
+        return results
+    
+    def execute_pipelined(
+        self,
+        pipeline: Pipeline,
+        input_iter: Optional[Iterable[Dict]] = None,
+        queue_size: int = 32
+    ) -> Any:
+        """
+        以流水线并行方式执行 pipeline。
+        
+        每个逐条记录处理的算子运行在独立线程中，线程之间通过有界队列连接，
+        使第 k 条记录的过滤与第 k-1 条记录的 LLM 调用重叠执行，
+        总耗时接近 max(各阶段耗时) 而非 sum(各阶段耗时)。
+        
+        未提供 input_iter 时，开头的非逐条算子作为数据源（单独的 read_json
+        通过 execute_iter 流式读取，其余整批执行）；
+        其余算子中存在非逐条算子（如 deduplicate）时退回到 execute。
+        
+        Args:
+            pipeline: Pipeline 配置
+            input_iter: 输入记录迭代器（可选）
+            queue_size: 阶段间队列的容量
+        
+        Returns:
+            输出数据（保持输入顺序）
+        """
+        operations = pipeline.operations
+        
+        # 开头的数据源算子
+        split = 0
+        if input_iter is None:
+            while (split < len(operations) and
+                   operations[split].selected_operator not in _RECORDWISE_OPERATORS):
+                split += 1
+        
+        stages = operations[split:]
+        if not stages or any(op.selected_operator not in _RECORDWISE_OPERATORS for op in stages):
+            data = list(input_iter) if input_iter is not None else None
+            return self.execute(pipeline, data)
+        
+        start_time = time.time()
+        
+        self.trace = []
+        self._record("start", pipeline=pipeline.name, pipelined=True)
+        
+        self.op_tokens = Counter()
+        self.cached_tokens = 0
+        errors: List[Exception] = []
+        
+        # 数据源算子：单独的 read_json 流式读取，其余情况整批执行
+        source = input_iter
+        if split == 1 and operations[0].selected_operator == "read_json":
+            source = self._get_operator(operations[0]).execute_iter()
+        elif split:
+            data = None
+            for operation in operations[:split]:
+                operator = self._get_operator(operation)
+                data = self._run_operator(operator, operation, data)
+            source = data
+        
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        
+        def feed():
+            """按顺序为记录编号并送入第一个阶段"""
+            try:
+                for record_id, record in enumerate(source):
+                    queues[0].put((record_id, record))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                queues[0].put(None)
+        
+        def run_stage(
+            operation: Operation,
+            in_q: queue.Queue,
+            out_q: queue.Queue,
+            in_place: bool
+        ):
+            """单个阶段：逐条处理记录，出错后继续排空输入以免阻塞上游"""
+            failed = False
+            try:
+                # 各阶段并发执行，使用独立实例而非池中共享的实例
+                operator = self._instantiate_operator(operation)
+            except Exception as e:
+                errors.append(e)
+                failed = True
+            
+            while True:
+                item = in_q.get()
+                if item is None:
+                    break
+                if failed:
+                    continue
+                
+                record_id, record = item
+                try:
+                    for output in self._run_operator(operator, operation, [record], in_place):
+                        out_q.put((record_id, output))
+                except Exception as e:
+                    errors.append(e)
+                    failed = True
+            
+            out_q.put(None)
+        
+        # 流水线各阶段的中间结果不缓存：上游已有写字段的算子复制过文档时，
+        # 后续阶段直接在文档上写入
+        threads = [threading.Thread(target=feed, daemon=True)]
+        owned = False
+        for i, operation in enumerate(stages):
+            threads.append(threading.Thread(
+                target=run_stage,
+                args=(operation, queues[i], queues[i + 1], owned),
+                daemon=True
+            ))
+            if operation.selected_operator in _FIELD_WRITING_OPERATORS:
+                owned = True
+        for thread in threads:
+            thread.start()
+        
+        # 汇聚输出
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is None:
+                break
+            results.append(item)
+        
+        for thread in threads:
+            thread.join()
+        
+        if errors:
+            raise errors[0]
+        
+        # 按记录编号恢复输入顺序
+        results.sort(key=lambda item: item[0])
+        data = [record for _, record in results]
+        
+        execution_time = time.time() - start_time
+        total_tokens = sum(self.op_tokens.values())
+        cost = (total_tokens / 1000.0) * 0.001
+        
+        self._record(
+            "end", pipeline=pipeline.name, pipelined=True, time=execution_time,
+            tokens=total_tokens, cost=cost, output=len(data)
+        )
+        
+        self.last_metrics = ExecutionMetrics(
+            accuracy=0.0,  # 需要评估器计算
+            tokens=total_tokens,
+            execution_time=execution_time,
+            cost=cost
+        )
+        
+        return data
+    
+    def _record(self, event: str, **fields):
+        """
+        记录一条执行事件。
+        
+        仅追加 dict，字符串格式化推迟到 verbose 打印或 DEBUG 日志开启时。
+        
+        Args:
+            event: 事件类型（start / op / end）
+            **fields: 事件字段
+        """
+        fields["event"] = event
+        self.trace.append(fields)
+        if self.verbose:
+            print(self._format_record(fields))
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s", self._format_record(fields))
+    
+    @staticmethod
+    def _format_record(record: Dict[str, Any]) -> str:
+        """将一条执行事件格式化为可读文本"""
+        event = record["event"]
+        
+        if event == "start":
+            title = "开始流水线执行" if record.get("pipelined") else "开始执行"
+            return f"\n{'='*70}\n{title} Pipeline: {record['pipeline']}\n{'='*70}\n"
+        
+        if event == "end":
+            title = "Pipeline 流水线执行完成" if record.get("pipelined") else "Pipeline 执行完成"
+            return (
+                f"\n{'='*70}\n{title}\n"
+                f"   总耗时: {record['time']:.2f}s\n"
+                f"   总 tokens: {record['tokens']}\n"
+                f"   总成本: ${record['cost']:.6f}\n"
+                f"   最终输出: {record['output']} 条数据\n"
+                f"{'='*70}\n"
+            )
+        
+        header = f"[{record['index']+1}/{record['total']}] 执行操作: {record['op']} ({record['operator']})"
+        if record["cached"]:
+            return f"{header}\n   ✓ 命中前缀缓存，输出 {record['output']} 条"
+        if record["tokens"] is not None:
+            return (f"{header}\n   ✓ 完成，耗时 {record['time']:.2f}s，"
+                    f"使用 {record['tokens']} tokens，输出 {record['output']} 条")
+        return f"{header}\n   ✓ 完成，耗时 {record['time']:.2f}s，输出 {record['output']} 条"
+    
+    def format_trace(self) -> str:
+        """格式化最近一次执行的全部事件（verbose=False 时用于事后查看）"""
+        return "\n".join(self._format_record(record) for record in self.trace)
+    
+    def _store_prefix(self, prefix_key: str, data: Any, total_tokens: int, elapsed: float):
+        """写入前缀缓存，超出容量时淘汰最久未使用的条目"""
+        self.prefix_cache[prefix_key] = (data, total_tokens, elapsed)
+        self.prefix_cache.move_to_end(prefix_key)
+        while len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+    
+    def clear_caches(self):
+        """清空前缀缓存、算子实例池和 LLM 缓存（修改 data_path 或 vLLM 模型后调用）"""
+        self.prefix_cache.clear()
+        self._operator_pool.clear()
+        self.llm_cache.clear()
+    
+    def close(self):
+        """释放 vLLM 客户端（批量客户端的后台线程和 HTTP 连接），优化结束后调用"""
+        self.vllm_client.close()
+        self._operator_pool.clear()
+    
     def get_metrics(self) -> ExecutionMetrics:
         """获取最近一次执行的指标"""
         if self.last_metrics is None:
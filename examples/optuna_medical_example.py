@@ -132,8 +132,13 @@ def evaluate_results(results: list) -> float:
     return final_score
 
 
-def run_optimization():
-    """运行 Optuna 优化"""
+def run_optimization(workers: int = 1):
+    """
+    运行 Optuna 优化。
+    
+    Args:
+        workers: 工作进程数（>1 时各进程通过 SQLite 共享同一个 study）
+    """
     print("="*70)
     print("🚀 基于 Optuna 的医疗文档 Pipeline 优化")
     print("="*70)
@@ -145,6 +150,7 @@ def run_optimization():
         print("\n请先启动 vLLM 服务:")
         print("python -m vllm.entrypoints.openai.api_server \\")
         print("    --model <你的模型路径> \\")
+        print("    --enable-prefix-caching \\")
         print("    --port 8000")
         return
     print("✓ vLLM 服务正常")
@@ -161,20 +167,29 @@ def run_optimization():
     executor = RealExecutor(
         vllm_base_url="http://localhost:8000",
         vllm_model="default",
-        data_path="planner/data/medical_documents.json"
+        data_path="planner/data/medical_documents.json",
+        # 各次试验重复处理相同的文档，缓存 LLM 响应（磁盘缓存可跨运行复用）；
+        # 算子默认温度为 0.3，缓存所有温度的调用，重复配置重放同一次采样
+        llm_cache_path="planner/results/.vllm_cache",
+        llm_cache_max_temperature=float("inf")
     )
     print("✓ 执行器初始化完成")
     
     # 4. 创建优化器
     print("\n4️⃣  创建 Optuna 优化器...")
+    os.makedirs("planner/results/optuna_optimization", exist_ok=True)
     optimizer = OptunaOptimizer(
         pipeline=pipeline,
         executor=executor,
         evaluator=evaluate_results,
         n_trials=20,  # 试验次数（Optuna 通常比 MCTS 需要更少的迭代）
-        n_jobs=1,  # 串行执行（可改为 2、4 进行并行优化）
+        n_jobs=1,  # 进程内串行执行
         save_dir="planner/results/optuna_optimization",
-        verbose=True
+        verbose=True,
+        # study 持久化到 SQLite：重新运行时从已完成的试验继续，多进程时共享同一个 study
+        storage="sqlite:///planner/results/optuna_optimization/study.db",
+        study_name="medical_pipeline_v1",
+        n_workers=workers
     )
     print("✓ 优化器初始化完成")
     
@@ -192,7 +207,8 @@ def run_optimization():
     try:
         save_all_visualizations(
             optimizer.study,
-            output_dir="planner/results/optuna_optimization"
+            output_dir="planner/results/optuna_optimization",
+            pareto_trials=pareto_trials
         )
     except Exception as e:
         print(f"⚠️  可视化生成失败: {e}")
@@ -225,6 +241,8 @@ def run_optimization():
     print(f"   时间: {best_time_trial.values[2]:.2f}s")
     print(f"   配置: {best_time_trial.params}")
     
+    executor.close()
+    
     print("\n" + "="*70)
     print("✨ 优化完成!")
     print("="*70)
@@ -289,13 +307,19 @@ def main():
         default="optimize",
         help="运行模式: test=测试单个配置, optimize=运行优化"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="优化的工作进程数（>1 时通过 SQLite 存储共享 study）"
+    )
     
     args = parser.parse_args()
     
     if args.mode == "test":
         run_test()
     else:
-        run_optimization()
+        run_optimization(workers=args.workers)
 
 
 if __name__ == "__main__":
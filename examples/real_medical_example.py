@@ -147,11 +147,12 @@ def run_optimization():
     pipeline = create_medical_pipeline()
     print(f"\n📝 初始配置: {pipeline}\n")
     
-    # 创建执行器
+    # 创建执行器（搜索过程中不逐条打印算子日志，需要时用 executor.format_trace() 查看）
     executor = RealExecutor(
         vllm_base_url="http://localhost:8000",
         vllm_model="default",
-        data_path="planner/data/medical_documents.json"
+        data_path="planner/data/medical_documents.json",
+        verbose=False
     )
     
     # 创建评估器
@@ -203,6 +204,7 @@ def check_vllm_service():
         print("\n请先启动 vLLM 服务：")
         print("  python -m vllm.entrypoints.openai.api_server \\")
         print("    --model <你的模型路径> \\")
+        print("    --enable-prefix-caching \\")
         print("    --host 0.0.0.0 \\")
         print("    --port 8000")
         return False
@@ -0,0 +1,211 @@
+"""
+批量 vLLM 客户端
+
+将短时间窗口内提交的多个生成请求合并为一次 /v1/completions 调用，
+摊薄 HTTP 往返和服务端调度开销。
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+
+from planner.operators.llm_operators import VLLMClient
+
+# 采样参数：(max_tokens, temperature, top_p, stop)，相同参数的请求合并发送
+_SamplingParams = Tuple[int, float, float, Optional[Tuple[str, ...]]]
+
+
+class BatchingVLLMClient:
+    """
+    vLLM 批量客户端（包装 VLLMClient）。
+
+    submit() 立即返回 Future，后台线程每隔 batch_window_ms 或累计
+    max_batch 个请求时统一发送。采样参数不同的请求分组发送；各组的 HTTP 请求
+    在至多 max_inflight 个线程中并发进行，慢请求不会阻塞后续窗口的合并。
+    submit_batch 的 concurrency > 1 时，所在的组再均分为 concurrency 个子批次
+    并发发送（同样受 max_inflight 限制）。
+    不同调用方（算子、线程）的请求会被合并到同一次调用，每条结果的 token 数
+    由 VLLMClient.generate_batch 按服务端返回的 token id 逐条计算（见 _split_usage）。
+    接口与 VLLMClient 兼容，可直接传给 LLM 算子。
+    """
+
+    def __init__(
+        self,
+        client: VLLMClient,
+        batch_window_ms: float = 10.0,
+        max_batch: int = 64,
+        max_inflight: int = 8
+    ):
+        """
+        初始化批量客户端。
+
+        Args:
+            client: 底层 vLLM 客户端
+            batch_window_ms: 合并窗口（毫秒）
+            max_batch: 单次请求的最大提示词数
+            max_inflight: 同时进行的 vLLM 请求数上限（也是 concurrency 的实际上限）
+        """
+        self.client = client
+        self.model = client.model
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+
+        # 待发送请求：(采样参数, 提示词, Future, 请求的并发数)
+        self._pending: List[Tuple[_SamplingParams, str, Future, int]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        
+        # 发送线程池：合并线程只负责分组和派发，不等待 HTTP 请求返回
+        self._senders = ThreadPoolExecutor(
+            max_workers=max_inflight, thread_name_prefix="vllm-batch"
+        )
+
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
+    ) -> Future:
+        """
+        提交生成请求。
+
+        Args:
+            prompt: 输入提示词
+            max_tokens: 最大生成 token 数
+            temperature: 温度参数
+            top_p: top_p 采样参数
+            stop: 停止序列（可选）
+
+        Returns:
+            生成结果的 Future（格式与 VLLMClient.generate 一致）
+        """
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchingVLLMClient 已关闭")
+            self._pending.append(((max_tokens, temperature, top_p, stop), prompt, future, 1))
+            self._cond.notify()
+        return future
+
+    def submit_batch(
+        self,
+        prompts: List[str],
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None,
+        concurrency: int = 1
+    ) -> List[Future]:
+        """
+        提交一组生成请求（一次加锁放入合并队列）。
+        
+        Args:
+            prompts: 输入提示词列表
+            max_tokens: 最大生成 token 数
+            temperature: 温度参数
+            top_p: top_p 采样参数
+            stop: 停止序列（可选）
+            concurrency: 并发请求数：发送时这些请求所在的组均分为 concurrency 个子批次
+                并发发送（至多 max_inflight 个）
+        
+        Returns:
+            与 prompts 一一对应的 Future 列表
+        """
+        params = (max_tokens, temperature, top_p, stop)
+        futures = [Future() for _ in prompts]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchingVLLMClient 已关闭")
+            self._pending.extend(
+                (params, prompt, future, concurrency) for prompt, future in zip(prompts, futures)
+            )
+            self._cond.notify()
+        return futures
+    
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
+    ) -> Dict[str, Any]:
+        """同步生成（提交后等待结果）"""
+        return self.submit(prompt, max_tokens, temperature, top_p, stop).result()
+
+    def _run(self):
+        """后台线程：等待合并窗口结束或批次满后发送"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+
+                # 第一个请求到达后开始计时
+                deadline = time.monotonic() + self.batch_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[_SamplingParams, str, Future, int]]):
+        """按采样参数分组（按组内请求的最大并发数拆分子批次），交给发送线程池（不等待结果）"""
+        groups: Dict[_SamplingParams, List[Tuple[str, Future]]] = {}
+        concurrency: Dict[_SamplingParams, int] = {}
+        for params, prompt, future, requested in batch:
+            groups.setdefault(params, []).append((prompt, future))
+            concurrency[params] = max(concurrency.get(params, 1), requested)
+
+        for params, items in groups.items():
+            chunk_size = -(-len(items) // concurrency[params])
+            for start in range(0, len(items), chunk_size):
+                self._senders.submit(self._send, params, items[start:start + chunk_size])
+
+    def _send(self, params: _SamplingParams, items: List[Tuple[str, Future]]):
+        """发送一组采样参数相同的请求，并按顺序设置 Future 结果"""
+        max_tokens, temperature, top_p, stop = params
+        try:
+            responses = self.client.generate_batch(
+                [prompt for prompt, _ in items],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop
+            )
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        if len(responses) != len(items):
+            error = RuntimeError(
+                f"vLLM 返回 {len(responses)} 条结果，请求 {len(items)} 条"
+            )
+            for _, future in items:
+                future.set_exception(error)
+            return
+
+        for (_, future), response in zip(items, responses):
+            future.set_result(response)
+
+    def close(self):
+        """发送剩余请求，等待进行中的请求完成，停止后台线程并关闭底层客户端的连接"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+        self._senders.shutdown(wait=True)
+        self.client.close()
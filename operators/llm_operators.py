@@ -6,9 +6,87 @@
 
 import json
 import requests
-from typing import List, Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple, Union
+import hashlib
+import os
+import re
+import threading
 import time
 
+from planner.core.llm_cache import LLMCache
+from planner.operators.programmatic import compile_keyword_pattern
+
+
+# 连接池大小（与 BatchingVLLMClient 的并发上限同量级）
+_POOL_MAXSIZE = 256
+
+# 并发发送单条请求的线程数
+_MAX_CONCURRENT_REQUESTS = 64
+
+# 服务端暂时不可用（网关错误、过载）时的重试策略
+_RETRY_TOTAL = 3
+_RETRY_BACKOFF = 0.1
+_RETRY_STATUS = (502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+_request_pool: Optional[ThreadPoolExecutor] = None
+_request_pool_pid: Optional[int] = None
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取进程内共享的 HTTP 会话。
+    
+    所有 VLLMClient 复用同一个带连接池的 Session，保持 TCP keep-alive，
+    避免每次调用重新建立连接。fork 出的工作进程会重新创建自己的会话。
+    
+    Returns:
+        requests.Session
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=16,
+                    pool_maxsize=_POOL_MAXSIZE,
+                    max_retries=requests.adapters.Retry(
+                        total=_RETRY_TOTAL,
+                        backoff_factor=_RETRY_BACKOFF,
+                        status_forcelist=_RETRY_STATUS,
+                        allowed_methods=frozenset(("POST",)),
+                        raise_on_status=False
+                    )
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Content-Type": "application/json"})
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def _get_request_pool() -> ThreadPoolExecutor:
+    """获取进程内共享的请求线程池（fork 出的工作进程重新创建）"""
+    global _request_pool, _request_pool_pid
+    pid = os.getpid()
+    if _request_pool is None or _request_pool_pid != pid:
+        with _session_lock:
+            if _request_pool is None or _request_pool_pid != pid:
+                _request_pool = ThreadPoolExecutor(
+                    max_workers=_MAX_CONCURRENT_REQUESTS,
+                    thread_name_prefix="vllm-request"
+                )
+                _request_pool_pid = pid
+    return _request_pool
+
 
 class VLLMClient:
     """vLLM 客户端，用于调用 vLLM 服务"""
@@ -24,13 +102,67 @@ class VLLMClient:
         self.base_url = base_url.rstrip('/')
         self.model = model
         self.completion_url = f"{self.base_url}/v1/completions"
+        self.session = get_http_session()
+        
+        # 预先序列化的请求体（除 prompt 外的字段）：采样参数 -> JSON 字节
+        self._payload_tails: Dict[Tuple, bytes] = {}
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """序列化时不传递 HTTP 会话"""
+        state = self.__dict__.copy()
+        state["session"] = None
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        """反序列化后使用当前进程的共享会话"""
+        self.__dict__.update(state)
+        self.session = get_http_session()
+    
+    def close(self):
+        """关闭连接池中的空闲连接（会话仍可继续使用，之后按需重新建立连接）"""
+        self.session.close()
+    
+    def _encode_payload(
+        self,
+        prompt: Union[str, List[int], List[Union[str, List[int]]]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[Tuple[str, ...]] = None,
+        return_token_ids: bool = False
+    ) -> bytes:
+        """
+        构造 /v1/completions 请求体。
+        
+        除 prompt 外的字段只随采样参数变化，按参数缓存其序列化结果，
+        每次调用只需序列化 prompt 并拼接。prompt 可以是字符串或 token id 列表
+        （vLLM 收到 token id 时跳过服务端分词），批量请求时为它们的列表。
+        return_token_ids 为 True 时请求服务端在每条结果中返回提示词和生成的 token id。
+        """
+        key = (self.model, max_tokens, temperature, top_p, stop, return_token_ids)
+        tail = self._payload_tails.get(key)
+        if tail is None:
+            fields = {
+                "model": self.model,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "top_p": top_p,
+                "stop": list(stop) if stop else None
+            }
+            if return_token_ids:
+                fields["return_token_ids"] = True
+            tail = json.dumps(fields, ensure_ascii=False)[1:].encode()
+            self._payload_tails[key] = tail
+        
+        return b'{"prompt": ' + json.dumps(prompt, ensure_ascii=False).encode() + b", " + tail
     
     def generate(
         self,
         prompt: str,
         max_tokens: int = 512,
         temperature: float = 0.3,
-        top_p: float = 0.9
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
     ) -> Dict[str, Any]:
         """
         调用 vLLM 生成文本。
@@ -40,24 +172,17 @@ class VLLMClient:
             max_tokens: 最大生成 token 数
             temperature: 温度参数
             top_p: top_p 采样参数
+            stop: 停止序列（可选）
         
         Returns:
             生成结果字典
         """
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "top_p": top_p,
-            "stop": None
-        }
+        payload = self._encode_payload(prompt, max_tokens, temperature, top_p, stop)
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.completion_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
+                data=payload,
                 timeout=60
             )
             response.raise_for_status()
@@ -76,6 +201,444 @@ class VLLMClient:
                 "usage": {"total_tokens": 0},
                 "finish_reason": "error"
             }
+    
+    def generate_batch(
+        self,
+        prompts: List[Union[str, List[int]]],
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        一次 /v1/completions 请求生成多个提示词的结果。
+        
+        vLLM 只返回整批的 usage。多个提示词时请求附带 return_token_ids，
+        每条结果的 token 数取其提示词和生成的 token id 数；服务端不支持该参数时
+        按提示词数平均分摊整批 usage，并标记为估计值（见 _split_usage）。
+        
+        Args:
+            prompts: 输入提示词列表（字符串或 token id 列表）
+            max_tokens: 最大生成 token 数
+            temperature: 温度参数
+            top_p: top_p 采样参数
+            stop: 停止序列（可选）
+        
+        Returns:
+            与 prompts 一一对应的生成结果字典列表
+        """
+        payload = self._encode_payload(
+            prompts, max_tokens, temperature, top_p, stop,
+            return_token_ids=len(prompts) > 1
+        )
+        
+        try:
+            response = self.session.post(
+                self.completion_url,
+                data=payload,
+                timeout=60
+            )
+            response.raise_for_status()
+            
+            result = response.json()
+            choices = sorted(result["choices"], key=lambda c: c.get("index", 0))
+            usages = _split_usage(choices, result.get("usage", {}).get("total_tokens", 0))
+            
+            return [
+                {
+                    "text": choice["text"].strip(),
+                    "usage": usage,
+                    "finish_reason": choice.get("finish_reason", "stop")
+                }
+                for choice, usage in zip(choices, usages)
+            ]
+        
+        except requests.exceptions.RequestException as e:
+            print(f"❌ vLLM 批量调用失败: {e}")
+            return [
+                {
+                    "text": "",
+                    "usage": {"total_tokens": 0},
+                    "finish_reason": "error"
+                }
+                for _ in prompts
+            ]
+    
+    def submit(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
+    ) -> Future:
+        """
+        提交生成请求，返回 Future。
+        
+        普通客户端在共享线程池中发送请求，多次提交并发执行；
+        BatchingVLLMClient 会将多个提交合并为一次请求。
+        """
+        return _get_request_pool().submit(
+            self.generate, prompt, max_tokens, temperature, top_p, stop
+        )
+    
+    def generate_many(
+        self,
+        prompts: List[str],
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        并发发送多条独立请求（每个提示词一次调用）。
+        
+        总耗时接近最慢的一条请求而非所有请求之和。适用于不接受提示词数组
+        或提示词很长、不宜合并为一次请求的服务；vLLM 优先使用 generate_batch。
+        
+        Args:
+            prompts: 输入提示词列表
+            max_tokens: 最大生成 token 数
+            temperature: 温度参数
+            top_p: top_p 采样参数
+            stop: 停止序列（可选）
+        
+        Returns:
+            与 prompts 一一对应的生成结果字典列表
+        """
+        futures = [self.submit(prompt, max_tokens, temperature, top_p, stop) for prompt in prompts]
+        return [future.result() for future in futures]
+    
+    def submit_batch(
+        self,
+        prompts: List[Union[str, List[int]]],
+        max_tokens: int = 512,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        stop: Optional[Tuple[str, ...]] = None,
+        concurrency: int = 1
+    ) -> List[Future]:
+        """
+        提交一组生成请求，返回与 prompts 一一对应的 Future 列表。
+        
+        普通客户端默认通过一次 generate_batch 调用同步完成；concurrency > 1 时
+        将提示词均分为 concurrency 个子批次，在共享线程池中并发发送
+        （复用同一个 Session 的连接池）。BatchingVLLMClient 将它们放入合并队列。
+        
+        Args:
+            prompts: 输入提示词列表（字符串或 token id 列表）
+            max_tokens: 最大生成 token 数
+            temperature: 温度参数
+            top_p: top_p 采样参数
+            stop: 停止序列（可选）
+            concurrency: 并发请求数
+        
+        Returns:
+            与 prompts 一一对应的 Future 列表
+        """
+        if not prompts:
+            return []
+        
+        futures = [Future() for _ in prompts]
+        
+        if concurrency <= 1 or len(prompts) == 1:
+            responses = self.generate_batch(prompts, max_tokens, temperature, top_p, stop)
+            _resolve_futures(futures, prompts, responses)
+            return futures
+        
+        chunk_size = -(-len(prompts) // concurrency)
+        pool = _get_request_pool()
+        for start in range(0, len(prompts), chunk_size):
+            chunk = prompts[start:start + chunk_size]
+            request = pool.submit(
+                self.generate_batch, chunk, max_tokens, temperature, top_p, stop
+            )
+            request.add_done_callback(partial(
+                _resolve_request,
+                futures=futures[start:start + chunk_size],
+                prompts=chunk
+            ))
+        return futures
+
+
+def _split_usage(choices: List[Dict[str, Any]], total_tokens: int) -> List[Dict[str, Any]]:
+    """
+    将一次批量请求的 usage 拆分到每条结果。
+    
+    服务端返回了每条结果的 prompt_token_ids 和 token_ids（vLLM 的 return_token_ids）时
+    逐条精确计数；否则按结果条数平均分摊整批 total_tokens（总和不变），多于一条时
+    标记 estimated：BatchingVLLMClient 会合并不同算子的请求，均摊值可能包含其他
+    算子的 token，这样的结果不写入 LLM 缓存。
+    
+    Args:
+        choices: 按 index 排序的结果列表
+        total_tokens: 整批的 token 总数
+    
+    Returns:
+        与 choices 一一对应的 usage 字典
+    """
+    if all(choice.get("prompt_token_ids") is not None and choice.get("token_ids") is not None
+           for choice in choices):
+        return [
+            {"total_tokens": len(choice["prompt_token_ids"]) + len(choice["token_ids"])}
+            for choice in choices
+        ]
+    
+    share, remainder = divmod(total_tokens, max(len(choices), 1))
+    usages = [{"total_tokens": share + (1 if i < remainder else 0)} for i in range(len(choices))]
+    if len(choices) > 1:
+        for usage in usages:
+            usage["estimated"] = True
+    return usages
+
+
+def _resolve_futures(futures: List[Future], prompts: List[str], responses: List[Dict[str, Any]]):
+    """按顺序设置一个批次的 Future 结果（结果条数不符时全部置为异常）"""
+    if len(responses) != len(prompts):
+        error = RuntimeError(f"vLLM 返回 {len(responses)} 条结果，请求 {len(prompts)} 条")
+        for future in futures:
+            future.set_exception(error)
+        return
+    
+    for future, response in zip(futures, responses):
+        future.set_result(response)
+
+
+def _resolve_request(request: Future, futures: List[Future], prompts: List[str]):
+    """子批次请求完成后的回调：将结果或异常分发给对应的 Future"""
+    error = request.exception()
+    if error is not None:
+        for future in futures:
+            future.set_exception(error)
+        return
+    _resolve_futures(futures, prompts, request.result())
+
+
+def _shared_future(future: Future) -> Future:
+    """
+    为批内重复的提示词派生 Future：结果与原 Future 相同，但 token 数记为 0
+    （重复项没有产生额外的 LLM 调用）。
+    
+    Args:
+        future: 首次出现的提示词对应的 Future
+    
+    Returns:
+        派生的 Future
+    """
+    shared: Future = Future()
+    
+    def copy(done: Future):
+        if done.exception() is not None:
+            shared.set_exception(done.exception())
+            return
+        response = dict(done.result())
+        response["usage"] = {"total_tokens": 0}
+        shared.set_result(response)
+    
+    future.add_done_callback(copy)
+    return shared
+
+
+def _submit_cached_batch(
+    client: VLLMClient,
+    cache: Optional[LLMCache],
+    prompts: List[str],
+    max_tokens: int,
+    temperature: float,
+    stop: Optional[Tuple[str, ...]] = None,
+    concurrency: int = 1,
+    payloads: Optional[List[List[int]]] = None,
+    top_p: float = 0.9
+) -> List[Future]:
+    """
+    带缓存、批内去重的批量生成请求提交。
+    
+    内容相同的提示词（blake2b 摘要相同）只请求一次，其余副本共享结果且
+    token 数记为 0。命中缓存的提示词直接返回已完成的 Future；其余提示词
+    通过一次 submit_batch 提交给客户端，结果返回后写入缓存。
+    Future 的结果格式与 VLLMClient.generate 一致。
+    
+    Args:
+        client: vLLM 客户端（VLLMClient 或 BatchingVLLMClient）
+        cache: LLM 响应缓存（None 表示不缓存）
+        prompts: 输入提示词列表（缓存键只取模型、提示词和生成参数，不取输入记录：
+            上游算子写入记录的字段不影响生成结果）
+        max_tokens: 最大生成 token 数
+        temperature: 温度参数
+        stop: 停止序列（可选）
+        concurrency: 并发请求数（透传给 submit_batch）
+        payloads: 实际发送的提示词 token id 列表（可选，与 prompts 一一对应；
+            去重和缓存键仍按 prompts 计算）
+        top_p: top_p 采样参数
+    
+    Returns:
+        与 prompts 一一对应的生成结果 Future 列表
+    """
+    first_seen: Dict[bytes, int] = {}
+    unique_prompts: List[str] = []
+    unique_payloads: Optional[List[List[int]]] = [] if payloads is not None else None
+    positions: List[int] = []
+    for i, prompt in enumerate(prompts):
+        digest = hashlib.blake2b(
+            prompt.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        position = first_seen.get(digest)
+        if position is None:
+            position = first_seen[digest] = len(unique_prompts)
+            unique_prompts.append(prompt)
+            if payloads is not None:
+                unique_payloads.append(payloads[i])
+        positions.append(position)
+    
+    unique_futures = _submit_unique_batch(
+        client, cache, unique_prompts, max_tokens, temperature, stop,
+        concurrency, unique_payloads, top_p
+    )
+    if len(unique_prompts) == len(prompts):
+        return unique_futures
+    
+    futures = []
+    emitted = [False] * len(unique_futures)
+    for position in positions:
+        if emitted[position]:
+            futures.append(_shared_future(unique_futures[position]))
+        else:
+            emitted[position] = True
+            futures.append(unique_futures[position])
+    return futures
+
+
+def _submit_unique_batch(
+    client: VLLMClient,
+    cache: Optional[LLMCache],
+    prompts: List[str],
+    max_tokens: int,
+    temperature: float,
+    stop: Optional[Tuple[str, ...]] = None,
+    concurrency: int = 1,
+    payloads: Optional[List[List[int]]] = None,
+    top_p: float = 0.9
+) -> List[Future]:
+    """提交互不重复的提示词（参数同 _submit_cached_batch）"""
+    if payloads is None:
+        payloads = prompts
+    
+    if cache is None:
+        return client.submit_batch(
+            payloads, max_tokens=max_tokens, temperature=temperature,
+            top_p=top_p, stop=stop, concurrency=concurrency
+        )
+    
+    futures: List[Optional[Future]] = [None] * len(prompts)
+    miss_indices = []
+    miss_keys = []
+    
+    for i, prompt in enumerate(prompts):
+        key = cache.make_key(
+            client.model, prompt, temperature, max_tokens=max_tokens, top_p=top_p, stop=stop
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            future: Future = Future()
+            future.set_result({
+                "text": cached["completion"],
+                "usage": {"total_tokens": cached["tokens"]},
+                "finish_reason": "cached"
+            })
+            futures[i] = future
+        else:
+            miss_indices.append(i)
+            miss_keys.append(key)
+    
+    def store(done: Future, key: str):
+        if done.exception() is not None:
+            return
+        response = done.result()
+        # 调用失败的结果和均摊的（估计的）token 数不缓存
+        if response["finish_reason"] != "error" and not response["usage"].get("estimated"):
+            cache.set(key, {
+                "completion": response["text"],
+                "tokens": response["usage"].get("total_tokens", 0)
+            })
+    
+    submitted = client.submit_batch(
+        [payloads[i] for i in miss_indices],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stop=stop,
+        concurrency=concurrency
+    )
+    for i, key, future in zip(miss_indices, miss_keys, submitted):
+        if key is not None:
+            future.add_done_callback(partial(store, key=key))
+        futures[i] = future
+    
+    return futures
+
+
+def _encode_template(tokenizer: Any, prefix: str, suffix: str) -> Tuple[List[int], List[int]]:
+    """
+    将提示词模板的固定前缀和后缀编码为 token id。
+    
+    前缀按服务端处理字符串提示词的方式添加特殊 token（如 BOS），后缀不添加。
+    
+    Args:
+        tokenizer: HuggingFace tokenizer
+        prefix: 模板前缀
+        suffix: 模板后缀
+    
+    Returns:
+        (前缀 token id, 后缀 token id)
+    """
+    return (
+        tokenizer(prefix)["input_ids"],
+        tokenizer(suffix, add_special_tokens=False)["input_ids"]
+    )
+
+
+def _token_prompts(
+    template_ids: Optional[Tuple[List[int], List[int]]],
+    docs: List[Dict]
+) -> Optional[List[List[int]]]:
+    """
+    用预分词的正文（TokenizeOperator 写入的 body_ids）拼接 token id 提示词。
+    
+    Args:
+        template_ids: 模板前缀和后缀的 token id（None 表示算子未配置 tokenizer）
+        docs: 输入文档列表
+    
+    Returns:
+        与 docs 一一对应的 token id 列表；未配置 tokenizer 或有文档缺少 body_ids 时返回 None
+    """
+    if template_ids is None or not all("body_ids" in doc for doc in docs):
+        return None
+    prefix_ids, suffix_ids = template_ids
+    return [prefix_ids + doc["body_ids"] + suffix_ids for doc in docs]
+
+
+def _report_tokens(
+    response: Dict[str, Any],
+    token_sink: Optional[Callable[[int], None]],
+    cache_sink: Optional[Callable[[int], None]]
+) -> int:
+    """
+    将一条响应的 token 数报告给回调。
+    
+    Args:
+        response: 生成结果（VLLMClient.generate 格式）
+        token_sink: token 数回调（可选）
+        cache_sink: 缓存命中时的 token 数回调（可选）
+    
+    Returns:
+        该响应的 token 数
+    """
+    tokens = response["usage"].get("total_tokens", 0)
+    if token_sink is not None:
+        token_sink(tokens)
+    if cache_sink is not None and response["finish_reason"] == "cached":
+        cache_sink(tokens)
+    return tokens
 
 
 class LLMSummarizeOperator:
@@ -83,58 +646,92 @@ class LLMSummarizeOperator:
     
     def __init__(
         self,
-        vllm_client: VLLMClient,
+        vllm_client: Optional[VLLMClient],
         max_tokens: int = 200,
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        cache: Optional[LLMCache] = None,
+        concurrency: int = 1,
+        stop: Optional[Sequence[str]] = None,
+        tokenizer: Any = None
     ):
         """
         初始化 LLM 摘要算子。
         
         Args:
-            vllm_client: vLLM 客户端
+            vllm_client: vLLM 客户端（None 表示使用全局默认客户端）
             max_tokens: 最大生成 token 数
             temperature: 温度参数
+            cache: LLM 响应缓存（可选）
+            concurrency: 并发请求数（1 表示整批一次请求）
+            stop: 停止序列（可选）
+            tokenizer: HuggingFace tokenizer（可选，配置后对带有 body_ids 的文档
+                直接发送 token id，服务端无需重复分词）
         """
-        self.client = vllm_client
+        self.client = vllm_client if vllm_client is not None else get_default_vllm_client()
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.concurrency = concurrency
+        self.stop = tuple(stop) if stop else None
+        # 提示词模板的固定部分
+        self._prompt_prefix = "请对以下医疗文档进行摘要，提取关键医疗信息（患者情况、诊断、处方等）。\n\n文档：\n"
+        self._prompt_suffix = "\n\n摘要："
+        self._template_ids = (
+            _encode_template(tokenizer, self._prompt_prefix, self._prompt_suffix)
+            if tokenizer is not None else None
+        )
+        self.total_tokens = 0
+    
+    def reset(self):
+        """清零 token 统计（算子实例被复用时调用）"""
         self.total_tokens = 0
     
-    def execute(self, input_data: List[Dict]) -> List[Dict]:
+    def execute(
+        self,
+        input_data: List[Dict],
+        token_sink: Optional[Callable[[int], None]] = None,
+        cache_sink: Optional[Callable[[int], None]] = None,
+        in_place: bool = False
+    ) -> List[Dict]:
         """
         对每个文档进行摘要。
         
         Args:
             input_data: 输入文档列表
+            token_sink: 每条响应的 token 数回调（可选）
+            cache_sink: 命中 LLM 缓存的响应的 token 数回调（可选）
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
         
         Returns:
             添加了 summary 字段的文档列表
         """
+        # 先构造所有文档的提示词（模板在构造时已拆分为前缀和后缀），
+        # 一次提交（合并为一次 /v1/completions 调用），再依次收集结果
+        prefix, suffix = self._prompt_prefix, self._prompt_suffix
+        prompts = [prefix + doc.get("text", "") + suffix for doc in input_data]
+        
+        # 调用 LLM
+        futures = _submit_cached_batch(
+            self.client,
+            self.cache,
+            prompts,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stop=self.stop,
+            concurrency=self.concurrency,
+            payloads=_token_prompts(self._template_ids, input_data)
+        )
+        
         result = []
         
-        for doc in input_data:
-            text = doc.get("text", "")
-            
-            # 构造提示词
-            prompt = f"""请对以下医疗文档进行摘要，提取关键医疗信息（患者情况、诊断、处方等）。
-
-文档：
-{text}
-
-摘要："""
-            
-            # 调用 LLM
-            response = self.client.generate(
-                prompt=prompt,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+        for doc, future in zip(input_data, futures):
+            response = future.result()
             
             # 统计 tokens
-            self.total_tokens += response["usage"].get("total_tokens", 0)
+            self.total_tokens += _report_tokens(response, token_sink, cache_sink)
             
             # 添加摘要字段
-            doc_copy = doc.copy()
+            doc_copy = doc if in_place else doc.copy()
             doc_copy["summary"] = response["text"]
             doc_copy["summary_tokens"] = response["usage"].get("total_tokens", 0)
             result.append(doc_copy)
@@ -147,64 +744,140 @@ class LLMFilterOperator:
     
     def __init__(
         self,
-        vllm_client: VLLMClient,
+        vllm_client: Optional[VLLMClient],
         filter_criteria: str,
-        max_tokens: int = 50,
-        temperature: float = 0.1
+        max_tokens: int = 3,
+        temperature: float = 0.0,
+        cache: Optional[LLMCache] = None,
+        strong_positive: Optional[List[str]] = None,
+        strong_negative: Optional[List[str]] = None,
+        concurrency: int = 1,
+        stop: Optional[Sequence[str]] = ("\n", "答案"),
+        tokenizer: Any = None
     ):
         """
         初始化 LLM 过滤算子。
         
+        可选的关键词预过滤：包含任一 strong_positive 关键词的文档直接保留，
+        包含任一 strong_negative 关键词的文档直接丢弃，只有其余文档调用 LLM。
+        
         Args:
-            vllm_client: vLLM 客户端
+            vllm_client: vLLM 客户端（None 表示使用全局默认客户端）
             filter_criteria: 过滤标准描述
             max_tokens: 最大生成 token 数
             temperature: 温度参数（过滤任务使用较低温度）
+            cache: LLM 响应缓存（可选）
+            strong_positive: 确定保留的关键词（可选）
+            strong_negative: 确定丢弃的关键词（可选）
+            concurrency: 并发请求数（1 表示整批一次请求）
+            stop: 停止序列（默认在"是/否"之后的换行处停止）
+            tokenizer: HuggingFace tokenizer（可选，配置后对带有 body_ids 的文档
+                直接发送 token id，服务端无需重复分词）
         """
-        self.client = vllm_client
+        self.client = vllm_client if vllm_client is not None else get_default_vllm_client()
         self.filter_criteria = filter_criteria
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.concurrency = concurrency
+        self.stop = tuple(stop) if stop else None
+        # 提示词模板的固定部分（回答要求放在前缀中，使前缀尽量长、后缀尽量短，
+        # 便于 vLLM 前缀缓存复用）
+        self._prompt_prefix = f'判断以下文档是否符合标准：{filter_criteria}\n请只回答"是"或"否"。\n\n文档：\n'
+        self._prompt_suffix = "\n\n答案："
+        self._template_ids = (
+            _encode_template(tokenizer, self._prompt_prefix, self._prompt_suffix)
+            if tokenizer is not None else None
+        )
+        self.strong_positive = strong_positive or []
+        self.strong_negative = strong_negative or []
+        self._positive_pattern = compile_keyword_pattern(self.strong_positive)
+        self._negative_pattern = compile_keyword_pattern(self.strong_negative)
+        self.total_tokens = 0
+        self.llm_calls_saved = 0
+    
+    def reset(self):
+        """清零 token 和预过滤统计（算子实例被复用时调用）"""
         self.total_tokens = 0
+        self.llm_calls_saved = 0
     
-    def execute(self, input_data: List[Dict]) -> List[Dict]:
+    def _prefilter(self, doc: Dict) -> Optional[bool]:
+        """
+        关键词预过滤。
+        
+        Returns:
+            True（确定保留）/ False（确定丢弃）/ None（需要 LLM 判断）
+        """
+        if self._positive_pattern is None and self._negative_pattern is None:
+            return None
+        
+        text = doc.get("text", "").lower()
+        if self._positive_pattern is not None and self._positive_pattern.search(text):
+            return True
+        if self._negative_pattern is not None and self._negative_pattern.search(text):
+            return False
+        return None
+    
+    def execute(
+        self,
+        input_data: List[Dict],
+        token_sink: Optional[Callable[[int], None]] = None,
+        cache_sink: Optional[Callable[[int], None]] = None,
+        in_place: bool = False
+    ) -> List[Dict]:
         """
         使用 LLM 过滤文档。
         
         Args:
             input_data: 输入文档列表
+            token_sink: 每条响应的 token 数回调（可选）
+            cache_sink: 命中 LLM 缓存的响应的 token 数回调（可选）
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
         
         Returns:
             过滤后的文档列表
         """
+        # 先构造所有文档的提示词（模板在构造时已拆分为前缀和后缀），
+        # 一次提交（合并为一次 /v1/completions 调用），再依次收集结果
+        # 预过滤能确定结果的文档不调用 LLM
+        decisions = [self._prefilter(doc) for doc in input_data]
+        pending = [doc for doc, decision in zip(input_data, decisions) if decision is None]
+        self.llm_calls_saved += len(input_data) - len(pending)
+        
+        prefix, suffix = self._prompt_prefix, self._prompt_suffix
+        prompts = [prefix + doc.get("text", "") + suffix for doc in pending]
+        
+        # 调用 LLM
+        futures = iter(_submit_cached_batch(
+            self.client,
+            self.cache,
+            prompts,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stop=self.stop,
+            concurrency=self.concurrency,
+            payloads=_token_prompts(self._template_ids, pending)
+        ))
+        
         result = []
         
-        for doc in input_data:
-            text = doc.get("text", "")
+        for doc, decision in zip(input_data, decisions):
+            if decision is not None:
+                if decision:
+                    doc_copy = doc if in_place else doc.copy()
+                    doc_copy["filter_tokens"] = 0
+                    result.append(doc_copy)
+                continue
             
-            # 构造提示词
-            prompt = f"""判断以下文档是否符合标准：{self.filter_criteria}
-
-文档：
-{text}
-
-请只回答"是"或"否"。
-答案："""
-            
-            # 调用 LLM
-            response = self.client.generate(
-                prompt=prompt,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            response = next(futures).result()
             
             # 统计 tokens
-            self.total_tokens += response["usage"].get("total_tokens", 0)
+            self.total_tokens += _report_tokens(response, token_sink, cache_sink)
             
             # 判断是否保留
             answer = response["text"].lower()
             if "是" in answer or "yes" in answer or "符合" in answer:
-                doc_copy = doc.copy()
+                doc_copy = doc if in_place else doc.copy()
                 doc_copy["filter_tokens"] = response["usage"].get("total_tokens", 0)
                 result.append(doc_copy)
         
@@ -214,75 +887,106 @@ class LLMFilterOperator:
 class LLMExtractOperator:
     """LLM 提取算子"""
     
+    # 提取结果的一行：去掉首尾空白和行首的 "-" / "*" 列表标记，跳过空行和 "#" 开头的行
+    _LINE_RE = re.compile(r'^[^\S\n]*(?=[^\s#])-*\**[^\S\n]*(.*?)[^\S\n]*$', re.MULTILINE)
+    
     def __init__(
         self,
-        vllm_client: VLLMClient,
+        vllm_client: Optional[VLLMClient],
         extract_target: str,
         output_field: str = "extracted",
-        max_tokens: int = 300,
-        temperature: float = 0.2
+        max_tokens: int = 150,
+        temperature: float = 0.2,
+        cache: Optional[LLMCache] = None,
+        concurrency: int = 1,
+        stop: Optional[Sequence[str]] = ("\n\n", "###"),
+        tokenizer: Any = None
     ):
         """
         初始化 LLM 提取算子。
         
         Args:
-            vllm_client: vLLM 客户端
+            vllm_client: vLLM 客户端（None 表示使用全局默认客户端）
             extract_target: 提取目标描述（如"药物名称"）
             output_field: 输出字段名
             max_tokens: 最大生成 token 数
             temperature: 温度参数
+            cache: LLM 响应缓存（可选）
+            concurrency: 并发请求数（1 表示整批一次请求）
+            stop: 停止序列（默认在列表结束后的空行处停止）
+            tokenizer: HuggingFace tokenizer（可选，配置后对带有 body_ids 的文档
+                直接发送 token id，服务端无需重复分词）
         """
-        self.client = vllm_client
+        self.client = vllm_client if vllm_client is not None else get_default_vllm_client()
         self.extract_target = extract_target
         self.output_field = output_field
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.concurrency = concurrency
+        self.stop = tuple(stop) if stop else None
+        # 提示词模板的固定部分
+        self._prompt_prefix = f"从以下医疗文档中提取{extract_target}。请以列表形式输出，每项一行。\n\n文档：\n"
+        self._prompt_suffix = f"\n\n提取的{extract_target}：\n"
+        self._template_ids = (
+            _encode_template(tokenizer, self._prompt_prefix, self._prompt_suffix)
+            if tokenizer is not None else None
+        )
         self.total_tokens = 0
     
-    def execute(self, input_data: List[Dict]) -> List[Dict]:
+    def reset(self):
+        """清零 token 统计（算子实例被复用时调用）"""
+        self.total_tokens = 0
+    
+    def execute(
+        self,
+        input_data: List[Dict],
+        token_sink: Optional[Callable[[int], None]] = None,
+        cache_sink: Optional[Callable[[int], None]] = None,
+        in_place: bool = False
+    ) -> List[Dict]:
         """
         从文档中提取信息。
         
         Args:
             input_data: 输入文档列表
+            token_sink: 每条响应的 token 数回调（可选）
+            cache_sink: 命中 LLM 缓存的响应的 token 数回调（可选）
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
         
         Returns:
             添加了提取字段的文档列表
         """
+        # 先构造所有文档的提示词（模板在构造时已拆分为前缀和后缀），
+        # 一次提交（合并为一次 /v1/completions 调用），再依次收集结果
+        prefix, suffix = self._prompt_prefix, self._prompt_suffix
+        prompts = [prefix + doc.get("text", "") + suffix for doc in input_data]
+        
+        # 调用 LLM
+        futures = _submit_cached_batch(
+            self.client,
+            self.cache,
+            prompts,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stop=self.stop,
+            concurrency=self.concurrency,
+            payloads=_token_prompts(self._template_ids, input_data)
+        )
+        
         result = []
         
-        for doc in input_data:
-            text = doc.get("text", "")
-            
-            # 构造提示词
-            prompt = f"""从以下医疗文档中提取{self.extract_target}。请以列表形式输出，每项一行。
-
-文档：
-{text}
-
-提取的{self.extract_target}：
-"""
-            
-            # 调用 LLM
-            response = self.client.generate(
-                prompt=prompt,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+        for doc, future in zip(input_data, futures):
+            response = future.result()
             
             # 统计 tokens
-            self.total_tokens += response["usage"].get("total_tokens", 0)
+            self.total_tokens += _report_tokens(response, token_sink, cache_sink)
             
             # 解析提取结果
-            extracted_text = response["text"]
-            extracted_items = [
-                line.strip().lstrip('-').lstrip('*').strip()
-                for line in extracted_text.split('\n')
-                if line.strip() and not line.strip().startswith('#')
-            ]
+            extracted_items = self._LINE_RE.findall(response["text"])
             
             # 添加提取字段
-            doc_copy = doc.copy()
+            doc_copy = doc if in_place else doc.copy()
             doc_copy[self.output_field] = extracted_items
             doc_copy["extract_tokens"] = response["usage"].get("total_tokens", 0)
             result.append(doc_copy)
@@ -294,7 +998,17 @@ class LLMExtractOperator:
 _default_vllm_client: Optional[VLLMClient] = None
 
 def set_default_vllm_client(base_url: str = "http://localhost:8000", model: str = "default"):
-    """设置全局默认的 vLLM 客户端"""
+    """
+    设置全局默认的 vLLM 客户端。
+    
+    LLM 算子的提示词均为 "固定前缀 + 文档 + 简短的固定后缀"，同一算子的所有请求
+    共享前缀。vLLM 服务需以 --enable-prefix-caching 启动，才能在请求之间
+    复用前缀的 KV 缓存、跳过这部分的 prefill。
+    
+    Args:
+        base_url: vLLM 服务地址
+        model: 模型名称
+    """
     global _default_vllm_client
     _default_vllm_client = VLLMClient(base_url=base_url, model=model)
 
@@ -5,9 +5,136 @@
 """
 
 import json
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Pattern
+import mmap
+import os
 import re
 
+from planner.core.kernels import count_char_classes
+
+# 整批文本达到该字符数时使用 numba 内核统计字符（小输入用正则更快）
+_KERNEL_MIN_CHARS = 1024
+
+# 关键词不超过该数量时逐个判断子串（比正则多选分支更快），否则合并为一个
+# Aho-Corasick 自动机（需要 pyahocorasick）或正则
+_SUBSTRING_MAX_KEYWORDS = 4
+
+# 超过该大小的 JSON 文件在流式读取时边解析边产出（需要 ijson）
+_STREAM_MIN_BYTES = 64 * 1024 * 1024
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+try:
+    import re2
+    HAS_RE2 = True
+except ImportError:
+    HAS_RE2 = False
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+
+@lru_cache(maxsize=4)
+def _load_json(file_path: str, mtime: float) -> Any:
+    """
+    解析 JSON 文件（按路径和修改时间缓存）。
+    
+    MCTS 每次执行 pipeline 都会重新读取同一个静态数据集，
+    文件未修改时直接返回已解析的结果。
+    
+    Args:
+        file_path: 文件路径
+        mtime: 文件修改时间（仅作为缓存键）
+    
+    Returns:
+        解析后的数据
+    """
+    if HAS_ORJSON:
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return orjson.loads(b"")  # 空文件无法 mmap，直接报告解析错误
+            # 通过 mmap 直接解析页缓存中的内容，不再复制一份完整的 bytes
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+    
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compile_linear_pattern(pattern: str) -> Pattern:
+    """
+    编译正则表达式，安装了 google-re2 时优先使用 RE2。
+    
+    RE2 基于自动机匹配，耗时与文本长度成线性关系，不会出现回溯爆炸，
+    匹配时释放 GIL；findall 等接口与 re 一致。RE2 不支持的语法
+    （反向引用、环视等）退回到标准库 re。
+    
+    Args:
+        pattern: 正则表达式模式
+    
+    Returns:
+        编译后的正则对象
+    """
+    if HAS_RE2:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
+
+
+def compile_keyword_pattern(keywords: List[str]) -> Optional[Pattern]:
+    """
+    将关键词列表编译为一个匹配任意关键词的正则（用于小写后的文本）。
+    
+    Args:
+        keywords: 关键词列表
+    
+    Returns:
+        编译后的正则；关键词为空时返回 None
+    """
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(keyword.lower()) for keyword in keywords))
+
+
+def compile_keyword_automaton(keywords: List[str]):
+    """
+    将关键词列表编译为 Aho-Corasick 自动机（用于小写后的文本）。
+    
+    一遍扫描文本即可找出所有关键词（包括相互重叠的），耗时与关键词数量无关。
+    
+    Args:
+        keywords: 关键词列表
+    
+    Returns:
+        ahocorasick.Automaton，值为关键词小写后去重的下标；未安装 pyahocorasick、
+        关键词为空或包含空串（自动机无法表示）时返回 None
+    """
+    lowered = list(dict.fromkeys(keyword.lower() for keyword in keywords))
+    if not HAS_AHOCORASICK or not lowered or not all(lowered):
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for index, keyword in enumerate(lowered):
+        automaton.add_word(keyword, index)
+    automaton.make_automaton()
+    return automaton
+
 
 class ReadJsonOperator:
     """读取 JSON 文件算子"""
@@ -20,11 +147,29 @@ class ReadJsonOperator:
         读取 JSON 文件。
         
         Returns:
-            文档列表
+            文档列表（列表为新副本，文档字典与缓存共享，下游算子不应原地修改）
         """
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _load_json(self.file_path, os.path.getmtime(self.file_path))
+        if isinstance(data, list):
+            return list(data)
         return data
+    
+    def execute_iter(self, input_data: Any = None) -> Iterator[Dict]:
+        """
+        流式读取 JSON 数组中的文档。
+        
+        大文件（安装了 ijson 时）边解析边产出，内存占用恒定，下游算子无需等待整个
+        文件解析完成即可开始处理；其余情况从 execute 的缓存结果中迭代。
+        
+        Returns:
+            文档迭代器
+        """
+        if HAS_IJSON and os.path.getsize(self.file_path) >= _STREAM_MIN_BYTES:
+            with open(self.file_path, 'rb') as f:
+                yield from ijson.items(f, "item", use_float=True)
+            return
+        
+        yield from self.execute(input_data)
 
 
 class KeywordFilterOperator:
@@ -40,6 +185,17 @@ class KeywordFilterOperator:
         """
         self.keywords = keywords
         self.mode = mode
+        
+        # 关键词只在构造时转小写一次；关键词较多时编译为 Aho-Corasick 自动机
+        # （"any" 模式未安装 pyahocorasick 时退回合并的正则），每个文档只扫描一遍
+        self._lowered = [keyword.lower() for keyword in keywords]
+        many = len(keywords) > _SUBSTRING_MAX_KEYWORDS
+        self._automaton = compile_keyword_automaton(keywords) if many else None
+        self._distinct = len(set(self._lowered))
+        self._any_pattern = (
+            compile_keyword_pattern(keywords)
+            if many and self._automaton is None else None
+        )
     
     def execute(self, input_data: List[Dict]) -> List[Dict]:
         """
@@ -51,19 +207,50 @@ class KeywordFilterOperator:
         Returns:
             过滤后的文档列表
         """
+        lowered = self._lowered
         filtered = []
+        append = filtered.append
+        
+        if self.mode == "any":
+            # 包含任意关键词
+            if not lowered:
+                return []
+            if self._automaton is not None:
+                match = self._automaton.iter
+                return [
+                    doc for doc in input_data
+                    if next(match(doc.get("text", "").lower()), None) is not None
+                ]
+            if self._any_pattern is not None:
+                search = self._any_pattern.search
+                return [doc for doc in input_data if search(doc.get("text", "").lower())]
+            
+            for doc in input_data:
+                text = doc.get("text", "").lower()
+                for keyword in lowered:
+                    if keyword in text:
+                        append(doc)
+                        break
+            return filtered
+        
+        # 包含所有关键词：自动机会报告相互重叠的匹配，收集到的不同关键词数等于
+        # 关键词总数即可
+        if self._automaton is not None:
+            match = self._automaton.iter
+            distinct = self._distinct
+            return [
+                doc for doc in input_data
+                if len({index for _, index in match(doc.get("text", "").lower())}) == distinct
+            ]
         
+        # 关键词较少（或未安装 pyahocorasick）时逐个判断子串
         for doc in input_data:
             text = doc.get("text", "").lower()
-            
-            if self.mode == "any":
-                # 包含任意关键词
-                if any(keyword.lower() in text for keyword in self.keywords):
-                    filtered.append(doc)
+            for keyword in lowered:
+                if keyword not in text:
+                    break
             else:
-                # 包含所有关键词
-                if all(keyword.lower() in text for keyword in self.keywords):
-                    filtered.append(doc)
+                append(doc)
         
         return filtered
 
@@ -71,7 +258,10 @@ class KeywordFilterOperator:
 class CountTokensOperator:
     """统计 token 数量算子"""
     
-    def execute(self, input_data: List[Dict]) -> List[Dict]:
+    # 连续的中文字符或英文字母各作为一次匹配，一遍扫描同时统计两类字符
+    _CHAR_RUN_RE = re.compile(r'([\u4e00-\u9fff]+)|([a-zA-Z]+)')
+    
+    def execute(self, input_data: List[Dict], in_place: bool = False) -> List[Dict]:
         """
         为每个文档添加 token 计数。
         
@@ -79,26 +269,111 @@ class CountTokensOperator:
         
         Args:
             input_data: 输入文档列表
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
         
         Returns:
             添加了 token_count 字段的文档列表
         """
+        texts = [doc.get("text", "") for doc in input_data]
+        
+        if count_char_classes is not None and sum(map(len, texts)) >= _KERNEL_MIN_CHARS:
+            chinese_counts, english_counts = count_char_classes(texts)
+        else:
+            chinese_counts, english_counts = self._count_regex(texts)
+        
         result = []
         
-        for doc in input_data:
-            text = doc.get("text", "")
-            
+        for doc, chinese_chars, english_chars in zip(input_data, chinese_counts, english_counts):
             # 简单估算：中文字符数 + 英文字符数/4
-            chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-            english_chars = len(re.findall(r'[a-zA-Z]', text))
-            
             estimated_tokens = chinese_chars + (english_chars // 4)
             
-            doc_copy = doc.copy()
+            doc_copy = doc if in_place else doc.copy()
             doc_copy["token_count"] = estimated_tokens
             result.append(doc_copy)
         
         return result
+    
+    def _count_regex(self, texts: List[str]):
+        """用正则统计每段文本中的中文字符数和英文字母数"""
+        finditer = self._CHAR_RUN_RE.finditer
+        chinese_counts = []
+        english_counts = []
+        
+        for text in texts:
+            chinese_chars = 0
+            english_chars = 0
+            for match in finditer(text):
+                if match.lastindex == 1:
+                    chinese_chars += match.end() - match.start()
+                else:
+                    english_chars += match.end() - match.start()
+            chinese_counts.append(chinese_chars)
+            english_counts.append(english_chars)
+        
+        return chinese_counts, english_counts
+
+
+def load_tokenizer(model_path: str) -> Any:
+    """
+    加载模型对应的 HuggingFace tokenizer（需要 transformers）。
+    
+    transformers 导入较慢，只在需要预分词时才导入。
+    
+    Args:
+        model_path: 模型名称或本地路径（与 vLLM 服务加载的模型一致）
+    
+    Returns:
+        tokenizer 实例
+    """
+    try:
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        raise ImportError("预分词需要安装 transformers：pip install transformers") from e
+    return AutoTokenizer.from_pretrained(model_path)
+
+
+class TokenizeOperator:
+    """
+    预分词算子
+    
+    对每个文档的正文分词一次，写入 body_ids 字段。配置了同一 tokenizer 的
+    LLM 算子直接拼接 "前缀 id + body_ids + 后缀 id" 发送给 vLLM，
+    多个 LLM 算子、多次试验之间不再重复分词。
+    """
+    
+    def __init__(self, tokenizer: Any):
+        """
+        初始化预分词算子。
+        
+        Args:
+            tokenizer: HuggingFace tokenizer（见 load_tokenizer）
+        """
+        self.tokenizer = tokenizer
+    
+    def execute(self, input_data: List[Dict], in_place: bool = False) -> List[Dict]:
+        """
+        对文档正文分词。
+        
+        Args:
+            input_data: 输入文档列表
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
+        
+        Returns:
+            添加了 body_ids 字段的文档列表
+        """
+        if not input_data:
+            return []
+        
+        texts = [doc.get("text", "") for doc in input_data]
+        token_ids = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        
+        result = []
+        for doc, ids in zip(input_data, token_ids):
+            doc_copy = doc if in_place else doc.copy()
+            doc_copy["body_ids"] = ids
+            result.append(doc_copy)
+        
+        return result
 
 
 class RegexExtractOperator:
@@ -112,15 +387,16 @@ class RegexExtractOperator:
             pattern: 正则表达式模式
             field_name: 提取结果存储的字段名
         """
-        self.pattern = re.compile(pattern)
+        self.pattern = compile_linear_pattern(pattern)
         self.field_name = field_name
     
-    def execute(self, input_data: List[Dict]) -> List[Dict]:
+    def execute(self, input_data: List[Dict], in_place: bool = False) -> List[Dict]:
         """
         使用正则表达式提取信息。
         
         Args:
             input_data: 输入文档列表
+            in_place: 直接在输入文档上写入结果字段（调用方独占输入文档时使用）
         
         Returns:
             添加了提取字段的文档列表
@@ -131,7 +407,7 @@ class RegexExtractOperator:
             text = doc.get("text", "")
             matches = self.pattern.findall(text)
             
-            doc_copy = doc.copy()
+            doc_copy = doc if in_place else doc.copy()
             doc_copy[self.field_name] = matches
             result.append(doc_copy)
         
@@ -160,13 +436,17 @@ class DeduplicateOperator:
         Returns:
             去重后的文档列表
         """
+        # 单次遍历 + 集合判重已是 O(N)；循环内用到的属性和方法提前绑定到局部变量
+        key_field = self.key_field
         seen = set()
+        seen_add = seen.add
         result = []
+        append = result.append
         
         for doc in input_data:
-            key = doc.get(self.key_field)
+            key = doc.get(key_field)
             if key and key not in seen:
-                seen.add(key)
-                result.append(doc)
+                seen_add(key)
+                append(doc)
         
         return result
@@ -4,11 +4,58 @@
 定义可以对 pipeline 进行的优化动作。
 """
 
-from typing import List, Callable, Dict
+from collections import OrderedDict
+from typing import List, Callable, Dict, Tuple, Sequence, TypeVar
 from planner.core.pipeline import Pipeline, Operation
 from planner.core.node import Node
 import random
 
+T = TypeVar("T")
+
+# 可交换的相邻操作类型对：(前一个操作, 后一个操作)，新增重排规则时在此添加。
+# 涉及 filter 的交换还要由 ReorderOperationsAction._can_swap 检查选择率
+_SWAP_TABLE = frozenset((
+    ("map", "filter"),          # filter 移到 map 之前（谓词下推）
+    ("filter", "filter"),       # 选择率更低的 filter 先执行
+    ("transform", "transform"), # transform 操作一般可以交换
+))
+
+
+def random_pick(items: Sequence[T]) -> T:
+    """
+    随机选择一个元素（等价于 random.choice，直接用 random.random 计算下标）。
+    
+    Args:
+        items: 非空序列
+    
+    Returns:
+        随机选中的元素
+    """
+    return items[int(random.random() * len(items))]
+
+
+def random_sample(items: Sequence[T], k: int) -> List[T]:
+    """
+    不放回地随机抽取 k 个元素（部分 Fisher–Yates 洗牌）。
+    
+    只洗前 k 个位置，比 random.sample 少了集合 / 池选择的额外开销。
+    
+    Args:
+        items: 序列
+        k: 抽取数量（不超过 len(items)）
+    
+    Returns:
+        抽取结果的新列表
+    """
+    pool = list(items)
+    n = len(pool)
+    rand = random.random
+    for i in range(k):
+        j = i + int(rand() * (n - i))
+        pool[i], pool[j] = pool[j], pool[i]
+    del pool[k:]
+    return pool
+
 
 class OptimizationAction:
     """
@@ -17,16 +64,20 @@ class OptimizationAction:
     每个动作可以从一个 pipeline 生成一个或多个新的 pipeline 配置。
     """
     
-    def __init__(self, name: str, description: str):
+    __slots__ = ("name", "description", "prior")
+    
+    def __init__(self, name: str, description: str, prior: float = 1.0):
         """
         初始化优化动作。
         
         Args:
             name: 动作名称
             description: 动作描述
+            prior: 先验权重，扩展时按权重抽样动作（越大越常被选中）
         """
         self.name = name
         self.description = description
+        self.prior = prior
     
     def apply(self, pipeline: Pipeline) -> List[Pipeline]:
         """
@@ -60,6 +111,8 @@ class SwitchOperatorAction(OptimizationAction):
     例如：将某个 map 操作的模型从 gpt-4o-mini 切换到 gpt-4o。
     """
     
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__(
             name="switch_operator",
@@ -68,24 +121,18 @@ class SwitchOperatorAction(OptimizationAction):
     
     def apply(self, pipeline: Pipeline) -> List[Pipeline]:
         """生成切换算子的 pipeline 变体"""
-        variants = []
-        
-        for i, operation in enumerate(pipeline.operations):
-            # 对于每个有多个候选算子的操作
-            if len(operation.candidates) > 1:
-                for candidate in operation.candidates:
-                    # 跳过当前已选择的算子
-                    if candidate == operation.selected_operator:
-                        continue
-                    
-                    # 创建新的 pipeline
-                    new_pipeline = pipeline.clone()
-                    new_op = new_pipeline.operations[i]
-                    new_op.selected_operator = candidate
-                    
-                    variants.append(new_pipeline)
+        # 每个有多个候选算子的操作，换成除当前算子外的每个候选
+        pairs = [
+            (i, candidate)
+            for i, operation in enumerate(pipeline.operations)
+            if len(operation.candidates) > 1
+            for candidate in operation.candidates
+            if candidate != operation.selected_operator
+        ]
         
-        return variants
+        # 创建新的 pipeline（只复制被修改的操作）
+        replace = pipeline.with_operator_replaced
+        return [replace(i, candidate) for i, candidate in pairs]
     
     def is_applicable(self, pipeline: Pipeline) -> bool:
         """检查是否有操作可以切换算子"""
@@ -97,56 +144,127 @@ class ReorderOperationsAction(OptimizationAction):
     重排相邻操作的顺序。
     
     例如：将 filter 移到 map 之前（谓词下推）。
+    
+    filter 标注了 selectivity 时只生成改进的交换：选择率低的 filter 放在前面，
+    选择率不低于 pushdown_max_selectivity 的 filter 不再前移到 map 之前。
     """
     
+    __slots__ = ()
+    
+    # 选择率达到此值的 filter 几乎不减少数据，前移没有收益
+    pushdown_max_selectivity = 1.0
+    
     def __init__(self):
         super().__init__(
             name="reorder_operations",
-            description="重排相邻操作的顺序（如谓词下推）"
+            description="重排相邻操作的顺序（如谓词下推）",
+            prior=3.0  # 谓词下推通常收益最大
         )
     
     def apply(self, pipeline: Pipeline) -> List[Pipeline]:
         """生成重排操作的 pipeline 变体"""
         variants = []
         
-        # 尝试交换每对相邻操作
-        for i in range(len(pipeline) - 1):
-            op1 = pipeline[i]
-            op2 = pipeline[i + 1]
-            
-            # 只有当交换有意义时才执行
-            # 例如：filter 可以移到 map 之前
-            if self._can_swap(op1, op2):
-                new_pipeline = pipeline.clone()
-                new_pipeline.swap_operations(i, i + 1)
-                variants.append(new_pipeline)
+        # 交换每对可交换的相邻操作（例如：filter 可以移到 map 之前）；
+        # 交换不修改操作本身，变体与原 pipeline 共享 Operation 对象
+        for i in self._swappable_pairs(pipeline):
+            variants.append(pipeline.with_operations_swapped(i, i + 1))
         
         return variants
     
+    def _swappable_pairs(self, pipeline: Pipeline) -> Tuple[int, ...]:
+        """
+        可交换的相邻操作下标 i（交换 i 和 i + 1）。
+        
+        只取决于操作类型和选择率（搜索中不变），缓存在 pipeline 的结构数组视图中，
+        克隆之间共享，swap_operations 后自动失效。
+        """
+        soa = pipeline.soa
+        pairs = soa.get("swap")
+        if pairs is None:
+            ops = pipeline.operations
+            pairs = tuple(
+                i for i in range(len(ops) - 1)
+                if self._can_swap(ops[i], ops[i + 1])
+            )
+            soa["swap"] = pairs
+        return pairs
+    
     def _can_swap(self, op1: Operation, op2: Operation) -> bool:
         """
         判断两个操作是否可以交换。
         
         简化规则：
-        - filter 可以移到 map 之前（谓词下推）
+        - filter 可以移到 map 之前（谓词下推），除非其选择率不低于 pushdown_max_selectivity
+        - 两个 filter 都有选择率时，选择率更低的移到前面
         - transform 操作一般可以交换
+        
+        类型对由 _SWAP_TABLE 决定，filter 再按选择率筛选。
         """
-        # Filter 可以移到 map 之前
-        if op2.op_type == "filter" and op1.op_type == "map":
-            return True
+        if (op1.op_type, op2.op_type) not in _SWAP_TABLE:
+            return False
         
-        # 两个 transform 操作可以交换
-        if op1.op_type == "transform" and op2.op_type == "transform":
+        if op2.op_type != "filter":
             return True
         
-        return False
+        # Filter 移到 map 之前
+        if op1.op_type == "map":
+            return (op2.selectivity is None
+                    or op2.selectivity < self.pushdown_max_selectivity)
+        
+        # 选择率更低（过滤更多）的 filter 先执行
+        return (op1.selectivity is not None and op2.selectivity is not None
+                and op1.selectivity > op2.selectivity)
     
     def is_applicable(self, pipeline: Pipeline) -> bool:
         """检查是否有相邻操作可以交换"""
-        for i in range(len(pipeline) - 1):
-            if self._can_swap(pipeline[i], pipeline[i + 1]):
-                return True
-        return False
+        return bool(self._swappable_pairs(pipeline))
+
+
+class PredicatePushdownAction(ReorderOperationsAction):
+    """
+    谓词下推（一步到位）。
+    
+    ReorderOperationsAction 每次只交换一对相邻操作，把 filter 移过多个 map
+    需要多次迭代（多次评估）。本动作一次扫描把每个 filter 尽可能左移，
+    只生成一个 pipeline。
+    """
+    
+    __slots__ = ()
+    
+    def __init__(self):
+        OptimizationAction.__init__(
+            self,
+            name="predicate_pushdown",
+            description="将每个 filter 尽可能前移（谓词下推）",
+            prior=3.0
+        )
+    
+    def apply(self, pipeline: Pipeline) -> List[Pipeline]:
+        """生成所有 filter 下推到最前可行位置的 pipeline"""
+        # 第一次交换时才创建新 pipeline（与原 pipeline 共享 Operation 对象），
+        # 之后在它自己的操作列表上继续交换
+        new_pipeline = None
+        ops = pipeline.operations
+        
+        for i in range(1, len(ops)):
+            if ops[i].op_type != "filter":
+                continue
+            j = i
+            while j > 0 and self._can_swap(ops[j - 1], ops[j]):
+                if new_pipeline is None:
+                    new_pipeline = pipeline.with_operations_swapped(j - 1, j)
+                    ops = new_pipeline.operations
+                else:
+                    new_pipeline.swap_operations(j - 1, j)
+                j -= 1
+        
+        return [new_pipeline] if new_pipeline is not None else []
+    
+    def is_applicable(self, pipeline: Pipeline) -> bool:
+        """检查是否有 filter 可以前移"""
+        ops = pipeline.operations
+        return any(ops[i + 1].op_type == "filter" for i in self._swappable_pairs(pipeline))
 
 
 class ParameterTuningAction(OptimizationAction):
@@ -156,10 +274,13 @@ class ParameterTuningAction(OptimizationAction):
     例如：调整 chunk_size、temperature 等参数。
     """
     
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__(
             name="parameter_tuning",
-            description="调整操作参数（如 chunk_size、temperature）"
+            description="调整操作参数（如 chunk_size、temperature）",
+            prior=0.5
         )
     
     def apply(self, pipeline: Pipeline) -> List[Pipeline]:
@@ -189,27 +310,72 @@ class ActionGenerator:
     根据当前 pipeline 状态，选择并应用优化动作。
     """
     
-    def __init__(self):
-        """初始化动作生成器"""
+    def __init__(self, applicable_cache_size: int = 4096):
+        """
+        初始化动作生成器。
+        
+        Args:
+            applicable_cache_size: 可用动作缓存的最大条目数（按 pipeline 结构指纹 LRU 淘汰）
+        """
         self.actions: List[OptimizationAction] = [
             SwitchOperatorAction(),
             ReorderOperationsAction(),
+            PredicatePushdownAction(),
             # ParameterTuningAction(),  # 可选
         ]
         # 记录每个节点已经尝试过的动作
         self.node_attempted_actions: Dict[str, set] = {}
+        # pipeline 结构指纹 -> 可用动作；actions 列表被替换或修改后整体失效
+        self.applicable_cache_size = applicable_cache_size
+        self._applicable_cache: "OrderedDict[tuple, List[OptimizationAction]]" = OrderedDict()
+        self._cached_actions: List[OptimizationAction] = list(self.actions)
+    
+    @staticmethod
+    def _pipeline_key(pipeline: Pipeline) -> tuple:
+        """
+        计算决定动作可用性的 pipeline 结构指纹。
+        
+        包含内置动作 is_applicable 读取的全部字段：操作类型、候选算子、
+        当前算子、选择率（重排规则）以及是否有参数（参数调优）。
+        
+        Args:
+            pipeline: Pipeline 实例
+        
+        Returns:
+            可哈希的指纹元组
+        """
+        return tuple(
+            (op.op_type, op.selected_operator, op.candidates, op.selectivity, bool(op.params))
+            for op in pipeline.operations
+        )
     
     def get_applicable_actions(self, pipeline: Pipeline) -> List[OptimizationAction]:
         """
         获取可应用于 pipeline 的动作列表。
         
+        MCTS 展开时大量节点只有算子选择不同、结构相同，结果按结构指纹缓存。
+        
         Args:
             pipeline: Pipeline 实例
         
         Returns:
             可应用的动作列表
         """
-        return [action for action in self.actions if action.is_applicable(pipeline)]
+        if self._cached_actions != self.actions:
+            self._applicable_cache.clear()
+            self._cached_actions = list(self.actions)
+        
+        key = self._pipeline_key(pipeline)
+        cache = self._applicable_cache
+        applicable = cache.get(key)
+        if applicable is None:
+            applicable = [action for action in self.actions if action.is_applicable(pipeline)]
+            cache[key] = applicable
+            if len(cache) > self.applicable_cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return list(applicable)
     
     def generate_children(self, node: Node, max_children: int = 5) -> List[Node]:
         """
@@ -225,52 +391,68 @@ class ActionGenerator:
         Returns:
             生成的子节点列表
         """
+        return self.generate_children_batch(node, (max_children,))[0]
+    
+    def generate_children_batch(self, node: Node, counts: Sequence[int]) -> List[List[Node]]:
+        """
+        对同一节点连续进行多轮扩展。
+        
+        可用动作只扫描一次，每轮的动作选择与 generate_children 相同
+        （优先未尝试的动作，并记录已尝试的动作）。
+        
+        Args:
+            node: 父节点
+            counts: 每轮的最大子节点数
+        
+        Returns:
+            每轮生成的子节点列表（与 counts 一一对应）
+        """
         pipeline = node.pipeline
-        node_id = node.get_id()
         
         # 获取可用动作
         applicable_actions = self.get_applicable_actions(pipeline)
         
         if not applicable_actions:
-            return []
+            return [[] for _ in counts]
         
         # 获取此节点已尝试过的动作
-        if node_id not in self.node_attempted_actions:
-            self.node_attempted_actions[node_id] = set()
-        
-        attempted = self.node_attempted_actions[node_id]
-        
-        # 过滤出未尝试的动作
-        untried_actions = [
-            action for action in applicable_actions 
-            if action.name not in attempted
-        ]
+        attempted = self.node_attempted_actions.setdefault(node.get_id(), set())
         
-        if not untried_actions:
-            # 所有动作都已尝试，随机选择一个
-            action = random.choice(applicable_actions)
-        else:
-            # 选择一个未尝试的动作
-            action = random.choice(untried_actions)
-        
-        # 记录已尝试
-        attempted.add(action.name)
-        
-        # 应用动作生成新 pipeline
-        new_pipelines = action.apply(pipeline)
-        
-        # 限制子节点数量
-        if len(new_pipelines) > max_children:
-            new_pipelines = random.sample(new_pipelines, max_children)
-        
-        # 创建子节点
-        children = []
-        for new_pipeline in new_pipelines:
-            child = Node(
-                pipeline=new_pipeline,
-                parent=node,
-                action_description=f"{action.name}: {new_pipeline}"
-            )
-            children.append(child)
+        rounds = []
+        for max_children in counts:
+            # 过滤出未尝试的动作
+            untried_actions = [
+                action for action in applicable_actions 
+                if action.name not in attempted
+            ]
+            
+            # 优先选择未尝试的动作；都已尝试过时在全部可用动作中选择。
+            # 按动作先验权重抽样，而不是均匀随机
+            candidates = untried_actions or applicable_actions
+            action = random.choices(
+                candidates,
+                weights=[a.prior for a in candidates],
+                k=1
+            )[0]
+            
+            # 记录已尝试
+            attempted.add(action.name)
+            
+            # 应用动作生成新 pipeline
+            new_pipelines = action.apply(pipeline)
+            
+            # 限制子节点数量
+            if len(new_pipelines) > max_children:
+                new_pipelines = random_sample(new_pipelines, max_children)
+            
+            # 创建子节点
+            rounds.append([
+                Node(
+                    pipeline=new_pipeline,
+                    parent=node,
+                    action_description=f"{action.name}: {new_pipeline}"
+                )
+                for new_pipeline in new_pipelines
+            ])
         
-        return children
+        return rounds
@@ -4,13 +4,18 @@ MCTS (Monte Carlo Tree Search) 搜索引擎
 借鉴 DocETL 的 MOARSearch 实现，用于探索 pipeline 配置空间。
 """
 
-from typing import Optional, Callable, Dict, Any, List
-import random
+from collections import OrderedDict
+from typing import Optional, Callable, Dict, Any, List, Tuple, Union
+import asyncio
+import heapq
+import itertools
+import threading
 import time
 from planner.core.pipeline import Pipeline
 from planner.core.node import Node, ExecutionMetrics
+from planner.core.executor import wrap_async_executor_func
 from planner.optimizer.pareto import ParetoFrontier
-from planner.optimizer.actions import ActionGenerator
+from planner.optimizer.actions import ActionGenerator, random_pick
 
 
 class MCTSSearchEngine:
@@ -31,25 +36,64 @@ class MCTSSearchEngine:
         max_iterations: int = 50,
         exploration_weight: float = 1.414,
         max_children_per_node: int = 5,
-        verbose: bool = True
+        verbose: bool = True,
+        executor_func_batch: Optional[
+            Callable[[List[Pipeline]], List[Union[ExecutionMetrics, Exception]]]
+        ] = None,
+        num_workers: int = 1,
+        virtual_loss: float = 0.0,
+        metrics_cache: Optional["OrderedDict[str, ExecutionMetrics]"] = None,
+        metrics_cache_size: int = 4096,
+        discard_pipelines: bool = False,
+        leaf_heap: bool = False
     ):
         """
         初始化 MCTS 搜索引擎。
         
         Args:
             root_pipeline: 初始 pipeline 配置
-            executor_func: 执行器函数，接收 Pipeline，返回 ExecutionMetrics
+            executor_func: 执行器函数，接收 Pipeline，返回 ExecutionMetrics。
+                也可以是异步函数：未提供 executor_func_batch 时，每次迭代的
+                num_workers 个叶子通过 asyncio.gather 并发评估
             max_iterations: 最大搜索迭代次数
             exploration_weight: UCB 探索权重
             max_children_per_node: 每个节点最大子节点数
             verbose: 是否打印详细信息
+            executor_func_batch: 批量执行器函数（并行评估，可选）
+            num_workers: 每次迭代并行评估的叶子节点数（需要 executor_func_batch）
+            virtual_loss: 并行派发时额外预扣的奖励（0 表示只使用 WU-UCT 的未完成访问计数）
+            metrics_cache: pipeline 哈希 -> 执行指标的 LRU 缓存（可在多个搜索引擎间共享，
+                None 表示新建）
+            metrics_cache_size: 指标缓存的最大条目数
+            discard_pipelines: 节点扩展后释放其 pipeline（只保留哈希），降低大规模搜索的内存占用；
+                Pareto 前沿上的节点保留 pipeline
+            leaf_heap: 从根节点选择时不逐层下降，而是从所有叶子的最大堆中取 UCB 分数
+                最高的叶子（分数惰性刷新）；适合很深的树
         """
+        if asyncio.iscoroutinefunction(executor_func):
+            executor_func, async_batch = wrap_async_executor_func(executor_func)
+            if executor_func_batch is None:
+                executor_func_batch = async_batch
+        
         self.root = Node(pipeline=root_pipeline, action_description="root")
         self.executor_func = executor_func
         self.max_iterations = max_iterations
         self.exploration_weight = exploration_weight
         self.max_children_per_node = max_children_per_node
         self.verbose = verbose
+        self.executor_func_batch = executor_func_batch
+        self.num_workers = num_workers if executor_func_batch is not None else 1
+        self.virtual_loss = virtual_loss
+        
+        # 执行指标缓存：相同 pipeline 只执行一次
+        self._metrics_cache = metrics_cache if metrics_cache is not None else OrderedDict()
+        self.metrics_cache_size = metrics_cache_size
+        self.discard_pipelines = discard_pipelines
+        
+        # 叶子最大堆：(-UCB 分数, 序号, 节点)，分数可能过期，出堆时刷新
+        self.leaf_heap = leaf_heap
+        self._leaf_heap: List[Tuple[float, int, Node]] = []
+        self._heap_counter = itertools.count()
         
         # 搜索统计
         self.iteration_count = 0
@@ -64,6 +108,9 @@ class MCTSSearchEngine:
         
         # 已访问节点（去重）
         self.visited_pipeline_hashes = set()
+        
+        # pipeline 哈希 -> 树中节点（用于 reroot 复用子树）
+        self.hash_to_node: Dict[str, Node] = {root_pipeline.get_hash(): self.root}
     
     def search(self) -> ParetoFrontier:
         """
@@ -75,69 +122,199 @@ class MCTSSearchEngine:
         self.start_time = time.time()
         self.log("🚀 开始 MCTS 搜索...")
         
-        # 评估根节点
+        # 评估根节点（reroot 后的根节点已评估过，不会重复执行）
         self.log("📊 评估初始 pipeline...")
         self._simulate(self.root)
-        self.pareto_frontier.add_node(self.root)
+        if self.root.get_id() not in self.pareto_frontier.node_to_point:
+            self.pareto_frontier.add_node(self.root)
+        self.visited_pipeline_hashes.add(self.root.get_id())
+        
+        if self.leaf_heap:
+            self._rebuild_leaf_heap()
         
         # 迭代搜索
         for iteration in range(self.max_iterations):
             self.iteration_count = iteration + 1
             
-            self.log(f"\n{'='*60}")
-            self.log(f"🔍 迭代 {self.iteration_count}/{self.max_iterations}")
-            
-            # 1. Selection: 选择最有希望的节点
-            selected_node = self._select(self.root)
+            # 每次迭代的日志只在 verbose 时格式化（f-string 在调用 self.log 之前就会求值）
+            if self.verbose:
+                self.log(f"\n{'='*60}")
+                self.log(f"🔍 迭代 {self.iteration_count}/{self.max_iterations}")
             
-            if selected_node is None:
-                self.log("⚠️  无法选择节点，搜索结束")
+            if self.num_workers > 1:
+                if not self._parallel_iteration():
+                    self.log("⚠️  无法选择节点，搜索结束")
+                    break
+            elif not self._serial_iteration():
                 break
             
+            # 输出当前状态
+            if self.verbose:
+                elapsed = time.time() - self.start_time
+                self.log(f"\n📈 当前统计:")
+                self.log(f"   - Pareto 前沿大小: {self.pareto_frontier.size()}")
+                self.log(f"   - 总评估次数: {self.total_evaluations}")
+                self.log(f"   - 已用时间: {elapsed:.1f}s")
+        
+        self.log(f"\n{'='*60}")
+        self.log(f"✅ 搜索完成!")
+        self.log(f"   - 总迭代: {self.iteration_count}")
+        self.log(f"   - Pareto 前沿: {self.pareto_frontier.size()} 个解")
+        self.log(f"   - 总时间: {time.time() - self.start_time:.1f}s")
+        
+        return self.pareto_frontier
+    
+    def speculate(
+        self,
+        node: Node,
+        iterations: int,
+        stop: Optional[threading.Event] = None
+    ) -> int:
+        """
+        从 node 的子树出发额外执行若干次串行迭代（预测性预热）。
+        
+        用于在调用方处理本次结果时，提前评估下一次搜索最可能的根节点附近的
+        pipeline；之后以 node 为根 reroot 时可直接复用子树和指标缓存。
+        发现的 Pareto 点写入前沿的副本，已返回给调用方的前沿不受影响。
+        
+        Args:
+            node: 预热子树的根节点
+            iterations: 最大迭代次数
+            stop: 停止事件（置位后在当前迭代结束时返回）
+        
+        Returns:
+            实际执行的迭代次数
+        """
+        self.pareto_frontier = self.pareto_frontier.copy()
+        verbose, self.verbose = self.verbose, False
+        try:
+            for done in range(iterations):
+                if stop is not None and stop.is_set():
+                    return done
+                if not self._serial_iteration(start=node):
+                    return done + 1
+            return iterations
+        finally:
+            self.verbose = verbose
+    
+    def _serial_iteration(self, start: Optional[Node] = None) -> bool:
+        """
+        执行一次串行 MCTS 迭代。
+        
+        Args:
+            start: Selection 的起始节点（默认为根节点）
+        
+        Returns:
+            是否继续搜索
+        """
+        # 1. Selection: 选择最有希望的节点
+        selected_node = self._select(self.root if start is None else start)
+        
+        if selected_node is None:
+            self.log("⚠️  无法选择节点，搜索结束")
+            return False
+        
+        if self.verbose:
             self.log(f"✓ 选中节点: depth={selected_node.get_depth()}, "
                     f"visits={selected_node.visits}")
+        
+        # 2. Expansion: 扩展节点
+        children = self._expand(selected_node)
+        
+        if not children:
+            self.log("⚠️  无法扩展节点，标记为已访问")
+            # 即使无法生成子节点，也要增加 visits，避免下次再次选中
+            selected_node.visits += 1
+            return True
+        
+        # 3. Simulation: 随机选择一个子节点进行评估
+        child_to_simulate = random_pick(children)
+        if self.verbose:
+            self.log(f"✓ 生成 {len(children)} 个子节点")
+            self.log(f"✓ 选择子节点进行模拟: {child_to_simulate.action_description[:50]}")
+        
+        metrics = self._simulate(child_to_simulate)
+        
+        if metrics:
+            # 4. Backpropagation: 回溯更新
+            reward = self._calculate_reward(metrics)
+            child_to_simulate.backpropagate(reward)
             
-            # 2. Expansion: 扩展节点
-            children = self._expand(selected_node)
+            # 尝试添加到 Pareto 前沿
+            if self.pareto_frontier.add_node(child_to_simulate):
+                self.log(f"✨ 新 Pareto 点! Accuracy={metrics.accuracy:.3f}, "
+                        f"Tokens={metrics.tokens}, Time={metrics.execution_time:.2f}s")
+        
+        return True
+    
+    def _parallel_iteration(self) -> bool:
+        """
+        执行一次并行 MCTS 迭代（叶子并行）。
+        
+        连续选择至多 num_workers 个叶子节点，每次派发时沿路径计入一次未完成访问
+        （WU-UCT 的 incomplete_visits，可选地再预扣 virtual_loss），使后续的
+        Selection 避开已派发的路径；然后批量评估并回溯，回溯时撤销这些标记。
+        
+        Returns:
+            是否继续搜索
+        """
+        dispatched: List[Node] = []
+        # 每个叶子每轮至多派发一次，避免同一前缀的重复请求同时涌入 LLM 缓存
+        in_flight = set()
+        
+        for _ in range(self.num_workers):
+            selected_node = self._select(self.root)
+            if selected_node is None:
+                break
+            
+            if id(selected_node) in in_flight:
+                continue
+            in_flight.add(id(selected_node))
             
+            children = self._expand(selected_node)
             if not children:
-                self.log("⚠️  无法扩展节点，标记为已访问")
-                # 即使无法生成子节点，也要增加 visits，避免下次再次选中
                 selected_node.visits += 1
                 continue
             
-            self.log(f"✓ 生成 {len(children)} 个子节点")
+            child_to_simulate = random_pick(children)
             
-            # 3. Simulation: 随机选择一个子节点进行评估
-            child_to_simulate = random.choice(children)
-            self.log(f"✓ 选择子节点进行模拟: {child_to_simulate.action_description[:50]}")
+            cached = self._cached_metrics(child_to_simulate.pipeline.get_hash())
+            if cached is not None:
+                child_to_simulate.update_metrics(cached)
+                child_to_simulate.backpropagate(self._calculate_reward(cached))
+                self.pareto_frontier.add_node(child_to_simulate)
+                continue
+            
+            child_to_simulate.apply_virtual_loss(self.virtual_loss)
+            dispatched.append(child_to_simulate)
+        
+        if not dispatched:
+            return bool(in_flight)
+        
+        if self.verbose:
+            self.log(f"✓ 并行评估 {len(dispatched)} 个子节点")
+        
+        results = self.executor_func_batch([child.pipeline for child in dispatched])
+        
+        for child, result in zip(dispatched, results):
+            if isinstance(result, Exception):
+                self.log(f"❌ 执行失败: {result}")
+                child.revert_virtual_loss(self.virtual_loss)
+                child.mark_evaluation_failed()
+                continue
             
-            metrics = self._simulate(child_to_simulate)
+            child.update_metrics(result)
+            self.total_evaluations += 1
+            self._remember_metrics(child.pipeline.get_hash(), result)
             
-            if metrics:
-                # 4. Backpropagation: 回溯更新
-                reward = self._calculate_reward(metrics)
-                child_to_simulate.backpropagate(reward)
-                
-                # 尝试添加到 Pareto 前沿
-                if self.pareto_frontier.add_node(child_to_simulate):
-                    self.log(f"✨ 新 Pareto 点! Accuracy={metrics.accuracy:.3f}, "
-                            f"Tokens={metrics.tokens}, Time={metrics.execution_time:.2f}s")
+            reward = self._calculate_reward(result)
+            child.backpropagate(reward, virtual_loss=self.virtual_loss, in_flight=True)
             
-            # 输出当前状态
-            elapsed = time.time() - self.start_time
-            self.log(f"\n📈 当前统计:")
-            self.log(f"   - Pareto 前沿大小: {self.pareto_frontier.size()}")
-            self.log(f"   - 总评估次数: {self.total_evaluations}")
-            self.log(f"   - 已用时间: {elapsed:.1f}s")
-        
-        self.log(f"\n{'='*60}")
-        self.log(f"✅ 搜索完成!")
-        self.log(f"   - 总迭代: {self.iteration_count}")
-        self.log(f"   - Pareto 前沿: {self.pareto_frontier.size()} 个解")
-        self.log(f"   - 总时间: {time.time() - self.start_time:.1f}s")
+            if self.pareto_frontier.add_node(child):
+                self.log(f"✨ 新 Pareto 点! Accuracy={result.accuracy:.3f}, "
+                        f"Tokens={result.tokens}, Time={result.execution_time:.2f}s")
         
-        return self.pareto_frontier
+        return True
     
     def _select(self, node: Node) -> Optional[Node]:
         """
@@ -149,18 +326,16 @@ class MCTSSearchEngine:
         Returns:
             选中的叶子节点
         """
+        if self.leaf_heap and node is self.root:
+            return self._pop_leaf()
+        
         current = node
+        exploration_weight = self.exploration_weight
         
-        while not current.is_leaf():
-            # 如果节点未完全扩展，返回它
-            if not current.is_fully_expanded():
-                return current
-            
-            # 选择 UCB 分数最高的子节点
-            current = max(
-                current.children,
-                key=lambda c: c.get_ucb_score(self.exploration_weight)
-            )
+        # 有子节点的节点总是视为已完全扩展（见 Node.is_fully_expanded），
+        # 因此只需沿 UCB 分数最高的子节点下降到叶子
+        while current.children:
+            current = current.best_child(exploration_weight)
         
         return current
     
@@ -188,9 +363,95 @@ class MCTSSearchEngine:
                 self.visited_pipeline_hashes.add(pipeline_hash)
                 unique_children.append(child)
                 node.add_child(child)
+                self.hash_to_node[pipeline_hash] = child
+        
+        if self.leaf_heap:
+            # 新叶子入堆；无法扩展的节点仍是叶子，放回堆中
+            for child in unique_children or (node,):
+                self._push_leaf(child)
+        
+        # 有子节点后 Selection 不会再返回该节点，不在 Pareto 前沿上时可以释放 pipeline
+        # （节点只在评估时加入前沿，而评估总是先于扩展）
+        if (self.discard_pipelines and unique_children
+                and node.get_id() not in self.pareto_frontier.node_to_point):
+            node.release_pipeline()
         
         return unique_children
     
+    def _push_leaf(self, node: Node):
+        """以当前 UCB 分数将叶子放入堆中"""
+        heapq.heappush(
+            self._leaf_heap,
+            (-node.get_ucb_score(self.exploration_weight), next(self._heap_counter), node)
+        )
+    
+    def _pop_leaf(self) -> Optional[Node]:
+        """
+        取出 UCB 分数最高的叶子（惰性刷新）。
+        
+        出堆的节点已有子节点时直接丢弃；否则重新计算分数，若刷新后低于堆顶
+        （过期）的分数，则以新分数放回并继续，直到堆顶分数是最新的。
+        
+        Returns:
+            选中的叶子（堆为空时返回 None）
+        """
+        heap = self._leaf_heap
+        exploration_weight = self.exploration_weight
+        while heap:
+            _, _, node = heapq.heappop(heap)
+            if node.children:
+                continue
+            priority = -node.get_ucb_score(exploration_weight)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, next(self._heap_counter), node))
+                continue
+            return node
+        return None
+    
+    def _rebuild_leaf_heap(self):
+        """用树中当前的所有叶子重建堆（搜索开始或 reroot 后）"""
+        self._leaf_heap = []
+        for node in self.hash_to_node.values():
+            if not node.children:
+                self._push_leaf(node)
+    
+    def reroot(self, pipeline_hash: str) -> bool:
+        """
+        以已有节点为新的根节点，复用其子树（warm start）。
+        
+        新根节点从父节点上摘下，兄弟子树被丢弃；子树中累积的 visits、
+        奖励和评估结果保留。visited_pipeline_hashes 和 Pareto 前沿保持不变，
+        已评估过的 pipeline 不会再次执行。
+        
+        Args:
+            pipeline_hash: 新根节点的 pipeline 哈希
+        
+        Returns:
+            是否找到对应节点（False 时搜索树不变）
+        """
+        node = self.hash_to_node.get(pipeline_hash)
+        if node is None:
+            return False
+        
+        if node.parent is not None:
+            node.parent.children.remove(node)
+            node.parent = None
+        self.root = node
+        
+        # 刷新子树的深度和路径缓存，只保留子树中的节点
+        self.hash_to_node = {}
+        node.depth = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            current._path = None
+            self.hash_to_node[current.get_id()] = current
+            for child in current.children:
+                child.depth = current.depth + 1
+                stack.append(child)
+        
+        return True
+    
     def _simulate(self, node: Node) -> Optional[ExecutionMetrics]:
         """
         Simulation 阶段: 执行 pipeline 并评估。
@@ -204,11 +465,18 @@ class MCTSSearchEngine:
         if node.is_evaluated:
             return node.metrics
         
+        pipeline_hash = node.pipeline.get_hash()
+        metrics = self._cached_metrics(pipeline_hash)
+        if metrics is not None:
+            node.update_metrics(metrics)
+            return metrics
+        
         try:
             # 执行 pipeline
             metrics = self.executor_func(node.pipeline)
             node.update_metrics(metrics)
             self.total_evaluations += 1
+            self._remember_metrics(pipeline_hash, metrics)
             
             return metrics
         
@@ -217,6 +485,20 @@ class MCTSSearchEngine:
             node.mark_evaluation_failed()
             return None
     
+    def _cached_metrics(self, pipeline_hash: str) -> Optional[ExecutionMetrics]:
+        """查询指标缓存（命中时刷新 LRU 顺序，不计入 total_evaluations）"""
+        metrics = self._metrics_cache.get(pipeline_hash)
+        if metrics is not None:
+            self._metrics_cache.move_to_end(pipeline_hash)
+        return metrics
+    
+    def _remember_metrics(self, pipeline_hash: str, metrics: ExecutionMetrics):
+        """写入指标缓存，超出容量时淘汰最久未使用的条目"""
+        self._metrics_cache[pipeline_hash] = metrics
+        self._metrics_cache.move_to_end(pipeline_hash)
+        while len(self._metrics_cache) > self.metrics_cache_size:
+            self._metrics_cache.popitem(last=False)
+    
     def _calculate_reward(self, metrics: ExecutionMetrics) -> float:
         """
         计算奖励值（用于回溯）。
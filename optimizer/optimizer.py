@@ -4,19 +4,77 @@
 整合 MCTS 搜索、Pareto 前沿管理和执行器。
 """
 
-from typing import Callable, Optional, Any, Dict
+from collections import OrderedDict
+from typing import Callable, Optional, Any, Dict, List, Tuple
 from planner.core.pipeline import Pipeline
-from planner.core.node import ExecutionMetrics
+from planner.core.node import Node, ExecutionMetrics
 from planner.core.executor import (
     PipelineExecutor,
     Evaluator,
     MockExecutor,
-    create_executor_func
+    create_executor_func,
+    create_worker_pool,
+    create_batch_executor_func
 )
 from planner.optimizer.mcts import MCTSSearchEngine
 from planner.optimizer.pareto import ParetoFrontier
 import json
+import multiprocessing
 import os
+import random
+import threading
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def _write_json(path: str, data: Any):
+    """
+    以 2 空格缩进写出 JSON 文件（UTF-8，不转义非 ASCII 字符）。
+    
+    安装了 orjson 时直接写出其生成的字节，否则使用标准库 json。
+    """
+    if HAS_ORJSON:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def _run_tree(
+    args: Tuple[int, int, Dict[str, Any], Optional[Callable[[], PipelineExecutor]]]
+) -> Tuple[List[Tuple[float, int, float, float, Dict[str, Any]]], Dict[str, Any]]:
+    """
+    根并行的工作进程：独立运行一棵 MCTS 树。
+    
+    Args:
+        args: (树编号, 随机种子, 优化器参数, 执行器工厂)
+    
+    Returns:
+        (Pareto 点列表 [(accuracy, tokens, execution_time, cost, pipeline_dict)], 搜索统计)
+    """
+    tree_index, seed, optimizer_kwargs, executor_factory = args
+    random.seed(seed)
+    
+    if executor_factory is not None:
+        optimizer_kwargs = dict(optimizer_kwargs, executor=executor_factory())
+    
+    optimizer = PipelineOptimizer(**optimizer_kwargs)
+    # 执行器的内部随机数（如 MockExecutor 的扰动）同样按树的种子播种
+    optimizer.executor.reseed(seed)
+    frontier = optimizer.optimize()
+    
+    points = [
+        (p.accuracy, p.tokens, p.execution_time, p.cost, p.node.pipeline.to_dict())
+        for p in frontier.points
+    ]
+    stats = dict(optimizer.search_engine.get_statistics(), tree=tree_index, seed=seed)
+    return points, stats
 
 
 class PipelineOptimizer:
@@ -37,7 +95,10 @@ class PipelineOptimizer:
         exploration_weight: float = 1.414,
         max_children_per_node: int = 5,
         save_dir: Optional[str] = None,
-        verbose: bool = True
+        verbose: bool = True,
+        num_workers: int = 1,
+        parallel_backend: str = "process",
+        speculative_iterations: int = 0
     ):
         """
         初始化优化器。
@@ -53,6 +114,12 @@ class PipelineOptimizer:
             max_children_per_node: 每个节点最大子节点数
             save_dir: 结果保存目录
             verbose: 是否打印详细信息
+            num_workers: 并行评估的工作进程数（1=串行）
+            parallel_backend: 并行评估方式，"process"（进程池）或 "thread"
+                （线程池，适合调用 LLM 等以网络等待为主的执行器）
+            speculative_iterations: optimize 返回后在后台从最佳精度的 Pareto 点
+                继续串行搜索的迭代数（0=关闭）。下一次以该点为 pipeline 调用
+                optimize(warm_start=True) 时可复用预热的子树和指标缓存
         """
         self.pipeline = pipeline
         self.executor = executor or MockExecutor()
@@ -64,6 +131,9 @@ class PipelineOptimizer:
         self.max_children_per_node = max_children_per_node
         self.save_dir = save_dir
         self.verbose = verbose
+        self.num_workers = num_workers
+        self.parallel_backend = parallel_backend
+        self.speculative_iterations = speculative_iterations
         
         # 创建执行器函数
         self.executor_func = create_executor_func(
@@ -76,35 +146,208 @@ class PipelineOptimizer:
         # MCTS 搜索引擎
         self.search_engine: Optional[MCTSSearchEngine] = None
         
+        # 执行指标缓存（pipeline 哈希 -> 指标），多次 optimize 之间共享
+        self.metrics_cache: "OrderedDict[str, ExecutionMetrics]" = OrderedDict()
+        
         # Pareto 前沿
         self.pareto_frontier: Optional[ParetoFrontier] = None
+        
+        # 根并行时每棵树的搜索统计
+        self.tree_statistics: List[Dict[str, Any]] = []
+        
+        # 后台预测性搜索
+        self._speculation: Optional[threading.Thread] = None
+        self._speculation_stop = threading.Event()
     
-    def optimize(self) -> ParetoFrontier:
+    def optimize(self, warm_start: bool = False) -> ParetoFrontier:
         """
         运行优化。
         
+        Args:
+            warm_start: 是否复用上一次 optimize 的搜索树。为 True 且当前
+                pipeline 已出现在树中时，以该节点为根继续搜索（丢弃兄弟子树），
+                已评估过的 pipeline 不会重复执行；否则重新建树
+        
         Returns:
             Pareto 前沿
         """
-        # 创建搜索引擎
-        self.search_engine = MCTSSearchEngine(
-            root_pipeline=self.pipeline,
-            executor_func=self.executor_func,
-            max_iterations=self.max_iterations,
-            exploration_weight=self.exploration_weight,
-            max_children_per_node=self.max_children_per_node,
-            verbose=self.verbose
+        self.stop_speculation()
+        
+        reuse = (
+            warm_start
+            and self.search_engine is not None
+            and self.search_engine.reroot(self.pipeline.get_hash())
         )
         
-        # 执行搜索
-        self.pareto_frontier = self.search_engine.search()
+        if self.num_workers > 1:
+            # 叶子并行：每次迭代将多个子节点分发到进程池（线程池）评估
+            with create_worker_pool(
+                executor=self.executor,
+                evaluator=self.evaluator,
+                input_data=self.input_data,
+                ground_truth=self.ground_truth,
+                num_workers=self.num_workers,
+                backend=self.parallel_backend
+            ) as pool:
+                executor_func_batch = create_batch_executor_func(pool)
+                if reuse:
+                    self._refresh_search_engine(executor_func_batch)
+                else:
+                    self.search_engine = self._create_search_engine(
+                        executor_func_batch=executor_func_batch
+                    )
+                self.pareto_frontier = self.search_engine.search()
+        else:
+            if reuse:
+                self._refresh_search_engine()
+            else:
+                self.search_engine = self._create_search_engine()
+            self.pareto_frontier = self.search_engine.search()
         
         # 保存结果
         if self.save_dir:
             self.save_results()
         
+        if self.speculative_iterations > 0:
+            self._start_speculation()
+        
+        return self.pareto_frontier
+    
+    def _start_speculation(self):
+        """在后台线程中从最佳精度的 Pareto 点继续搜索"""
+        best = self.pareto_frontier.get_best_accuracy()
+        if best is None:
+            return
+        
+        # 进程池（线程池）已关闭，预测性搜索串行执行
+        engine = self.search_engine
+        engine.executor_func_batch = None
+        engine.num_workers = 1
+        
+        self._speculation_stop.clear()
+        self._speculation = threading.Thread(
+            target=engine.speculate,
+            args=(best.node, self.speculative_iterations, self._speculation_stop),
+            daemon=True
+        )
+        self._speculation.start()
+    
+    def stop_speculation(self):
+        """停止后台预测性搜索并等待当前迭代结束"""
+        if self._speculation is not None:
+            self._speculation_stop.set()
+            self._speculation.join()
+            self._speculation = None
+    
+    def optimize_root_parallel(
+        self,
+        num_trees: int = 4,
+        seed_base: int = 0,
+        executor_factory: Optional[Callable[[], PipelineExecutor]] = None
+    ) -> ParetoFrontier:
+        """
+        根并行优化：在多个进程中从同一初始 pipeline 独立运行多棵 MCTS 树，
+        最后合并各自的 Pareto 前沿。
+        
+        树之间没有同步，合并开销只与前沿大小有关。
+        
+        Args:
+            num_trees: 树（进程）数量
+            seed_base: 随机种子基数，第 i 棵树使用 seed_base + i
+            executor_factory: 在工作进程中创建执行器的模块级函数（可选）；
+                未提供时将当前执行器 pickle 到工作进程
+                （RealExecutor 会在工作进程中重建 vLLM 客户端）
+        
+        Returns:
+            合并后的 Pareto 前沿
+        """
+        self.stop_speculation()
+        
+        optimizer_kwargs = {
+            "pipeline": self.pipeline,
+            "evaluator": self.evaluator,
+            "input_data": self.input_data,
+            "ground_truth": self.ground_truth,
+            "max_iterations": self.max_iterations,
+            "exploration_weight": self.exploration_weight,
+            "max_children_per_node": self.max_children_per_node,
+            "verbose": False,
+        }
+        if executor_factory is None:
+            optimizer_kwargs["executor"] = self.executor
+        
+        tasks = [
+            (i, seed_base + i, optimizer_kwargs, executor_factory)
+            for i in range(num_trees)
+        ]
+        
+        if self.verbose:
+            print(f"🌲 根并行优化: {num_trees} 棵树")
+        
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(num_trees) as pool:
+            tree_results = pool.map(_run_tree, tasks)
+        
+        # 合并各棵树的 Pareto 前沿
+        self.search_engine = None
+        self.tree_statistics = [stats for _, stats in tree_results]
+        self.pareto_frontier = ParetoFrontier()
+        
+        candidates: Dict[str, Node] = {}
+        for tree_index, (points, _) in enumerate(tree_results):
+            for accuracy, tokens, execution_time, cost, pipeline_dict in points:
+                node = Node(
+                    pipeline=Pipeline.from_dict(pipeline_dict),
+                    action_description=f"tree_{tree_index}"
+                )
+                node.update_metrics(ExecutionMetrics(
+                    accuracy=accuracy,
+                    tokens=tokens,
+                    execution_time=execution_time,
+                    cost=cost
+                ))
+                # 不同树可能找到相同的 pipeline，保留先加入的
+                candidates.setdefault(node.get_id(), node)
+        
+        self.pareto_frontier.add_nodes(candidates.values())
+        
+        if self.verbose:
+            total = sum(len(points) for points, _ in tree_results)
+            print(f"✓ 合并 {total} 个候选点，Pareto 前沿: {self.pareto_frontier.size()} 个解")
+        
+        if self.save_dir:
+            self.save_results()
+        
         return self.pareto_frontier
     
+    def _create_search_engine(self, executor_func_batch=None) -> MCTSSearchEngine:
+        """创建 MCTS 搜索引擎"""
+        return MCTSSearchEngine(
+            root_pipeline=self.pipeline,
+            executor_func=self.executor_func,
+            max_iterations=self.max_iterations,
+            exploration_weight=self.exploration_weight,
+            max_children_per_node=self.max_children_per_node,
+            verbose=self.verbose,
+            executor_func_batch=executor_func_batch,
+            num_workers=self.num_workers,
+            metrics_cache=self.metrics_cache
+        )
+    
+    def _refresh_search_engine(self, executor_func_batch=None):
+        """warm start 时用当前配置更新已有搜索引擎（保留搜索树）"""
+        engine = self.search_engine
+        engine.executor_func = self.executor_func
+        engine.max_iterations = self.max_iterations
+        engine.exploration_weight = self.exploration_weight
+        engine.max_children_per_node = self.max_children_per_node
+        engine.verbose = self.verbose
+        engine.executor_func_batch = executor_func_batch
+        engine.num_workers = self.num_workers if executor_func_batch is not None else 1
+        # 新根节点的 pipeline 可能已被释放（discard_pipelines），恢复为哈希相同的当前 pipeline
+        if engine.root.pipeline is None:
+            engine.root.pipeline = self.pipeline
+    
     def save_results(self):
         """保存优化结果"""
         if not self.save_dir:
@@ -114,13 +357,16 @@ class PipelineOptimizer:
         
         # 保存 Pareto 前沿
         pareto_file = os.path.join(self.save_dir, "pareto_frontier.json")
-        with open(pareto_file, 'w', encoding='utf-8') as f:
-            json.dump(self.pareto_frontier.to_dict(), f, indent=2, ensure_ascii=False)
+        _write_json(pareto_file, self.pareto_frontier.to_dict())
         
-        # 保存搜索统计
+        # 保存搜索统计（根并行时保存每棵树的统计）
+        stats = (
+            self.search_engine.get_statistics()
+            if self.search_engine is not None
+            else {"trees": self.tree_statistics}
+        )
         stats_file = os.path.join(self.save_dir, "search_stats.json")
-        with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(self.search_engine.get_statistics(), f, indent=2)
+        _write_json(stats_file, stats)
         
         # 保存推荐方案
         self.save_recommendations()
@@ -145,8 +391,7 @@ class PipelineOptimizer:
         }
         
         rec_file = os.path.join(self.save_dir, "recommendations.json")
-        with open(rec_file, 'w', encoding='utf-8') as f:
-            json.dump(recommendations, f, indent=2, ensure_ascii=False)
+        _write_json(rec_file, recommendations)
     
     def print_summary(self):
         """打印优化结果摘要"""
@@ -9,11 +9,12 @@
 - 丰富的可视化功能
 """
 
-from .optimizer import OptunaOptimizer
+from .optimizer import OptunaOptimizer, hyperband_pruner
 from .visualizer import plot_pareto_front, plot_optimization_history
 
 __all__ = [
     'OptunaOptimizer',
+    'hyperband_pruner',
     'plot_pareto_front',
     'plot_optimization_history',
 ]
@@ -2,22 +2,260 @@
 基于 Optuna 的 Pipeline 优化器实现
 """
 
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Callable, List, Dict, Any, Tuple, Optional
 import optuna
 from optuna.samplers import TPESampler
-from optuna.pruners import MedianPruner
+from optuna.pruners import BasePruner, HyperbandPruner, MedianPruner, PatientPruner
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
 import json
+import math
+import multiprocessing
 import os
 import time
-from pathlib import Path
 
-import sys
-project_root = str(Path(__file__).parent.parent.parent.parent)
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 from planner.core.pipeline import Pipeline, Operation
 from planner.core.executor import PipelineExecutor, ExecutionMetrics
+from planner.core.kernels import HAS_NUMPY
+
+if HAS_NUMPY:
+    import numpy as np
+
+# 执行失败时回报的最差指标
+_FAILED_VALUES = (0.0, 999999, 999999.0)
+
+
+def _json_default(obj: Any) -> Any:
+    """JSON 序列化的兜底转换（评估函数可能返回 numpy 标量）"""
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"无法序列化为 JSON: {type(obj).__name__}")
+
+
+def _write_json(path: str, data: Any):
+    """
+    以 2 空格缩进写出 JSON 文件（UTF-8，不转义非 ASCII 字符）。
+    
+    安装了 orjson 时直接写出其生成的字节，否则使用标准库 json。
+    """
+    if HAS_ORJSON:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, default=_json_default, option=orjson.OPT_INDENT_2))
+        return
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=_json_default)
+
+
+class TrialLog:
+    """
+    试验记录（列式存储）。
+    
+    数值列使用定长类型数组（array），每条记录只占几十字节，
+    不再为每个试验分配一个 dict 和若干 Python float 对象。
+    pipeline 只记录各操作选择的算子（元组中的算子名与模板共享），
+    导出时再由调用方还原为 pipeline 的字符串表示。
+    """
+    
+    def __init__(self):
+        self.trial_number = array('q')
+        self.selection: List[Tuple[str, ...]] = []
+        self.accuracy = array('d')
+        self.tokens = array('q')
+        self.execution_time = array('d')
+        self.cost = array('d')
+    
+    def append(self, trial_number: int, selection: Tuple[str, ...], metrics: ExecutionMetrics):
+        """
+        追加一条试验记录。
+        
+        Args:
+            trial_number: 试验编号
+            selection: 各操作选择的算子
+            metrics: 试验指标（accuracy 为评估后的精度），按元组一次解包
+        """
+        accuracy, tokens, execution_time, cost = metrics
+        self.trial_number.append(trial_number)
+        self.selection.append(selection)
+        self.accuracy.append(accuracy)
+        self.tokens.append(tokens)
+        self.execution_time.append(execution_time)
+        self.cost.append(cost)
+    
+    def extend(self, other: "TrialLog"):
+        """合并另一个记录（如工作进程返回的记录）"""
+        for name in self.columns():
+            getattr(self, name).extend(getattr(other, name))
+    
+    def sort(self):
+        """按试验编号排序"""
+        order = sorted(range(len(self)), key=self.trial_number.__getitem__)
+        for name in self.columns():
+            column = getattr(self, name)
+            sorted_column = [column[i] for i in order]
+            if isinstance(column, array):
+                sorted_column = array(column.typecode, sorted_column)
+            setattr(self, name, sorted_column)
+    
+    @staticmethod
+    def columns() -> Tuple[str, ...]:
+        """列名"""
+        return ("trial_number", "selection", "accuracy", "tokens", "execution_time", "cost")
+    
+    def to_pydict(self, describe: Callable[[Tuple[str, ...]], str]) -> Dict[str, list]:
+        """
+        转换为 {字段名: 值列表}（与保存的文件字段一致）。
+        
+        Args:
+            describe: 将算子选择转换为 pipeline 字符串表示的函数
+        
+        Returns:
+            字段依次为 trial_number, pipeline, accuracy, tokens, execution_time, cost
+        """
+        data = {}
+        for name in self.columns():
+            if name == "selection":
+                data["pipeline"] = [describe(selection) for selection in self.selection]
+            else:
+                data[name] = list(getattr(self, name))
+        return data
+    
+    def to_numpy(self):
+        """
+        数值列转换为 NumPy 结构化数组（需要 numpy）。
+        
+        Returns:
+            字段为 trial_number, accuracy, tokens, execution_time, cost 的结构化数组
+        """
+        table = np.empty(len(self), dtype=[
+            ("trial_number", np.int64),
+            ("accuracy", np.float64),
+            ("tokens", np.int64),
+            ("execution_time", np.float64),
+            ("cost", np.float64),
+        ])
+        for name in table.dtype.names:
+            column = getattr(self, name)
+            table[name] = np.frombuffer(column, dtype=table.dtype[name]) if len(column) else []
+        return table
+    
+    def to_records(self, describe: Callable[[Tuple[str, ...]], str]) -> List[Dict[str, Any]]:
+        """转换为每个试验一个 dict 的列表（describe 同 to_pydict）"""
+        data = self.to_pydict(describe)
+        return [dict(zip(data, row)) for row in zip(*data.values())]
+    
+    def __len__(self) -> int:
+        return len(self.trial_number)
+
+
+class _RecentTrialsStudy:
+    """
+    study 的只读视图：get_trials 只返回最近 max_history 个已完成的试验
+    （运行中等其他状态的试验保留，constant_liar 依赖它们）。
+    """
+    
+    def __init__(self, study: optuna.Study, max_history: int):
+        self._study = study
+        self._max_history = max_history
+    
+    def _trim(self, trials: List[optuna.trial.FrozenTrial]) -> List[optuna.trial.FrozenTrial]:
+        complete = [i for i, t in enumerate(trials) if t.state == TrialState.COMPLETE]
+        if len(complete) <= self._max_history:
+            return trials
+        dropped = set(complete[:-self._max_history])
+        return [t for i, t in enumerate(trials) if i not in dropped]
+    
+    def get_trials(self, *args, **kwargs):
+        return self._trim(self._study.get_trials(*args, **kwargs))
+    
+    def _get_trials(self, *args, **kwargs):
+        return self._trim(self._study._get_trials(*args, **kwargs))
+    
+    def __getattr__(self, name):
+        return getattr(self._study, name)
+
+
+class RecentTrialsTPESampler(TPESampler):
+    """
+    只参考最近 max_history 个已完成试验的 TPE 采样器。
+    
+    TPE 每次建议都会扫描全部历史试验，试验数上千后建议速度明显下降。
+    截断历史后建议耗时基本恒定，代价是更早的试验信息不再参与建模。
+    """
+    
+    def __init__(self, max_history: int = 500, **kwargs):
+        """
+        Args:
+            max_history: 参与建模的已完成试验数上限
+            **kwargs: 传给 TPESampler 的参数
+        """
+        super().__init__(**kwargs)
+        self.max_history = max_history
+    
+    def sample_relative(self, study, trial, search_space):
+        return super().sample_relative(
+            _RecentTrialsStudy(study, self.max_history), trial, search_space
+        )
+    
+    def sample_independent(self, study, trial, param_name, param_distribution):
+        return super().sample_independent(
+            _RecentTrialsStudy(study, self.max_history), trial, param_name, param_distribution
+        )
+
+
+def hyperband_pruner(pipeline: Pipeline, reduction_factor: int = 3) -> HyperbandPruner:
+    """
+    按操作数划分资源的 Hyperband 剪枝器预设（每个操作算一个 step）。
+    
+    Args:
+        pipeline: 模板 pipeline
+        reduction_factor: 每一轮淘汰的比例
+    
+    Returns:
+        HyperbandPruner 实例
+    """
+    return HyperbandPruner(
+        min_resource=1,
+        max_resource=max(1, len(pipeline.operations)),
+        reduction_factor=reduction_factor
+    )
+
+
+def _optimize_worker(args: Tuple[Dict[str, Any], int, int]) -> "TrialLog":
+    """
+    分布式优化的工作进程：连接共享存储中的 study 并运行一部分试验。
+    
+    Args:
+        args: (优化器参数, 本进程的试验数, 所有进程的总试验数)
+    
+    Returns:
+        本进程的试验记录
+    """
+    optimizer_kwargs, n_trials, total_trials = args
+    optimizer = OptunaOptimizer(**optimizer_kwargs)
+    optimizer.study.optimize(
+        optimizer._objective,
+        n_trials=n_trials,
+        # 各进程的试验数向上取整，由回调保证完成的试验总数不超过 total_trials
+        callbacks=[MaxTrialsCallback(total_trials, states=(TrialState.COMPLETE,))]
+    )
+    return optimizer.trial_results
 
 
 class OptunaOptimizer:
@@ -43,7 +281,14 @@ class OptunaOptimizer:
         n_trials: int = 50,
         n_jobs: int = 1,
         save_dir: str = None,
-        verbose: bool = True
+        verbose: bool = True,
+        storage: Optional[str] = None,
+        study_name: str = "pipeline_optimization",
+        n_workers: int = 1,
+        seed: int = 42,
+        pruner: Optional[BasePruner] = None,
+        trial_cache_size: int = 1024,
+        tpe_history: Optional[int] = 500
     ):
         """
         初始化 Optuna 优化器。
@@ -52,10 +297,25 @@ class OptunaOptimizer:
             pipeline: 初始 pipeline 配置（作为模板）
             executor: Pipeline 执行器
             evaluator: 评估函数，用于计算精度（可选）
-            n_trials: 优化试验次数
-            n_jobs: 并行任务数（1=串行）
+            n_trials: 优化试验次数（使用 storage 时为 study 中完成试验的总数，
+                重新运行会从已完成的试验处继续，只补足剩余部分）
+            n_jobs: 进程内并行任务数（线程，1=串行）
             save_dir: 结果保存目录
             verbose: 是否打印详细信息
+            storage: Optuna RDB 存储地址（如 "sqlite:///study.db"），None 表示内存存储
+                （多进程且设置了 save_dir 时默认使用 sqlite:///{save_dir}/optuna.db）；
+                已存在同名 study 时继续使用
+            study_name: study 名称
+            n_workers: 工作进程数（>1 时需要 storage 或 save_dir，各进程共享同一个 study）
+            seed: 采样器随机种子（第 i 个工作进程使用 seed + i）
+            pruner: 剪枝器，None 表示 PatientPruner 包装的 MedianPruner
+                （连续 2 步没有改善才剪枝，LLM 评估的中间精度噪声较大）；
+                可用 hyperband_pruner(pipeline) 预设。Optuna 只在单目标 study 中
+                支持 trial.report，当前的三目标 study 不会触发剪枝
+            trial_cache_size: 配置去重缓存的最大条目数（相同算子选择的试验直接复用
+                已执行的结果，0 表示不缓存）
+            tpe_history: TPE 建模使用的最近已完成试验数上限（None 表示使用全部历史；
+                截断后建议速度不随试验数增长，但不再参考更早的试验）
         """
         self.template_pipeline = pipeline
         self.executor = executor
@@ -64,49 +324,110 @@ class OptunaOptimizer:
         self.n_jobs = n_jobs
         self.save_dir = save_dir
         self.verbose = verbose
+        self.storage = storage
+        self.study_name = study_name
+        self.n_workers = n_workers
+        self.seed = seed
+        self.pruner = pruner
+        self.trial_cache_size = trial_cache_size
+        self.tpe_history = tpe_history
+        
+        if n_workers > 1 and storage is None:
+            if save_dir is None:
+                raise ValueError("多进程优化需要共享的 storage（如 sqlite:///study.db）或 save_dir")
+            # 各进程通过 save_dir 下的 SQLite 文件共享 study
+            os.makedirs(save_dir, exist_ok=True)
+            storage = f"sqlite:///{os.path.join(save_dir, 'optuna.db')}"
+            self.storage = storage
         
         # 设置日志级别
         if not verbose:
             optuna.logging.set_verbosity(optuna.logging.WARNING)
         
         # 创建 Optuna study（多目标优化）
-        sampler = TPESampler(seed=42, n_startup_trials=10)  # 使用 TPE 采样器
-        pruner = MedianPruner(n_startup_trials=5, n_warmup_steps=3)  # 使用中位数剪枝器
+        # TPE 采样器：constant_liar 把运行中的试验视为较差的结果，避免并行任务/进程
+        # 拿到相同的算子组合；multivariate + group 联合建模各操作的算子选择
+        sampler_kwargs = dict(
+            seed=seed,
+            n_startup_trials=10,
+            n_ei_candidates=24,
+            constant_liar=True,
+            multivariate=True,
+            group=True
+        )
+        if tpe_history is None:
+            sampler = TPESampler(**sampler_kwargs)
+        else:
+            sampler = RecentTrialsTPESampler(max_history=tpe_history, **sampler_kwargs)
+        if pruner is None:
+            pruner = PatientPruner(MedianPruner(n_startup_trials=5, n_warmup_steps=3), patience=2)
         
         self.study = optuna.create_study(
             directions=["maximize", "minimize", "minimize"],  # [精度↑, tokens↓, 时间↓]
             sampler=sampler,
             pruner=pruner,
-            study_name="pipeline_optimization"
+            study_name=study_name,
+            storage=storage,
+            load_if_exists=storage is not None
         )
         
-        # 记录所有试验的结果
-        self.trial_results: List[Dict] = []
+        # 记录所有试验的结果（列式存储）
+        self.trial_results = TrialLog()
         self.start_time = None
+        
+        # 有多个候选算子的操作：(下标, 参数名, 候选算子)
+        self._variable_ops = [
+            (i, f"op_{i}_{op.name}_operator", op.candidates)
+            for i, op in enumerate(pipeline.operations)
+            if len(op.candidates) > 1
+        ]
+        
+        # study.best_trials 的缓存：(计算时已完成的试验数, Pareto 前沿试验)
+        self._best_trials: Optional[Tuple[int, List[optuna.trial.FrozenTrial]]] = None
+        
+        # 配置去重缓存（LRU）：排序后的 trial.params -> 试验指标（accuracy 为评估后的精度）
+        self._trial_cache: "OrderedDict[Tuple, ExecutionMetrics]" = OrderedDict()
     
     def _suggest_pipeline(self, trial: optuna.Trial) -> Pipeline:
         """
         使用 Optuna 的 suggest API 生成 pipeline 配置。
         
+        参数名 op_{i}_{name}_operator 在各试验之间必须保持不变（同一 study 内不要改动
+        模板 pipeline 的操作顺序和名称），TPE 的 group 模式按参数名划分联合分布。
+        
         Args:
             trial: Optuna trial 对象
         
         Returns:
-            生成的 pipeline 配置
+            生成的 pipeline 配置（与模板共享未切换的操作，不要原地修改）
+        """
+        # 只为有多个候选的操作选择算子，未改变的操作与模板共享
+        selections = {
+            i: trial.suggest_categorical(param_name, candidates)
+            for i, param_name, candidates in self._variable_ops
+        }
+        return self.template_pipeline.with_operators_selected(selections)
+    
+    @staticmethod
+    def _selection(pipeline: Pipeline) -> Tuple[str, ...]:
+        """pipeline 各操作选择的算子"""
+        return tuple(op.selected_operator for op in pipeline.operations)
+    
+    def pipeline_for(self, selection: Tuple[str, ...]) -> Pipeline:
         """
-        new_pipeline = self.template_pipeline.clone()
+        根据试验记录中的算子选择还原 pipeline。
         
-        # 为每个操作选择算子
-        for i, operation in enumerate(new_pipeline.operations):
-            if len(operation.candidates) > 1:
-                # 使用 trial.suggest_categorical 选择算子
-                selected = trial.suggest_categorical(
-                    f"op_{i}_{operation.name}_operator",
-                    operation.candidates
-                )
-                operation.selected_operator = selected
+        Args:
+            selection: 各操作选择的算子（trial_results.selection 中的元素）
         
-        return new_pipeline
+        Returns:
+            与模板共享未切换操作的 pipeline
+        """
+        return self.template_pipeline.with_operators_selected(dict(enumerate(selection)))
+    
+    def _describe_selection(self, selection: Tuple[str, ...]) -> str:
+        """算子选择对应的 pipeline 字符串表示"""
+        return str(self.pipeline_for(selection))
     
     def _objective(self, trial: optuna.Trial) -> Tuple[float, int, float]:
         """
@@ -120,56 +441,117 @@ class OptunaOptimizer:
         """
         # 生成 pipeline 配置
         pipeline = self._suggest_pipeline(trial)
+        self._print_config(trial, pipeline)
         
-        if self.verbose:
-            print(f"\n{'='*70}")
-            print(f"[Trial {trial.number + 1}/{self.n_trials}] 测试配置:")
-            for i, op in enumerate(pipeline.operations):
-                print(f"  {i+1}. {op.name}: {op.selected_operator}")
+        cached = self._cached_trial(trial, pipeline)
+        if cached is not None:
+            return cached
         
         try:
             # 执行 pipeline
             result = self.executor.execute(pipeline)
-            metrics = self.executor.last_metrics
-            
-            if metrics is None:
-                raise ValueError("执行器未返回指标")
-            
-            # 计算精度
-            if self.evaluator:
-                accuracy = self.evaluator(result)
-            else:
-                accuracy = metrics.accuracy
-            
-            # 记录结果
-            trial_record = {
-                "trial_number": trial.number,
-                "pipeline": str(pipeline),
-                "accuracy": accuracy,
-                "tokens": metrics.tokens,
-                "execution_time": metrics.execution_time,
-                "cost": metrics.cost
-            }
-            self.trial_results.append(trial_record)
-            
-            if self.verbose:
-                print(f"  ✓ 精度: {accuracy:.3f}")
-                print(f"  ✓ Tokens: {metrics.tokens}")
-                print(f"  ✓ 时间: {metrics.execution_time:.2f}s")
-                print(f"  ✓ 成本: ${metrics.cost:.4f}")
-            
-            return accuracy, metrics.tokens, metrics.execution_time
+            return self._record_trial(trial, pipeline, result, self.executor.last_metrics)
         
         except Exception as e:
             if self.verbose:
                 print(f"  ✗ 执行失败: {e}")
             # 返回最差的指标
-            return 0.0, 999999, 999999.0
+            return _FAILED_VALUES
+    
+    def _print_config(self, trial: optuna.Trial, pipeline: Pipeline):
+        """打印试验的算子配置"""
+        if self.verbose:
+            print(f"\n{'='*70}")
+            print(f"[Trial {trial.number + 1}/{self.n_trials}] 测试配置:")
+            for i, op in enumerate(pipeline.operations):
+                print(f"  {i+1}. {op.name}: {op.selected_operator}")
+    
+    @staticmethod
+    def _trial_key(trial: optuna.Trial) -> Tuple:
+        """配置去重缓存的键（与参数的建议顺序无关）"""
+        return tuple(sorted(trial.params.items()))
+    
+    def _cached_trial(
+        self,
+        trial: optuna.Trial,
+        pipeline: Pipeline
+    ) -> Optional[Tuple[float, int, float]]:
+        """
+        查询配置去重缓存，命中时记录该试验（标记 user_attr cached=True）。
+        
+        Args:
+            trial: Optuna trial 对象
+            pipeline: 试验的 pipeline
+        
+        Returns:
+            缓存的 (accuracy, tokens, execution_time)，未命中返回 None
+        """
+        key = self._trial_key(trial)
+        entry = self._trial_cache.get(key)
+        if entry is None:
+            return None
+        self._trial_cache.move_to_end(key)
+        
+        trial.set_user_attr("cached", True)
+        accuracy, tokens, execution_time, _ = entry
+        self.trial_results.append(trial.number, self._selection(pipeline), entry)
+        
+        if self.verbose:
+            print(f"  ✓ 相同配置已执行过，复用结果（精度 {accuracy:.3f}）")
+        
+        return accuracy, tokens, execution_time
     
-    def optimize(self) -> List[optuna.trial.FrozenTrial]:
+    def _record_trial(
+        self,
+        trial: optuna.Trial,
+        pipeline: Pipeline,
+        result: Any,
+        metrics: Optional[ExecutionMetrics]
+    ) -> Tuple[float, int, float]:
+        """
+        计算精度并记录一次试验的结果。
+        
+        Args:
+            trial: Optuna trial 对象
+            pipeline: 执行的 pipeline
+            result: 执行输出
+            metrics: 执行指标
+        
+        Returns:
+            (accuracy, tokens, execution_time) 元组
+        """
+        if metrics is None:
+            raise ValueError("执行器未返回指标")
+        
+        # 计算精度
+        if self.evaluator:
+            metrics = metrics._replace(accuracy=self.evaluator(result))
+        accuracy, tokens, execution_time, cost = metrics
+        
+        # 记录结果
+        self.trial_results.append(trial.number, self._selection(pipeline), metrics)
+        
+        if self.verbose:
+            print(f"  ✓ 精度: {accuracy:.3f}")
+            print(f"  ✓ Tokens: {tokens}")
+            print(f"  ✓ 时间: {execution_time:.2f}s")
+            print(f"  ✓ 成本: ${cost:.4f}")
+        
+        if self.trial_cache_size > 0:
+            self._trial_cache[self._trial_key(trial)] = metrics
+            while len(self._trial_cache) > self.trial_cache_size:
+                self._trial_cache.popitem(last=False)
+        
+        return accuracy, tokens, execution_time
+    
+    def optimize(self, batch_size: int = 1) -> List[optuna.trial.FrozenTrial]:
         """
         执行优化过程。
         
+        Args:
+            batch_size: 每批试验数（>1 时用 ask-and-tell 一次生成一批配置，
+                交给 executor.execute_many 批量执行；仅单进程模式）
+        
         Returns:
             Pareto 前沿上的试验列表
         """
@@ -182,18 +564,32 @@ class OptunaOptimizer:
             print(f"优化目标: 精度↑, Tokens↓, 时间↓")
             print(f"试验次数: {self.n_trials}")
             print(f"并行任务: {self.n_jobs}")
+            print(f"工作进程: {self.n_workers}")
+            if self.storage is not None:
+                completed = len(self.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)))
+                print(f"已完成试验: {completed}（{self.storage}）")
             print("="*70)
         
         # 运行优化
-        self.study.optimize(
-            self._objective,
-            n_trials=self.n_trials,
-            n_jobs=self.n_jobs,
-            show_progress_bar=self.verbose
-        )
+        if self.n_workers > 1:
+            self._optimize_distributed()
+        elif batch_size > 1:
+            self._optimize_batched(batch_size)
+        else:
+            # 持久化的 study 按完成的试验总数停止，中断后重新运行不会重复已完成的试验
+            callbacks = None
+            if self.storage is not None:
+                callbacks = [MaxTrialsCallback(self.n_trials, states=(TrialState.COMPLETE,))]
+            self.study.optimize(
+                self._objective,
+                n_trials=self.n_trials,
+                n_jobs=self.n_jobs,
+                callbacks=callbacks,
+                show_progress_bar=self.verbose
+            )
         
         # 获取 Pareto 前沿
-        pareto_trials = self.study.best_trials
+        pareto_trials = self.refresh_pareto()
         
         elapsed = time.time() - self.start_time
         
@@ -202,7 +598,8 @@ class OptunaOptimizer:
             print("✨ 优化完成!")
             print("="*70)
             print(f"总耗时: {elapsed:.1f}s")
-            print(f"完成试验: {len(self.study.trials)}")
+            completed = self.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,))
+            print(f"完成试验: {len(completed)}")
             print(f"Pareto 前沿大小: {len(pareto_trials)}")
         
         # 保存结果
@@ -211,14 +608,98 @@ class OptunaOptimizer:
         
         return pareto_trials
     
+    def _optimize_batched(self, batch_size: int):
+        """
+        批量优化：每轮 ask 一批试验，批量执行后逐个 tell。
+        
+        同一批内的试验互相看不到结果（constant_liar 使采样器避开运行中的配置），
+        换来执行器可以合并 LLM 请求、复用公共前缀的中间结果。已执行过的配置
+        和批内重复的配置只执行一次。
+        
+        Args:
+            batch_size: 每批试验数
+        """
+        # 与 MaxTrialsCallback 一致：持久化的 study 只补足剩余的试验
+        completed = len(self.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)))
+        remaining = self.n_trials - completed
+        
+        while remaining > 0:
+            trials = [self.study.ask() for _ in range(min(batch_size, remaining))]
+            pipelines = [self._suggest_pipeline(trial) for trial in trials]
+            
+            values: List[Optional[Tuple[float, int, float]]] = [None] * len(trials)
+            to_run: Dict[Tuple, int] = {}  # 配置 -> 批内第一个该配置的试验下标
+            for i, (trial, pipeline) in enumerate(zip(trials, pipelines)):
+                self._print_config(trial, pipeline)
+                values[i] = self._cached_trial(trial, pipeline)
+                if values[i] is None:
+                    to_run.setdefault(self._trial_key(trial), i)
+            
+            run_indices = list(to_run.values())
+            outcomes = self.executor.execute_many([pipelines[i] for i in run_indices])
+            for i, outcome in zip(run_indices, outcomes):
+                try:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    values[i] = self._record_trial(trials[i], pipelines[i], *outcome)
+                except Exception as e:
+                    if self.verbose:
+                        print(f"  ✗ Trial {trials[i].number + 1} 执行失败: {e}")
+                    values[i] = _FAILED_VALUES
+            
+            for i, trial in enumerate(trials):
+                if values[i] is None:
+                    # 与批内先执行的试验配置相同（该试验失败时同样回报最差指标）
+                    values[i] = self._cached_trial(trial, pipelines[i]) or _FAILED_VALUES
+                self.study.tell(trial, values[i])
+            
+            remaining -= len(trials)
+    
+    def _optimize_distributed(self):
+        """
+        多进程优化：每个进程连接同一个 RDB study 并行运行试验。
+        
+        Optuna 的 n_jobs 使用线程，受 GIL 限制；这里改用独立进程，
+        试验之间通过共享存储协调，采样器看到所有进程已完成的试验。
+        """
+        worker_trials = math.ceil(self.n_trials / self.n_workers)
+        tasks = []
+        for i in range(self.n_workers):
+            kwargs = {
+                "pipeline": self.template_pipeline,
+                "executor": self.executor,
+                "evaluator": self.evaluator,
+                "n_trials": self.n_trials,
+                "n_jobs": self.n_jobs,
+                "verbose": False,
+                "storage": self.storage,
+                "study_name": self.study_name,
+                "seed": self.seed + i,
+                "pruner": self.pruner,
+                "trial_cache_size": self.trial_cache_size,
+                "tpe_history": self.tpe_history,
+            }
+            tasks.append((kwargs, worker_trials, self.n_trials))
+        
+        # spawn 启动：不继承父进程的 vLLM 连接和线程
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.n_workers, mp_context=ctx) as pool:
+            for records in pool.map(_optimize_worker, tasks):
+                self.trial_results.extend(records)
+        
+        self.trial_results.sort()
+    
     def _save_results(self, pareto_trials: List[optuna.trial.FrozenTrial]):
         """保存优化结果"""
         os.makedirs(self.save_dir, exist_ok=True)
         
-        # 保存所有试验结果
-        results_file = os.path.join(self.save_dir, "optuna_trials.json")
-        with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.trial_results, f, indent=2, ensure_ascii=False)
+        # 保存所有试验结果：安装了 pyarrow 时写 Feather 列式文件，否则写 JSON
+        if HAS_PYARROW:
+            results_file = os.path.join(self.save_dir, "optuna_trials.feather")
+            feather.write_feather(pa.Table.from_pydict(self.trial_results.to_pydict(self._describe_selection)), results_file)
+        else:
+            results_file = os.path.join(self.save_dir, "optuna_trials.json")
+            _write_json(results_file, self.trial_results.to_records(self._describe_selection))
         
         # 保存 Pareto 前沿
         pareto_data = []
@@ -234,17 +715,42 @@ class OptunaOptimizer:
             })
         
         pareto_file = os.path.join(self.save_dir, "pareto_front.json")
-        with open(pareto_file, 'w', encoding='utf-8') as f:
-            json.dump(pareto_data, f, indent=2, ensure_ascii=False)
+        _write_json(pareto_file, pareto_data)
         
         if self.verbose:
             print(f"\n✓ 结果已保存到: {self.save_dir}")
             print(f"  - 所有试验: {results_file}")
             print(f"  - Pareto 前沿: {pareto_file}")
     
+    def refresh_pareto(self) -> List[optuna.trial.FrozenTrial]:
+        """
+        重新计算 Pareto 前沿并更新缓存。
+        
+        Returns:
+            Pareto 前沿上的试验列表
+        """
+        completed = len(self.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)))
+        self._best_trials = (completed, self.study.best_trials)
+        return self._best_trials[1]
+    
+    def get_pareto_trials(self) -> List[optuna.trial.FrozenTrial]:
+        """
+        获取 Pareto 前沿上的试验（缓存到有新的试验完成）。
+        
+        study.best_trials 每次调用都重新做支配扫描，这里只在已完成的试验数变化时重算。
+        
+        Returns:
+            Pareto 前沿上的试验列表
+        """
+        if self._best_trials is not None:
+            completed = len(self.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)))
+            if completed == self._best_trials[0]:
+                return self._best_trials[1]
+        return self.refresh_pareto()
+    
     def print_summary(self):
         """打印优化结果摘要"""
-        pareto_trials = self.study.best_trials
+        pareto_trials = self.get_pareto_trials()
         
         print("\n" + "="*70)
         print("📊 Pareto 前沿解决方案")
@@ -280,7 +786,7 @@ class OptunaOptimizer:
         Returns:
             最佳试验
         """
-        pareto_trials = self.study.best_trials
+        pareto_trials = self.get_pareto_trials()
         
         if objective_index == 0:
             # 精度最高
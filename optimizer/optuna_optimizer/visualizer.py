@@ -1,39 +1,56 @@
 """
 Optuna 优化结果可视化
+
+读取试验时使用 deepcopy=False，得到的是 study 内部的试验对象，只能读取、不能修改。
 """
 
 import optuna
-from typing import List
+from optuna.trial import TrialState
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import matplotlib.pyplot as plt
+import multiprocessing
 from pathlib import Path
 
 
-def plot_pareto_front(study: optuna.Study, save_path: str = None):
+def _split_objectives(values: List[List[float]]) -> Tuple[tuple, tuple, tuple]:
+    """将 [(精度, tokens, 时间), ...] 拆分为三列"""
+    if not values:
+        return (), (), ()
+    accuracies, tokens, times = zip(*values)
+    return accuracies, tokens, times
+
+
+def plot_pareto_front(
+    study: optuna.Study,
+    save_path: str = None,
+    pareto_trials: Optional[List[optuna.trial.FrozenTrial]] = None
+):
     """
     绘制 Pareto 前沿图。
     
     Args:
         study: Optuna study 对象
         save_path: 保存路径（可选）
+        pareto_trials: 已计算的 Pareto 前沿试验（可选，None 时由 study.best_trials 计算）
     """
     try:
         import plotly.graph_objects as go
         
-        # 获取所有试验
-        trials = study.get_trials()
+        # 获取已完成的试验（只读，不复制）
+        trials = study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,))
         
-        # 分离 Pareto 前沿和其他点
-        pareto_trials = study.best_trials
-        pareto_numbers = {t.number for t in pareto_trials}
+        # Pareto 前沿（best_trials 每次调用都重新做支配扫描，已有结果时直接复用）
+        if pareto_trials is None:
+            pareto_trials = study.best_trials
         
-        # 提取数据
-        accuracies = [t.values[0] for t in trials if t.values is not None]
-        tokens = [t.values[1] for t in trials if t.values is not None]
-        times = [t.values[2] for t in trials if t.values is not None]
-        
-        pareto_acc = [t.values[0] for t in pareto_trials]
-        pareto_tok = [t.values[1] for t in pareto_trials]
-        pareto_time = [t.values[2] for t in pareto_trials]
+        # 提取数据：一次遍历取出目标值，再按列拆分
+        accuracies, tokens, times = _split_objectives(
+            [t.values for t in trials]
+        )
+        pareto_acc, pareto_tok, pareto_time = _split_objectives(
+            [t.values for t in pareto_trials]
+        )
         
         # 创建 3D 散点图
         fig = go.Figure()
@@ -122,13 +139,34 @@ def plot_param_importances(study: optuna.Study, save_path: str = None):
         print("⚠️  需要安装 plotly: pip install plotly")
 
 
-def save_all_visualizations(study: optuna.Study, output_dir: str):
+def _plot_from_snapshot(
+    plot: Callable,
+    directions: List[optuna.study.StudyDirection],
+    trials: List[optuna.trial.FrozenTrial],
+    save_path: str,
+    kwargs: Dict[str, Any]
+):
+    """工作进程：用试验快照重建内存 study 后绘图（不需要传递存储连接）"""
+    study = optuna.create_study(directions=directions)
+    study.add_trials(trials)
+    plot(study, save_path=save_path, **kwargs)
+
+
+def save_all_visualizations(
+    study: optuna.Study,
+    output_dir: str,
+    pareto_trials: Optional[List[optuna.trial.FrozenTrial]] = None
+):
     """
     保存所有可视化图表。
     
+    三张图相互独立，在各自的进程中并行渲染；传给工作进程的是试验快照，
+    而不是带存储连接的 study。
+    
     Args:
         study: Optuna study 对象
         output_dir: 输出目录
+        pareto_trials: 已计算的 Pareto 前沿试验（如 optimize() 的返回值，可选）
     """
     from pathlib import Path
     output_path = Path(output_dir)
@@ -136,25 +174,28 @@ def save_all_visualizations(study: optuna.Study, output_dir: str):
     
     print("\n📊 生成可视化图表...")
     
-    # Pareto 前沿
-    plot_pareto_front(
-        study,
-        save_path=str(output_path / "pareto_front.html")
-    )
+    directions = study.directions
+    trials = study.get_trials(deepcopy=False)
+    jobs = [
+        # Pareto 前沿
+        (plot_pareto_front, "pareto_front.html", {"pareto_trials": pareto_trials}),
+        # 优化历史
+        (plot_optimization_history, "optimization_history.html", {}),
+        # 参数重要性
+        (plot_param_importances, "param_importances.html", {}),
+    ]
     
-    # 优化历史
-    plot_optimization_history(
-        study,
-        save_path=str(output_path / "optimization_history.html")
-    )
-    
-    # 参数重要性
-    try:
-        plot_param_importances(
-            study,
-            save_path=str(output_path / "param_importances.html")
-        )
-    except Exception as e:
-        print(f"⚠️  参数重要性图生成失败: {e}")
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(jobs), mp_context=ctx) as pool:
+        pareto_future, history_future, importances_future = [
+            pool.submit(_plot_from_snapshot, plot, directions, trials, str(output_path / name), kwargs)
+            for plot, name, kwargs in jobs
+        ]
+        pareto_future.result()
+        history_future.result()
+        try:
+            importances_future.result()
+        except Exception as e:
+            print(f"⚠️  参数重要性图生成失败: {e}")
     
     print(f"✓ 所有图表已保存到: {output_dir}")
@@ -5,16 +5,26 @@ Pareto 前沿管理
 借鉴 DocETL 的 ParetoFrontier 设计，支持三目标优化。
 """
 
-from typing import List, Dict, Tuple, Optional
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from planner.core.node import Node, ExecutionMetrics
+from planner.core.kernels import HAS_NUMPY, pareto_mask
 
+if HAS_NUMPY:
+    import numpy as np
 
-@dataclass
+# 前沿点数达到此值时（且安装了 numpy）add_node 使用向量化的支配判断
+_VECTOR_MIN_POINTS = 64
+
+
+@dataclass(slots=True)
 class ParetoPoint:
     """
     Pareto 前沿上的一个点。
     
+    与 Operation、Pipeline 相同使用 __slots__，每个求值节点都会创建一个点。
+    
     Attributes:
         node: 对应的搜索树节点
         accuracy: 精度
@@ -77,12 +87,31 @@ class ParetoFrontier:
     - 最大化精度
     - 最小化 tokens
     - 最小化执行时间
+    
+    除按加入顺序保存的 points 外，还维护一个按精度升序的索引：
+    只有精度不低于新点的点可能支配它，只有精度不高于新点的点可能被它支配，
+    add_node 通过二分查找只检查这两个区间。
+    
+    安装了 numpy 时还维护一个与 points 顺序一致的 (N, 4) float64 指标矩阵
+    （-accuracy, tokens, execution_time, cost；前三列为最小化目标）。矩阵按需构建，
+    之后随 add_node 增量更新；点数较多时支配判断对前三列做一次向量化比较。
     """
     
     def __init__(self):
         """初始化 Pareto 前沿"""
         self.points: List[ParetoPoint] = []
         self.node_to_point: Dict[str, ParetoPoint] = {}
+        
+        # 按精度升序的索引（_accuracies 与 _sorted 一一对应）
+        self._accuracies: List[float] = []
+        self._sorted: List[ParetoPoint] = []
+        
+        # 与 points 顺序一致的指标矩阵（None 表示未构建）
+        self._arr = None
+        
+        # get_balanced 的缓存结果（前沿变化时失效）
+        self._balanced: Optional[ParetoPoint] = None
+        self._balanced_valid = False
     
     def add_node(self, node: Node) -> bool:
         """
@@ -106,72 +135,231 @@ class ParetoFrontier:
             cost=metrics.cost
         )
         
-        # 检查是否被现有点支配
-        dominated_by_existing = False
-        points_to_remove = []
-        
-        for existing_point in self.points:
-            if existing_point.dominates(new_point):
-                dominated_by_existing = True
-                break
-            elif new_point.dominates(existing_point):
-                points_to_remove.append(existing_point)
+        accuracy = metrics.accuracy
         
-        if dominated_by_existing:
-            return False
+        if HAS_NUMPY and len(self.points) >= _VECTOR_MIN_POINTS:
+            objectives = self._matrix()[:, :3]
+            new = np.array([-accuracy, metrics.tokens, metrics.execution_time], dtype=np.float64)
+            
+            # 检查是否被现有点支配
+            if np.any(np.all(objectives <= new, axis=1) & np.any(objectives < new, axis=1)):
+                return False
+            
+            # 被新点支配的点
+            dominated = np.all(new <= objectives, axis=1) & np.any(new < objectives, axis=1)
+            points_to_remove = [self.points[i] for i in np.flatnonzero(dominated)]
+        else:
+            # 检查是否被现有点支配（只需检查精度不低于新点的点）
+            for existing_point in self._sorted[bisect_left(self._accuracies, accuracy):]:
+                if existing_point.dominates(new_point):
+                    return False
+            
+            # 被新点支配的点（只需检查精度不高于新点的点）
+            hi = bisect_right(self._accuracies, accuracy)
+            points_to_remove = [p for p in self._sorted[:hi] if new_point.dominates(p)]
         
         # 移除被新点支配的点
-        for point in points_to_remove:
-            self.points.remove(point)
-            del self.node_to_point[point.node.get_id()]
+        arr = self._arr
+        if points_to_remove:
+            removed = set(map(id, points_to_remove))
+            keep = [id(p) not in removed for p in self.points]
+            self.points = [p for p, k in zip(self.points, keep) if k]
+            if arr is not None:
+                arr = arr[np.array(keep, dtype=np.bool_)]
+            # 被支配的点精度都不高于新点，只需在索引的前缀中删除（原地切片赋值）
+            hi = bisect_right(self._accuracies, accuracy)
+            kept = [p for p in self._sorted[:hi] if id(p) not in removed]
+            self._sorted[:hi] = kept
+            self._accuracies[:hi] = [p.accuracy for p in kept]
+            for point in points_to_remove:
+                self.node_to_point.pop(point.node.get_id(), None)
+        
+        self._balanced_valid = False
         
-        # 添加新点
+        # 添加新点（精度相同的点按加入顺序排在后面）
+        index = bisect_right(self._accuracies, accuracy)
+        self._accuracies.insert(index, accuracy)
+        self._sorted.insert(index, new_point)
         self.points.append(new_point)
         self.node_to_point[node.get_id()] = new_point
+        if arr is not None:
+            row = (-accuracy, metrics.tokens, metrics.execution_time, metrics.cost)
+            self._arr = np.concatenate((arr, np.array([row], dtype=np.float64)))
         
         return True
     
+    def add_nodes(self, nodes: Iterable[Node]) -> int:
+        """
+        批量将节点添加到 Pareto 前沿。
+        
+        结果与逐个调用 add_node 相同，但对现有点和新点一次性计算
+        非支配掩码（见 rebuild_from）。
+        
+        Args:
+            nodes: 搜索树节点
+        
+        Returns:
+            最终留在前沿上的新节点数
+        """
+        candidates = [
+            ParetoPoint(
+                node=node,
+                accuracy=node.metrics.accuracy,
+                tokens=node.metrics.tokens,
+                execution_time=node.metrics.execution_time,
+                cost=node.metrics.cost
+            )
+            for node in nodes
+            if node.is_evaluated and not node.evaluation_failed and node.metrics is not None
+        ]
+        if not candidates:
+            return 0
+        
+        num_existing = len(self.points)
+        mask = self.rebuild_from(self.points + candidates)
+        return sum(mask[num_existing:])
+    
+    def rebuild_from(self, points: List[ParetoPoint]) -> List[bool]:
+        """
+        用给定点集中的非支配点重建前沿。
+        
+        支配判断一次性完成：安装 numba 时为编译内核，只安装 numpy 时为
+        分块广播的向量化比较，否则为纯 Python 双重循环。
+        
+        Args:
+            points: 候选点（保持顺序）
+        
+        Returns:
+            与 points 一一对应的掩码，True 表示留在前沿上
+        """
+        mask = pareto_mask(
+            [p.accuracy for p in points],
+            [p.tokens for p in points],
+            [p.execution_time for p in points]
+        )
+        
+        self.points = [p for p, keep in zip(points, mask) if keep]
+        self.node_to_point = {p.node.get_id(): p for p in self.points}
+        self._rebuild_index()
+        
+        return mask
+    
+    def _rebuild_index(self):
+        """根据 points 重建按精度排序的索引"""
+        self._sorted = sorted(self.points, key=lambda p: p.accuracy)
+        self._accuracies = [p.accuracy for p in self._sorted]
+        self._arr = None
+        self._balanced_valid = False
+    
+    def _matrix(self):
+        """与 points 顺序一致的 (N, 4) 指标矩阵（按需构建）"""
+        if self._arr is None:
+            self._arr = np.array(
+                [(-p.accuracy, p.tokens, p.execution_time, p.cost) for p in self.points],
+                dtype=np.float64
+            ).reshape(-1, 4)
+        return self._arr
+    
+    def _use_matrix(self) -> bool:
+        """点数较多且安装了 numpy 时，访问器在指标矩阵的列上计算"""
+        return HAS_NUMPY and len(self.points) >= _VECTOR_MIN_POINTS
+    
+    def _sorted_by_column(self, column: int) -> List[ParetoPoint]:
+        """按指标矩阵的某一列升序返回点列表（稳定排序，与 sorted 的平局顺序一致）"""
+        order = np.argsort(self._matrix()[:, column], kind="stable")
+        return [self.points[i] for i in order]
+    
+    def _argmin_column(self, column: int) -> ParetoPoint:
+        """指标矩阵某一列最小的点（平局取第一个，与 min 一致）"""
+        return self.points[int(np.argmin(self._matrix()[:, column]))]
+    
     def get_sorted_by_accuracy(self) -> List[ParetoPoint]:
         """按精度排序返回点列表（降序）"""
+        if self._use_matrix():
+            return self._sorted_by_column(0)
         return sorted(self.points, key=lambda p: p.accuracy, reverse=True)
     
     def get_sorted_by_cost(self) -> List[ParetoPoint]:
         """按成本排序返回点列表（升序）"""
+        if self._use_matrix():
+            return self._sorted_by_column(3)
         return sorted(self.points, key=lambda p: p.cost)
     
     def get_sorted_by_tokens(self) -> List[ParetoPoint]:
         """按 tokens 排序返回点列表（升序）"""
+        if self._use_matrix():
+            return self._sorted_by_column(1)
         return sorted(self.points, key=lambda p: p.tokens)
     
     def get_sorted_by_time(self) -> List[ParetoPoint]:
         """按执行时间排序返回点列表（升序）"""
+        if self._use_matrix():
+            return self._sorted_by_column(2)
         return sorted(self.points, key=lambda p: p.execution_time)
     
     def get_best_accuracy(self) -> Optional[ParetoPoint]:
         """获取精度最高的点"""
         if not self.points:
             return None
+        if self._use_matrix():
+            return self._argmin_column(0)  # 第 0 列为 -accuracy
         return max(self.points, key=lambda p: p.accuracy)
     
     def get_lowest_cost(self) -> Optional[ParetoPoint]:
         """获取成本最低的点"""
         if not self.points:
             return None
+        if self._use_matrix():
+            return self._argmin_column(3)
         return min(self.points, key=lambda p: p.cost)
     
     def get_fastest(self) -> Optional[ParetoPoint]:
         """获取执行最快的点"""
         if not self.points:
             return None
+        if self._use_matrix():
+            return self._argmin_column(2)
         return min(self.points, key=lambda p: p.execution_time)
     
     def get_balanced(self) -> Optional[ParetoPoint]:
         """
         获取平衡点（基于归一化的综合得分）。
         
+        结果缓存到前沿下一次变化；点数较多且安装了 numpy 时向量化计算得分。
+        
         Returns:
             综合得分最高的点
         """
+        if not self._balanced_valid:
+            if self._use_matrix():
+                self._balanced = self._compute_balanced_vectorized()
+            else:
+                self._balanced = self._compute_balanced()
+            self._balanced_valid = True
+        return self._balanced
+    
+    def _compute_balanced_vectorized(self) -> ParetoPoint:
+        """get_balanced 的 NumPy 实现（逐元素运算顺序与 _compute_balanced 相同，结果一致）"""
+        arr = self._matrix()
+        
+        def normalize(values, maximize):
+            min_val = values.min()
+            max_val = values.max()
+            if max_val == min_val:
+                return np.ones_like(values)
+            normalized = (values - min_val) / (max_val - min_val)
+            return normalized if maximize else (1 - normalized)
+        
+        scores = (
+            normalize(-arr[:, 0], maximize=True) +
+            normalize(arr[:, 1], maximize=False) +
+            normalize(arr[:, 2], maximize=False)
+        ) / 3.0
+        # argmax 在平局时返回第一个下标，与逐个比较 score > best_score 一致
+        return self.points[int(np.argmax(scores))]
+    
+    def _compute_balanced(self) -> Optional[ParetoPoint]:
+        """计算 get_balanced 的结果（纯 Python 实现）"""
         if not self.points:
             return None
         
@@ -213,6 +401,18 @@ class ParetoFrontier:
         
         return best_point
     
+    def copy(self) -> "ParetoFrontier":
+        """浅拷贝（点对象共享，之后的增删互不影响）"""
+        frontier = ParetoFrontier()
+        frontier.points = list(self.points)
+        frontier.node_to_point = dict(self.node_to_point)
+        frontier._accuracies = list(self._accuracies)
+        frontier._sorted = list(self._sorted)
+        frontier._arr = self._arr  # 只会被整体替换，不会原地修改，可以共享
+        frontier._balanced = self._balanced
+        frontier._balanced_valid = self._balanced_valid
+        return frontier
+    
     def size(self) -> int:
         """返回 Pareto 前沿上的点数"""
         return len(self.points)
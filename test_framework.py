@@ -6,6 +6,9 @@
 
 import sys
 import os
+import itertools
+import threading
+from concurrent.futures import Future
 
 # 添加项目根目录到 Python 路径
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +19,9 @@ from planner.core.pipeline import Pipeline, Operation, create_llm_operation
 from planner.core.node import Node, ExecutionMetrics
 from planner.optimizer.pareto import ParetoFrontier, ParetoPoint
 from planner.optimizer.actions import SwitchOperatorAction, ReorderOperationsAction
+from planner.core.llm_cache import LLMCache
+from planner.core.real_executor import RealExecutor
+from planner.optimizer.optimizer import PipelineOptimizer
 
 
 def test_pipeline_creation():
@@ -160,6 +166,127 @@ def test_optimization_actions():
         print(f"     - 重排{i+1}: {variant}")
 
 
+def test_llm_cache():
+    """测试 LLM 响应缓存"""
+    print("\n测试 5: LLM 响应缓存")
+    
+    cache = LLMCache(max_size=2)
+    record = {"id": "doc_1", "text": "患者服用阿司匹林"}
+    
+    key = cache.make_key("default", "摘要：", 0.0, record)
+    assert cache.get(key) is None
+    cache.set(key, {"completion": "服用阿司匹林", "tokens": 42})
+    assert cache.get(key)["tokens"] == 42
+    
+    # 高温度调用不缓存
+    assert cache.make_key("default", "摘要：", 0.7, record) is None
+    
+    # 生成参数不同的调用不共享缓存
+    assert cache.make_key("default", "摘要：", 0.0, record, max_tokens=100) != key
+    
+    # LRU 淘汰
+    cache.set(cache.make_key("default", "a", 0.0), {"completion": "a", "tokens": 1})
+    cache.set(cache.make_key("default", "b", 0.0), {"completion": "b", "tokens": 1})
+    assert cache.get(key) is None
+    
+    print(f"  ✓ 缓存键: {key[:16]}...")
+    print(f"  ✓ {cache}")
+
+
+def test_thread_backend():
+    """测试线程池并行评估不遗留线程"""
+    print("\n测试 6: 线程池并行评估")
+    
+    pipeline = Pipeline([
+        Operation("read_data", "transform", ["read_json"], selected_operator="read_json"),
+        Operation("count", "map", ["count_tokens"], selected_operator="count_tokens"),
+        Operation("filter_medical", "filter", ["keyword_filter"], selected_operator="keyword_filter"),
+    ])
+    executor = RealExecutor(
+        data_path=os.path.join(project_root, "data", "medical_documents.json"),
+        verbose=False
+    )
+    
+    # 工作线程的执行器副本共享父执行器的 vLLM 客户端，不另起合并线程
+    before = threading.active_count()
+    for _ in range(3):
+        optimizer = PipelineOptimizer(
+            pipeline=pipeline,
+            executor=executor,
+            max_iterations=3,
+            verbose=False,
+            num_workers=2,
+            parallel_backend="thread"
+        )
+        optimizer.optimize()
+    assert threading.active_count() == before, (before, threading.active_count())
+    executor.close()
+    
+    print(f"  ✓ 3 次优化后活动线程数不变: {before}")
+
+
+class CountingClient:
+    """测试用的 vLLM 客户端：每次生成返回递增编号的文本"""
+    
+    model = "counting"
+    
+    def __init__(self):
+        self._counter = itertools.count()
+    
+    def submit_batch(self, prompts, max_tokens=512, temperature=0.3, top_p=0.9,
+                     stop=None, concurrency=1):
+        futures = []
+        for _ in prompts:
+            future = Future()
+            future.set_result({
+                "text": f"sample-{next(self._counter)}",
+                "usage": {"total_tokens": 1},
+                "finish_reason": "stop"
+            })
+            futures.append(future)
+        return futures
+    
+    def close(self):
+        pass
+
+
+def test_prefix_cache_skips_sampled_stages():
+    """测试前缀缓存不重放采样的 LLM 阶段"""
+    print("\n测试 7: 前缀缓存与采样阶段")
+    
+    executor = RealExecutor(
+        data_path=os.path.join(project_root, "data", "medical_documents.json"),
+        batch_window_ms=0,
+        verbose=False
+    )
+    executor.vllm_client = CountingClient()
+    
+    def summarize_pipeline(temperature):
+        return Pipeline([
+            Operation("read_data", "transform", ["read_json"], selected_operator="read_json"),
+            Operation("summarize", "map", ["llm_summarize"], selected_operator="llm_summarize",
+                      params={"temperature": temperature}),
+        ])
+    
+    def run(pipeline):
+        output = executor.execute(pipeline)
+        cached = [record["cached"] for record in executor.trace if record["event"] == "op"]
+        return [doc["summary"] for doc in output], cached
+    
+    # 确定性阶段：第二次执行命中前缀缓存
+    first, _ = run(summarize_pipeline(0.0))
+    second, cached = run(summarize_pipeline(0.0))
+    assert second == first and cached == [True, True]
+    
+    # 采样阶段（温度高于 LLM 缓存上限）：每次重新生成，之前的前缀仍然复用
+    first, _ = run(summarize_pipeline(0.3))
+    second, cached = run(summarize_pipeline(0.3))
+    assert not set(second) & set(first) and cached == [True, False]
+    executor.close()
+    
+    print("  ✓ 温度 0.3 的摘要阶段未被前缀缓存重放")
+
+
 def main():
     """运行所有测试"""
     print("=" * 70)
@@ -179,6 +306,15 @@ def main():
         # 测试 4: 优化动作
         test_optimization_actions()
         
+        # 测试 5: LLM 缓存
+        test_llm_cache()
+        
+        # 测试 6: 线程池并行评估
+        test_thread_backend()
+        
+        # 测试 7: 前缀缓存与采样阶段
+        test_prefix_cache_skips_sampled_stages()
+        
         print("\n" + "=" * 70)
         print("✅ 所有测试通过！框架功能正常。")
         print("=" * 70)
@@ -4,6 +4,8 @@
 运行此脚本检查所有 planner 模块是否可以正确导入。
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import importlib
 import os
 import sys
 
@@ -18,49 +20,62 @@ print("="*70)
 print(f"\n项目根目录: {project_root}")
 print(f"Python 路径: {sys.path[:3]}")
 
-# 测试导入
-print("\n开始测试导入...")
+# 测试导入：(模块组名称, [(模块, 导入的名称)])
+IMPORT_GROUPS = [
+    ("core 模块", [
+        ("planner.core.pipeline", ("Pipeline", "Operation")),
+        ("planner.core.executor", ("PipelineExecutor", "ExecutionMetrics")),
+        ("planner.core.node", ("Node",)),
+    ]),
+    ("optimizer 模块", [
+        ("planner.optimizer.optimizer", ("PipelineOptimizer",)),
+        ("planner.optimizer.actions", ("ActionGenerator",)),
+        ("planner.optimizer.mcts", ("MCTSSearchEngine",)),
+    ]),
+    ("operators 模块", [
+        ("planner.operators.programmatic", ("ReadJsonOperator", "KeywordFilterOperator")),
+        ("planner.operators.llm_operators", ("VLLMClient", "LLMExtractOperator")),
+    ]),
+    ("real_executor", [
+        ("planner.core.real_executor", ("RealExecutor",)),
+    ]),
+    ("optuna_optimizer 模块", [
+        ("planner.optimizer.optuna_optimizer", ("OptunaOptimizer",)),
+    ]),
+]
 
-try:
-    print("1. 导入 core 模块...")
-    from planner.core.pipeline import Pipeline, Operation
-    from planner.core.executor import PipelineExecutor, ExecutionMetrics
-    from planner.core.node import Node
-    print("   ✓ core 模块导入成功")
-except Exception as e:
-    print(f"   ✗ core 模块导入失败: {e}")
 
-try:
-    print("2. 导入 optimizer 模块...")
-    from planner.optimizer.optimizer import PipelineOptimizer
-    from planner.optimizer.actions import ActionGenerator
-    from planner.optimizer.mcts import MCTSSearchEngine
-    print("   ✓ optimizer 模块导入成功")
-except Exception as e:
-    print(f"   ✗ optimizer 模块导入失败: {e}")
+def import_group(modules):
+    """导入一组模块并检查导出的名称（与 from ... import ... 等价）"""
+    for module_name, names in modules:
+        module = importlib.import_module(module_name)
+        for name in names:
+            if not hasattr(module, name):
+                raise ImportError(f"cannot import name '{name}' from '{module_name}'")
 
-try:
-    print("3. 导入 operators 模块...")
-    from planner.operators.programmatic import ReadJsonOperator, KeywordFilterOperator
-    from planner.operators.llm_operators import VLLMClient, LLMExtractOperator
-    print("   ✓ operators 模块导入成功")
-except Exception as e:
-    print(f"   ✗ operators 模块导入失败: {e}")
 
-try:
-    print("4. 导入 real_executor...")
-    from planner.core.real_executor import RealExecutor
-    print("   ✓ real_executor 导入成功")
-except Exception as e:
-    print(f"   ✗ real_executor 导入失败: {e}")
+print("\n开始测试导入...")
 
+# 顶层包的 __init__ 会导入 core 和 optimizer，先串行导入，避免各线程在循环导入中
+# 拿到未初始化完的模块；失败时由下面对应的模块组报告
 try:
-    print("5. 导入 optuna_optimizer 模块...")
-    from planner.optimizer.optuna_optimizer import OptunaOptimizer
-    print("   ✓ optuna_optimizer 模块导入成功")
-except Exception as e:
-    print(f"   ✗ optuna_optimizer 模块导入失败: {e}")
-    print(f"   提示: 确保已安装 optuna (pip install optuna)")
+    importlib.import_module("planner")
+except Exception:
+    pass
+
+# 其余各组并发导入：导入锁保证模块只初始化一次，文件读取和字节码加载可以重叠
+with ThreadPoolExecutor(max_workers=len(IMPORT_GROUPS)) as executor:
+    futures = [executor.submit(import_group, modules) for _, modules in IMPORT_GROUPS]
+
+    for i, ((label, _), future) in enumerate(zip(IMPORT_GROUPS, futures), 1):
+        print(f"{i}. 导入 {label}...")
+        try:
+            future.result()
+            print(f"   ✓ {label} 导入成功")
+        except Exception as e:
+            print(f"   ✗ {label} 导入失败: {e}")
+            if label.startswith("optuna_optimizer"):
+                print(f"   提示: 确保已安装 optuna (pip install optuna)")
 
 print("\n" + "="*70)
 print("✨ 导入测试完成!")
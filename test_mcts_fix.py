@@ -2,10 +2,13 @@
 测试 MCTS 搜索修复
 
 验证节点扩展逻辑是否正确工作。
+
+可直接运行，也可以用 pytest 收集（pytest -n auto 并行执行，需要 pytest-xdist）。
 """
 
 import sys
 import os
+import random
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
@@ -13,15 +16,17 @@ if project_root not in sys.path:
 
 from planner.core.pipeline import Pipeline, Operation
 from planner.core.node import Node, ExecutionMetrics
+from planner.core.kernels import (
+    HAS_NUMPY, _pareto_mask, _pareto_mask_numpy, _ucb_argmax, pareto_mask, ucb_argmax
+)
+from planner.optimizer import pareto
+from planner.optimizer.pareto import ParetoFrontier, ParetoPoint
 from planner.optimizer.actions import ActionGenerator
+from planner.optimizer.mcts import MCTSSearchEngine
 
 
 def test_node_expansion():
     """测试节点扩展逻辑"""
-    print("="*70)
-    print("测试节点扩展逻辑")
-    print("="*70)
-    
     # 创建一个简单的 pipeline
     pipeline = Pipeline([
         Operation(
@@ -38,61 +43,212 @@ def test_node_expansion():
         ),
     ])
     
-    print(f"\n初始 Pipeline: {pipeline}")
-    
     # 创建根节点
     root = Node(pipeline, action_description="root")
+    assert root.is_leaf()
+    assert not root.is_fully_expanded()
     
     # 创建动作生成器
     action_gen = ActionGenerator()
     
-    # 第一次扩展
-    print("\n--- 第1次扩展 ---")
-    children1 = action_gen.generate_children(root, max_children=3)
-    print(f"生成 {len(children1)} 个子节点")
-    for i, child in enumerate(children1):
-        print(f"  子节点 {i+1}: {child.pipeline}")
+    # 连续三轮扩展（一次扫描可用动作）
+    children1, children2, children3 = action_gen.generate_children_batch(root, [3, 3, 3])
+    
+    # 第一轮：生成的子节点都与根节点的配置不同
+    assert 0 < len(children1) <= 3
+    for child in children1:
+        assert child.pipeline.get_hash() != pipeline.get_hash()
     
     # 添加子节点
     for child in children1:
         root.add_child(child)
     
-    print(f"\nRoot 节点状态: visits={root.visits}, children={len(root.children)}")
-    print(f"is_leaf: {root.is_leaf()}")
-    print(f"is_fully_expanded: {root.is_fully_expanded()}")
+    assert len(root.children) == len(children1)
+    assert not root.is_leaf()
+    assert root.is_fully_expanded()
     
-    # 第二次扩展
-    print("\n--- 第2次扩展 ---")
-    root.visits = 1  # 模拟访问
-    print(f"Root 节点状态: visits={root.visits}, children={len(root.children)}")
-    print(f"is_fully_expanded: {root.is_fully_expanded()}")
+    # 第二轮：仍然可以生成子节点
+    assert 0 < len(children2) <= 3
     
-    children2 = action_gen.generate_children(root, max_children=3)
-    print(f"生成 {len(children2)} 个子节点")
-    for i, child in enumerate(children2):
-        print(f"  子节点 {i+1}: {child.pipeline}")
+    # 第三轮：所有动作都已尝试时重新选择，而不是返回空列表
+    assert 0 < len(children3) <= 3
+    
+    # 之后的单轮扩展沿用同一份已尝试记录
+    assert 0 < len(action_gen.generate_children(root, max_children=3)) <= 3
+
+
+def test_repeated_expansion_hits_transposition_table():
+    """测试重复扩展得到等价 pipeline 时复用树中已有的节点"""
+    pipeline = Pipeline([
+        Operation("filter", "filter", ["keyword_filter", "llm_filter"]),
+    ])
+    engine = MCTSSearchEngine(pipeline, executor_func=lambda p: None, verbose=False)
+    root = engine.root
     
-    # 第三次扩展
-    print("\n--- 第3次扩展 ---")
-    root.visits = 2  # 模拟访问
-    children3 = action_gen.generate_children(root, max_children=3)
-    print(f"生成 {len(children3)} 个子节点")
-    for i, child in enumerate(children3):
-        print(f"  子节点 {i+1}: {child.pipeline}")
+    children = engine._expand(root)
+    assert len(children) == 1
+    child = children[0]
+    assert engine.hash_to_node[child.pipeline.get_hash()] is child
     
-    print("\n✓ 测试完成")
-    print("\n说明：")
-    print("  - 第1次扩展：尝试 switch_operator 动作")
-    print("  - 第2次扩展：尝试 reorder_operations 动作")
-    print("  - 第3次扩展：所有动作都已尝试，重新选择")
+    # 再次扩展只能生成同一个 pipeline：哈希命中，不创建重复子树
+    assert engine._expand(root) == []
+    assert root.children == [child]
+    
+    # 等价的 pipeline（独立构造）哈希相同
+    twin = Pipeline([
+        Operation("filter", "filter", ["keyword_filter", "llm_filter"],
+                  selected_operator="llm_filter"),
+    ])
+    assert twin.get_hash() == child.pipeline.get_hash()
+
+
+def test_virtual_loss_spreads_expansion():
+    """测试并行派发时未完成访问（虚拟损失）使 Selection 分散到不同子节点"""
+    pipeline = Pipeline([
+        Operation("filter", "filter", ["a", "b", "c", "d"], selected_operator="a"),
+    ])
+    root = Node(pipeline, action_description="root")
+    children = ActionGenerator().generate_children(root, max_children=3)
+    assert len(children) == 3
+    for child in children:
+        root.add_child(child)
+        child.backpropagate(0.5)
+    
+    # 依次派发：每次选中的子节点计入未完成访问后，下一次选择其他子节点
+    dispatched = []
+    for _ in children:
+        child = root.best_child()
+        assert child not in dispatched
+        child.apply_virtual_loss(0.1)
+        dispatched.append(child)
+    assert root.incomplete_visits == len(children)
+    
+    # 撤销后恢复到派发前的统计
+    for child in dispatched:
+        child.revert_virtual_loss(0.1)
+    assert root.incomplete_visits == 0
+    assert all(c.incomplete_visits == 0 and abs(c.total_reward - 0.5) < 1e-9 for c in children)
+
+
+def test_ucb_argmax():
+    """测试 UCB argmax 内核（编译或向量化实现）与纯 Python 实现选出相同下标"""
+    # 未访问的子节点优先（取第一个）
+    assert ucb_argmax([3, 0, 2, 0], [1.0, 0.0, 1.0, 0.0], 5, 1.414) == 1
+    # 父节点未访问时只比较平均奖励
+    assert ucb_argmax([2, 4, 1], [1.0, 3.0, 0.5], 0, 1.414) == 1
+    # 访问少的子节点探索项更大
+    assert ucb_argmax([10, 1], [6.0, 0.5], 11, 1.414) == 1
+    assert ucb_argmax([], [], 0, 1.414) == -1
+    
+    visits = [(i * 7) % 13 + 1 for i in range(64)]
+    rewards = [((i * 5) % 11) / 10 * v for i, v in enumerate(visits)]
+    for parent_visits in (0, 1, 100, 10000):
+        for c in (0.0, 1.414, 5.0):
+            expected = _ucb_argmax(visits, rewards, parent_visits, c)
+            assert ucb_argmax(visits, rewards, parent_visits, c) == expected
+    
+    # 子节点较多时 best_child 走内核路径，结果与逐个计算 UCB 分数一致
+    root = Node(Pipeline([Operation("op", "map", ["a"])]), action_description="root")
+    for v, r in zip(visits, rewards):
+        child = Node(root.pipeline.clone(), parent=root)
+        child.visits = v
+        child.total_reward = r
+        root.add_child(child)
+    root.visits = sum(visits)
+    expected = max(root.children, key=lambda child: child.get_ucb_score())
+    assert root.best_child().get_ucb_score() == expected.get_ucb_score()
+    
+    # 内核路径上的未访问子节点：无论其他子节点分数如何都优先返回第一个
+    root.children[40].visits = 0
+    root.children[40].total_reward = 0.0
+    root.children[50].visits = 0
+    assert root.best_child() is root.children[40]
+    assert ucb_argmax([c.visits for c in root.children],
+                      [c.total_reward for c in root.children], root.visits, 1.414) == 40
+
+
+def test_pareto_vectorized_paths():
+    """测试 Pareto 前沿的向量化路径与逐点路径结果一致（含平局和重复点）"""
+    rng = random.Random(0)
+    
+    # 精度越高 tokens 越多，前沿上有上百个点；取值落在粗网格上，制造平局
+    metrics = []
+    for _ in range(400):
+        accuracy = rng.randrange(100) / 100
+        metrics.append(ExecutionMetrics(
+            accuracy=accuracy,
+            tokens=int(accuracy * 1000) + rng.randrange(4) * 10,
+            execution_time=rng.randrange(8) / 2,
+            cost=0.0
+        ))
+    metrics += rng.sample(metrics, 40)
+    rng.shuffle(metrics)
+    
+    def make_nodes():
+        # 节点标识取 pipeline 哈希，每个节点使用参数不同的 pipeline
+        nodes = []
+        for i, m in enumerate(metrics):
+            node = Node(pipeline=Pipeline([
+                Operation("op1", "map", ["a"], selected_operator="a", params={"i": i})
+            ]))
+            node.update_metrics(m)
+            nodes.append(node)
+        return nodes
+    
+    def snapshot(frontier, nodes):
+        index = {node.get_id(): i for i, node in enumerate(nodes)}
+        return (
+            [index[p.node.get_id()] for p in frontier.points],
+            [index[p.node.get_id()] for p in frontier.get_sorted_by_accuracy()]
+        )
+    
+    # 逐点路径：关闭 add_node 的向量化判断
+    nodes = make_nodes()
+    scalar = ParetoFrontier()
+    threshold = pareto._VECTOR_MIN_POINTS
+    pareto._VECTOR_MIN_POINTS = len(metrics) + 1
+    try:
+        scalar_added = [scalar.add_node(node) for node in nodes]
+    finally:
+        pareto._VECTOR_MIN_POINTS = threshold
+    expected = snapshot(scalar, nodes)
+    assert len(scalar.points) > 2 * threshold
+    
+    # add_node（前沿达到 64 个点后走向量化判断）
+    nodes = make_nodes()
+    vectorized = ParetoFrontier()
+    assert [vectorized.add_node(node) for node in nodes] == scalar_added
+    assert snapshot(vectorized, nodes) == expected
+    
+    # add_nodes：先逐个加入一部分，其余分两批加入
+    nodes = make_nodes()
+    batched = ParetoFrontier()
+    for node in nodes[:100]:
+        batched.add_node(node)
+    batched.add_nodes(nodes[100:300])
+    batched.add_nodes(nodes[300:])
+    assert snapshot(batched, nodes) == expected
+    
+    # rebuild_from 与各个掩码实现
+    columns = (
+        [m.accuracy for m in metrics],
+        [m.tokens for m in metrics],
+        [m.execution_time for m in metrics]
+    )
+    reference = _pareto_mask(*columns)
+    assert pareto_mask(*columns) == reference
+    if HAS_NUMPY:
+        assert _pareto_mask_numpy(*columns) == reference
+    nodes = make_nodes()
+    rebuilt = ParetoFrontier()
+    rebuilt.rebuild_from([ParetoPoint(n, m.accuracy, m.tokens, m.execution_time, m.cost)
+                          for n, m in zip(nodes, metrics)])
+    assert [i for i, keep in enumerate(reference) if keep] == snapshot(rebuilt, nodes)[0]
+    assert sorted(expected[0]) == snapshot(rebuilt, nodes)[0]
 
 
 def test_applicable_actions():
     """测试可用动作检测"""
-    print("\n" + "="*70)
-    print("测试可用动作检测")
-    print("="*70)
-    
     action_gen = ActionGenerator()
     
     # 测试1: 有多个候选算子的 pipeline
@@ -100,8 +256,7 @@ def test_applicable_actions():
         Operation("op1", "filter", ["a", "b"], selected_operator="a"),
     ])
     actions1 = action_gen.get_applicable_actions(pipeline1)
-    print(f"\nPipeline 1: {pipeline1}")
-    print(f"可用动作: {[a.name for a in actions1]}")
+    assert [a.name for a in actions1] == ["switch_operator"]
     
     # 测试2: 有可重排操作的 pipeline
     pipeline2 = Pipeline([
@@ -109,20 +264,21 @@ def test_applicable_actions():
         Operation("filter1", "filter", ["b"], selected_operator="b"),
     ])
     actions2 = action_gen.get_applicable_actions(pipeline2)
-    print(f"\nPipeline 2: {pipeline2}")
-    print(f"可用动作: {[a.name for a in actions2]}")
+    assert "reorder_operations" in [a.name for a in actions2]
+    assert "switch_operator" not in [a.name for a in actions2]
     
     # 测试3: 只有一个操作
     pipeline3 = Pipeline([
         Operation("op1", "map", ["a"], selected_operator="a"),
     ])
-    actions3 = action_gen.get_applicable_actions(pipeline3)
-    print(f"\nPipeline 3: {pipeline3}")
-    print(f"可用动作: {[a.name for a in actions3]}")
-    
-    print("\n✓ 测试完成")
+    assert action_gen.get_applicable_actions(pipeline3) == []
 
 
 if __name__ == "__main__":
     test_node_expansion()
+    test_repeated_expansion_hits_transposition_table()
+    test_virtual_loss_spreads_expansion()
+    test_ucb_argmax()
+    test_pareto_vectorized_paths()
     test_applicable_actions()
+    print("✓ 测试通过")